@@ -2,8 +2,9 @@
 
 import datetime
 import re
+from array import array
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Iterable, List, Optional
 
 
 @dataclass
@@ -40,37 +41,104 @@ class Person:
         :return years: Years difference
         """
 
-        today = datetime.date.today()
-        years = today.year - self.date_of_birth.year - ((today.month, today.day) < (
-            self.date_of_birth.month, self.date_of_birth.day))
-
-        return years
+        return calculate_age(self.date_of_birth, datetime.date.today())
 
     def _days_to_birthday(self):
-        today = datetime.date.today()
+        return days_to_birthday(self.date_of_birth, datetime.date.today())
 
-        if self._had_birthday_this_year(today):
-            birthday_year = today.year + 1
-        else:
-            birthday_year = today.year
 
-        birthday_date = datetime.date(birthday_year, self.date_of_birth.month,
-                                      self.date_of_birth.day)
+def calculate_age(date_of_birth: datetime.date, today: datetime.date) -> int:
+    """
+    Calculate full years between date of birth and today
+    :param date_of_birth: Date of birth
+    :param today: Reference date
+    :return: Age in years
+    """
 
-        return (birthday_date - today).days
+    return today.year - date_of_birth.year - ((today.month, today.day) < (
+        date_of_birth.month, date_of_birth.day))
 
-    def _had_birthday_this_year(self, today: datetime.date) -> bool:
-        """
-        Check if anniversary already happened this year
-        :param today: Today's date
-        :return: True if anniversary already happened this year
-        """
 
-        return (
-                (today.month == self.date_of_birth.month and
-                 today.day > self.date_of_birth.day) or
-                (today.month > self.date_of_birth.month)
-        )
+def _birthday_in_year(date_of_birth: datetime.date, year: int) -> datetime.date:
+    """
+    Anniversary of date of birth in given year, Feb 29 falls on Mar 1 in common years
+    :param date_of_birth: Date of birth
+    :param year: Year of anniversary
+    :return: Anniversary date
+    """
+
+    try:
+        return datetime.date(year, date_of_birth.month, date_of_birth.day)
+    except ValueError:
+        return datetime.date(year, 3, 1)
+
+
+def days_to_birthday(date_of_birth: datetime.date, today: datetime.date) -> int:
+    """
+    Calculate days until next birthday, 0 if it is today
+    :param date_of_birth: Date of birth
+    :param today: Reference date
+    :return: Number of days
+    """
+
+    birthday = _birthday_in_year(date_of_birth, today.year)
+    if birthday < today:
+        birthday = _birthday_in_year(date_of_birth, today.year + 1)
+
+    return (birthday - today).days
+
+
+_UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _to_ordinals(dates_of_birth) -> List[int]:
+    """
+    Convert dates, NumPy datetime64 array or proleptic Gregorian ordinals to ordinals
+    :param dates_of_birth: Dates to be converted
+    :return: List of ordinals
+    """
+
+    dtype = getattr(dates_of_birth, 'dtype', None)
+    if dtype is not None and dtype.kind == 'M':
+        days = dates_of_birth.astype('datetime64[D]').astype('int64')
+        return (days + _UNIX_EPOCH_ORDINAL).tolist()
+
+    return [date.toordinal() if hasattr(date, 'toordinal') else int(date)
+            for date in dates_of_birth]
+
+
+def _per_distinct_date(dates_of_birth, today: datetime.date, calculate) -> array:
+    """ Calculate once per distinct date, cohorts share few thousands of dates """
+
+    ordinals = _to_ordinals(dates_of_birth)
+    results = {ordinal: calculate(datetime.date.fromordinal(ordinal), today)
+               for ordinal in set(ordinals)}
+
+    return array('h', map(results.__getitem__, ordinals))
+
+
+def ages(dates_of_birth, today: datetime.date = None) -> array:
+    """
+    Calculate age of whole cohort
+    :param dates_of_birth: Dates, NumPy datetime64 array or date ordinals
+    :param today: Reference date, today by default
+    :return: Array of ages, in order of dates
+    """
+
+    return _per_distinct_date(dates_of_birth, today or datetime.date.today(),
+                              calculate_age)
+
+
+def days_to_birthdays(dates_of_birth, today: datetime.date = None) -> array:
+    """
+    Calculate days to next birthday of whole cohort
+    :param dates_of_birth: Dates, NumPy datetime64 array or date ordinals
+    :param today: Reference date, today by default
+    :return: Array of days, in order of dates
+    """
+
+    return _per_distinct_date(dates_of_birth, today or datetime.date.today(),
+                              days_to_birthday)
 
 
 class LoginInfo:
@@ -99,25 +167,40 @@ class LoginInfo:
     def password_strength(self) -> int:
         """ Calculate password strength """
 
-        strength = 0
+        return score_password(self.password)
 
-        for pattern in self.REGEX_RULES:
-            strength += self._give_points_if_password_matches_regex(pattern)
 
-        return strength
+_COMPILED_RULES = tuple((re.compile(pattern['rule']).search, pattern['points'])
+                        for pattern in LoginInfo.REGEX_RULES)
 
-    def _give_points_if_password_matches_regex(self, pattern: Dict[str, Any]) -> int:
-        """
-        Checking if password matches given regex expression
-        :param pattern: Regex pattern to check
-        :return: 0 if no match or points for a given rule if regex rule match password
-        """
 
-        regex_expression = re.compile(pattern['rule'])
-        if regex_expression.search(self.password):
-            return pattern['points']
-        else:
-            return 0
+def score_password(password: str) -> int:
+    """
+    Sum points of every LoginInfo.REGEX_RULES rule matching password
+    :param password: Password to be scored
+    :return: Password strength
+    """
+
+    return sum(points for search, points in _COMPILED_RULES if search(password))
+
+
+def score_passwords(passwords: Iterable[str]) -> array:
+    """
+    Score whole column of passwords, scoring each distinct password of the
+    column once. The passwords are kept only until the column is scored.
+    :param passwords: Passwords to be scored
+    :return: Array of password strengths, in order of passwords
+    """
+
+    scores = {}
+    strengths = array('B')
+    for password in passwords:
+        score = scores.get(password)
+        if score is None:
+            score = scores[password] = score_password(password)
+        strengths.append(score)
+
+    return strengths
 
 
 class ContactInfo:
@@ -150,6 +233,40 @@ class ContactInfo:
         return clear_num
 
 
+# Trunk prefix written after country code, as in +41 (0)44 ...
+_TRUNK_PREFIX = re.compile(r'^[ \t]*\+[ \t]*(\d+)[ \t]*\(0\)', re.MULTILINE)
+_NON_DIGITS = re.compile(r'[^0-9\n]')
+
+
+def normalize_phone(number: Optional[str]) -> Optional[str]:
+    """
+    Canonical digits of phone number, without separators and without the trunk
+    prefix (0) written after country code
+    :param number: Phone number as written
+    :return: Digits, None for missing number
+    """
+
+    if number is None:
+        return None
+
+    return _NON_DIGITS.sub('', _TRUNK_PREFIX.sub(r'\1', number.replace('\n', ' ')))
+
+
+def normalize_phones(numbers: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """
+    Normalize whole column of phone numbers, running each pattern once over the
+    joined column instead of once per number
+    :param numbers: Phone numbers as written
+    :return: Digits of numbers, in order of numbers
+    """
+
+    numbers = list(numbers)
+    if not numbers or any(number is None or '\n' in number for number in numbers):
+        return list(map(normalize_phone, numbers))
+
+    return _NON_DIGITS.sub('', _TRUNK_PREFIX.sub(r'\1', '\n'.join(numbers))).split('\n')
+
+
 @dataclass
 class Location:
     """ Class to store location information """
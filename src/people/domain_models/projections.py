@@ -0,0 +1,179 @@
+""" Read-only slotted projections of domain models
+
+Views keep no per-instance __dict__ and are not mapped, so large cohorts can be
+held in memory for analytics. Equal timezone, coordinates and nat views can be
+shared between locations.
+"""
+
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+from src.people.domain_models.models import User, calculate_age, days_to_birthday, \
+    score_password
+
+
+@dataclass(frozen=True)
+class PersonView:
+    __slots__ = ('gender', 'title', 'first_name', 'second_name', 'date_of_birth')
+
+    gender: str
+    title: str
+    first_name: str
+    second_name: str
+    date_of_birth: datetime.date
+
+    @property
+    def age(self) -> int:
+        return calculate_age(self.date_of_birth, datetime.date.today())
+
+    @property
+    def days_to_birthday(self) -> int:
+        return days_to_birthday(self.date_of_birth, datetime.date.today())
+
+
+@dataclass(frozen=True)
+class LoginInfoView:
+    __slots__ = ('uuid', 'username', 'password', 'salt', 'md5', 'sha1', 'sha256',
+                 'date_registered')
+
+    uuid: str
+    username: str
+    password: str
+    salt: str
+    md5: str
+    sha1: str
+    sha256: str
+    date_registered: datetime.date
+
+    @property
+    def password_strength(self) -> int:
+        return score_password(self.password)
+
+
+@dataclass(frozen=True)
+class ContactInfoView:
+    __slots__ = ('phone', 'cell', 'email')
+
+    phone: str
+    cell: str
+    email: str
+
+
+@dataclass(frozen=True)
+class CoordinatesView:
+    __slots__ = ('latitude', 'longitude')
+
+    latitude: float
+    longitude: float
+
+
+@dataclass(frozen=True)
+class TimezoneView:
+    __slots__ = ('offset', 'description')
+
+    offset: str
+    description: str
+
+
+@dataclass(frozen=True)
+class NatView:
+    __slots__ = ('name',)
+
+    name: str
+
+
+@dataclass(frozen=True)
+class PersonalIdView:
+    __slots__ = ('name', 'value')
+
+    name: str
+    value: str
+
+
+@dataclass(frozen=True)
+class LocationView:
+    __slots__ = ('street', 'city', 'state', 'postcode', 'coordinates', 'timezone', 'nat')
+
+    street: str
+    city: str
+    state: str
+    postcode: str
+    coordinates: Optional[CoordinatesView]
+    timezone: Optional[TimezoneView]
+    nat: Optional[NatView]
+
+
+@dataclass(frozen=True)
+class UserView:
+    __slots__ = ('id', 'person', 'location', 'login_info', 'contact_info', 'personal_id')
+
+    id: Optional[int]
+    person: Optional[PersonView]
+    location: Optional[LocationView]
+    login_info: Optional[LoginInfoView]
+    contact_info: Optional[ContactInfoView]
+    personal_id: Optional[PersonalIdView]
+
+    @classmethod
+    def from_user(cls, user: User, shared: Dict[Hashable, object] = None) -> 'UserView':
+        """
+        Project User graph, mapped or not
+        :param user: User to be projected
+        :param shared: Views shared between calls, for deduplicating dimensions
+        :return: User view
+        """
+
+        shared = {} if shared is None else shared
+        location = user.location
+
+        return cls(
+            getattr(user, 'id', None),
+            project(PersonView, user.person),
+            None if location is None else LocationView(
+                location.street, location.city, location.state, location.postcode,
+                project(CoordinatesView, location.coordinates, shared),
+                project(TimezoneView, location.timezone, shared),
+                project(NatView, location.nat, shared),
+            ),
+            project(LoginInfoView, user.login_info),
+            project(ContactInfoView, user.contact_info),
+            project(PersonalIdView, user.personal_id),
+        )
+
+
+def project(view_type, model, shared: Dict[Hashable, object] = None):
+    """
+    Copy fields of model named by slots of view type into new view
+    :param view_type: Type of view
+    :param model: Model to be projected, None gives None
+    :param shared: Views shared between calls - optional
+    :return: View
+    """
+
+    if model is None:
+        return None
+
+    return make_view(view_type, tuple(getattr(model, name) for name in view_type.__slots__),
+                     shared)
+
+
+def make_view(view_type, values: tuple, shared: Dict[Hashable, object] = None):
+    """
+    Create view from values in order of its slots, reusing equal one when shared
+    views are given
+    :param view_type: Type of view
+    :param values: Field values
+    :param shared: Views shared between calls - optional
+    :return: View
+    """
+
+    if shared is None:
+        return view_type(*values)
+
+    key = (view_type, values)
+    view = shared.get(key)
+    if view is None:
+        view = shared[key] = view_type(*values)
+
+    return view
@@ -0,0 +1,521 @@
+""" Command line interface of people
+
+Usage: python -m src.people.main [--database URL] [--socket PATH] COMMAND ...
+
+Commands:
+  import PATH | --api-pages N    store users from .json/.ndjson file or the API
+  query count-by KEY [KEY ...]   count users by keys of aggregation.GROUP_KEYS
+  query birthdays [--days N]     persons with birthday in the next N days
+  query search TEXT [--fuzzy]    find users by name, username, email or city
+  query phone NUMBER             find users by phone or cell number
+  query near LAT LON [--km KM]   users nearest to the point, or within KM of it
+  stats                          summary of stored users
+  export PATH [--format F]       write users as ndjson or csv
+  serve                          keep a warm process answering on a Unix socket
+  shell                          run commands read from stdin in one process
+
+Every run pays interpreter startup, SQLAlchemy import, mapper configuration
+and engine creation before the command itself. `serve` pays them once: other
+invocations given the same socket (--socket or PEOPLE_SOCKET) forward their
+command as a JSON line and print the reply, without importing SQLAlchemy.
+Commands run in process when no daemon listens, or with --database given.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shlex
+import socket
+import sys
+from typing import List, Optional, Sequence, TextIO
+
+SOCKET_VARIABLE = 'PEOPLE_SOCKET'
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.people.sock')
+
+# Replies larger than this are streamed, up to the end of the connection
+RECEIVE_BUFFER = 1 << 16
+
+
+class CommandError(Exception):
+    """ Invalid command, reported to the user without traceback """
+
+
+class Application:
+    """ State kept warm between commands: mappers, engine and caches """
+
+    def __init__(self, database: Optional[str] = None, cache: bool = False):
+        self.database = database
+        self.cache = cache
+        self._session_factory = None
+        self._dimensions = None
+        self._result_cache = None
+
+    def connection(self):
+        from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+
+        if self._session_factory is None:
+            self._start()
+
+        return SqlAlchemyDbConnection(self._session_factory, self._dimensions,
+                                      result_cache=self._result_cache)
+
+    @property
+    def result_cache(self):
+        return self._result_cache
+
+    def _start(self):
+        from dataclasses import replace
+
+        from src.people.repository.dimension_cache import DimensionCache
+        from src.people.repository.migrations import upgrade_schema
+        from src.people.repository.orm import start_mappers
+        from src.people.repository.result_cache import ResultCache
+        from src.people.service_layer.db_connection import default_profile, \
+            session_factory_for
+
+        profile = default_profile()
+        if self.database:
+            profile = replace(profile, url=self.database)
+
+        start_mappers()
+        session_factory = session_factory_for(profile)
+        upgrade_schema(session_factory.kw['bind'])
+
+        self._dimensions = DimensionCache()
+        if self.cache:
+            self._result_cache = ResultCache()
+        self._session_factory = session_factory
+
+
+def _table(rows: Sequence[Sequence], headers: Sequence[str]) -> str:
+    cells = [[str(header) for header in headers]] + [
+        ['' if value is None else str(value) for value in row] for row in rows]
+    widths = [max(len(row[column]) for row in cells) for column in range(len(headers))]
+
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths))
+                     .rstrip() for row in cells)
+
+
+def cmd_import(args, app: Application, out: TextIO) -> int:
+    from src.people.service_layer.importer import import_users, iter_api_records, \
+        iter_file_records
+
+    records = (iter_api_records(args.api_pages) if args.api_pages
+               else iter_file_records(args.path))
+    report = import_users(records, app.connection(), args.chunk_size, sync=args.sync)
+    print(report, file=out)
+
+    return 0
+
+
+def cmd_count_by(args, app: Application, out: TextIO) -> int:
+    with app.connection() as conn:
+        rows = conn.database.aggregate(args.keys, ['count'],
+                                       order_by=['-count'] + args.keys, limit=args.limit)
+
+    print(_table([tuple(row) for row in rows], args.keys + ['count']), file=out)
+    return 0
+
+
+def cmd_birthdays(args, app: Application, out: TextIO) -> int:
+    from src.people.domain_models.models import Person
+
+    with app.connection() as conn:
+        birthdays = conn.database.ages_and_days_to_birthday(within_days=args.days)
+        persons = {person.id: person for person in conn.database.get_many(
+            Person, [person_id for person_id, _, _ in birthdays])}
+        rows = [(person_id, persons[person_id].first_name, persons[person_id].second_name,
+                 age if days == 0 else age + 1, days) for person_id, age, days in birthdays]
+
+    print(_table(rows, ['id', 'first_name', 'second_name', 'turns', 'in_days']), file=out)
+    return 0
+
+
+def cmd_search(args, app: Application, out: TextIO) -> int:
+    with app.connection() as conn:
+        if args.fuzzy:
+            users = conn.database.fuzzy_search_users(args.text, args.limit, profile='full')
+        else:
+            users = conn.database.search_users(args.text, limit=args.limit, profile='full')
+        print(_users_table(users), file=out)
+
+    return 0
+
+
+def cmd_phone(args, app: Application, out: TextIO) -> int:
+    with app.connection() as conn:
+        print(_users_table(conn.database.find_users_by_phone(args.number, profile='full')),
+              file=out)
+
+    return 0
+
+
+def cmd_near(args, app: Application, out: TextIO) -> int:
+    with app.connection() as conn:
+        if args.km is not None:
+            found = conn.database.users_within_radius(args.latitude, args.longitude, args.km,
+                                                      profile='full')[:args.count]
+        else:
+            found = conn.database.nearest_users(args.latitude, args.longitude, args.count,
+                                                profile='full')
+        rows = [(user.id, user.person.first_name, user.person.second_name,
+                 user.location.city, f'{distance:.1f}') for user, distance in found]
+
+    print(_table(rows, ['id', 'first_name', 'second_name', 'city', 'km']), file=out)
+    return 0
+
+
+def _users_table(users) -> str:
+    rows = [(user.id, user.person.first_name, user.person.second_name,
+             user.login_info.username, user.contact_info.email,
+             user.location.city if user.location else None) for user in users]
+
+    return _table(rows, ['id', 'first_name', 'second_name', 'username', 'email', 'city'])
+
+
+def cmd_stats(args, app: Application, out: TextIO) -> int:
+    with app.connection() as conn:
+        [row] = conn.database.aggregate([], ['count', 'avg_age', 'avg_password_strength',
+                                             'min_date_of_birth', 'max_date_of_birth'])
+        nats = conn.database.aggregate(['nat'], ['count'], order_by=['-count', 'nat'],
+                                       limit=5)
+
+    print(_table([
+        ('users', row['count']),
+        ('average age', f"{row['avg_age']:.1f}" if row['avg_age'] is not None else None),
+        ('average password strength', f"{row['avg_password_strength']:.1f}"
+         if row['avg_password_strength'] is not None else None),
+        ('oldest born', row['min_date_of_birth']),
+        ('youngest born', row['max_date_of_birth']),
+        ('top nats', ', '.join(f'{nat} ({count})' for nat, count in nats)),
+    ], ['stat', 'value']), file=out)
+
+    if app.result_cache is not None:
+        stats = app.result_cache.stats()
+        print(f"\nresult cache: {stats['entries']} entries, {stats['hits']} hits, "
+              f"{stats['misses']} misses ({stats['hit_rate']:.0%})", file=out)
+
+    if args.instrumentation:
+        from src.people.service_layer.instrumentation import current, format_report
+
+        instrumentation = current()
+        if not instrumentation.enabled:
+            raise CommandError('Instrumentation is disabled, see serve --instrumentation')
+        print('\n' + format_report(instrumentation.report()), file=out)
+        if args.dump:
+            instrumentation.dump(args.dump)
+
+    return 0
+
+
+def _flatten(value, prefix: str = '') -> dict:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f'{prefix}{key}.'))
+        return flat
+
+    return {prefix[:-1]: value}
+
+
+def cmd_export(args, app: Application, out: TextIO) -> int:
+    import csv
+    from dataclasses import asdict
+
+    file_format = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    exported = 0
+
+    with app.connection() as conn, open(args.path, 'w', encoding='utf-8',
+                                        newline='') as file:
+        views = conn.database.iter_user_views()
+        if file_format == 'csv':
+            writer = None
+            for view in views:
+                row = _flatten(asdict(view))
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                exported += 1
+        else:
+            for view in views:
+                file.write(json.dumps(asdict(view), default=str) + '\n')
+                exported += 1
+
+    print(f'{exported} users exported to {args.path}', file=out)
+    return 0
+
+
+def cmd_serve(args, app: Application, out: TextIO) -> int:
+    return serve(args.socket_path, app, args.instrumentation)
+
+
+def cmd_shell(args, app: Application, out: TextIO) -> int:
+    for line in sys.stdin:
+        argv = shlex.split(line)
+        if argv:
+            _, output = run(argv, app)
+            out.write(output)
+            out.flush()
+
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='people', description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='database url, PEOPLE_DATABASE_URL by default')
+    parser.add_argument('--socket', dest='socket_path',
+                        default=os.environ.get(SOCKET_VARIABLE, DEFAULT_SOCKET),
+                        help=f'socket of the warm process, {SOCKET_VARIABLE} by default')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importing = commands.add_parser('import', help='store users from file or the API')
+    source = importing.add_mutually_exclusive_group(required=True)
+    source.add_argument('path', nargs='?', help='.json, .ndjson or .jsonl file')
+    source.add_argument('--api-pages', type=int, help='number of API pages to download')
+    importing.add_argument('--chunk-size', type=int, default=1000)
+    importing.add_argument('--sync', action='store_true',
+                           help='update users already stored under the same uuid')
+    importing.set_defaults(handler=cmd_import)
+
+    query = commands.add_parser('query', help='query stored users').add_subparsers(
+        dest='query', required=True)
+    count_by = query.add_parser('count-by', help='count users by keys, e.g. nat gender')
+    count_by.add_argument('keys', nargs='+')
+    count_by.add_argument('--limit', type=int)
+    count_by.set_defaults(handler=cmd_count_by)
+    birthdays = query.add_parser('birthdays', help='persons with upcoming birthday')
+    birthdays.add_argument('--days', type=int, default=7)
+    birthdays.set_defaults(handler=cmd_birthdays)
+    search = query.add_parser('search', help='find users by prefixes of words')
+    search.add_argument('text')
+    search.add_argument('--fuzzy', action='store_true', help='tolerate typos')
+    search.add_argument('--limit', type=int, default=20)
+    search.set_defaults(handler=cmd_search)
+    phone = query.add_parser('phone', help='find users by phone or cell number')
+    phone.add_argument('number')
+    phone.set_defaults(handler=cmd_phone)
+    near = query.add_parser('near', help='users nearest to the point')
+    near.add_argument('latitude', type=float)
+    near.add_argument('longitude', type=float)
+    near.add_argument('--km', type=float, help='all users within this distance')
+    near.add_argument('--count', type=int, default=10)
+    near.set_defaults(handler=cmd_near)
+
+    stats = commands.add_parser('stats', help='summary of stored users')
+    stats.add_argument('--instrumentation', action='store_true',
+                       help='timings collected by the warm process')
+    stats.add_argument('--dump', help='also write timings to this file as JSON')
+    stats.set_defaults(handler=cmd_stats)
+
+    export = commands.add_parser('export', help='write users to file')
+    export.add_argument('path')
+    export.add_argument('--format', choices=('ndjson', 'csv'),
+                        help='format, from the file extension by default')
+    export.set_defaults(handler=cmd_export)
+
+    serving = commands.add_parser('serve', help='answer commands on the socket')
+    serving.add_argument('--instrumentation', action='store_true',
+                         help='collect timings, shown by stats --instrumentation')
+    serving.set_defaults(handler=cmd_serve)
+
+    shell = commands.add_parser('shell', help='run commands read from stdin')
+    shell.set_defaults(handler=cmd_shell)
+
+    return parser
+
+
+def run(argv: List[str], app: Application):
+    """
+    Run single command capturing its output
+    :param argv: Command and its arguments, without global options
+    :param app: Application state to run the command with
+    :return: Exit status and output of the command
+    """
+
+    from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+    from src.people.repository.exceptions import RepositoryException
+    from src.people.service_layer.exceptions import ImportException
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            args = build_parser().parse_args(argv)
+            if args.command in ('serve', 'shell'):
+                raise CommandError(f'{args.command} can not be run from {args.command}')
+            status = args.handler(args, app, output)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 2
+        except (CommandError, RepositoryException, ImportException, OSError) as e:
+            print(f'error: {e}', file=output)
+            status = 1
+        except IntegrityError as e:
+            print(f'error: {e.orig}; to update stored users, import with --sync', file=output)
+            status = 1
+        except SQLAlchemyError as e:
+            print(f'error: {str(e).splitlines()[0]}', file=output)
+            status = 1
+
+    return status, output.getvalue()
+
+
+def make_server(path: str, app: Application):
+    """
+    Create server answering commands on Unix socket, one at a time. Requests
+    and replies are single JSON lines: {"argv": [...], "cwd": "..."} and
+    {"status": 0, "output": "..."}.
+    :param path: Path of the socket, replaced when stale
+    :param app: Application state shared by the commands
+    :return: Server, not serving yet
+    """
+
+    import socketserver
+    import traceback
+
+    if os.path.exists(path):
+        if forward(path, None) is not None:
+            raise CommandError(f'Already serving on {path}')
+        os.unlink(path)
+
+    # Warm up before accepting commands
+    with app.connection() as conn:
+        conn.database.aggregate([], ['count'])
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                # Connection closed without request, e.g. checking the process answers
+                return
+            try:
+                request = json.loads(line)
+                argv, cwd = list(request['argv']), request.get('cwd')
+            except (ValueError, KeyError, TypeError):
+                reply = dict(status=2, output='error: invalid request\n')
+            else:
+                previous = os.getcwd()
+                try:
+                    if cwd:
+                        os.chdir(cwd)
+                    status, output = run(argv, app)
+                except Exception:
+                    # Unexpected errors end the command, not the process
+                    status, output = 1, traceback.format_exc()
+                finally:
+                    os.chdir(previous)
+                reply = dict(status=status, output=output)
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+    # Socket is created by bind() with owner only access, no window for others
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(path, Handler)
+    finally:
+        os.umask(umask)
+
+    return server
+
+
+def serve(path: str, app: Application, instrumentation: bool = False) -> int:
+    """
+    Answer commands on Unix socket until interrupted or terminated
+    :param path: Path of the socket
+    :param app: Application state shared by the commands
+    :param instrumentation: Collect timings of units of work and repository calls
+    :return: Exit status
+    """
+
+    import signal
+
+    if instrumentation:
+        from src.people.service_layer.instrumentation import HistogramCollector, configure
+        configure(HistogramCollector())
+
+    try:
+        server = make_server(path, app)
+    except CommandError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f'serving on {path}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+    return 0
+
+
+def forward(path: str, argv: Optional[List[str]]):
+    """
+    Send command to the warm process
+    :param path: Path of its socket
+    :param argv: Command and its arguments, None only checks the process answers
+    :return: Exit status and output, None when no process listens on the socket
+    """
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+
+    with client:
+        if argv is None:
+            return 0, ''
+        request = dict(argv=argv, cwd=os.getcwd())
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        chunks = []
+        chunk = client.recv(RECEIVE_BUFFER)
+        while chunk:
+            chunks.append(chunk)
+            chunk = client.recv(RECEIVE_BUFFER)
+
+    reply = json.loads(b''.join(chunks))
+    return reply['status'], reply['output']
+
+
+def _split_global_options(argv: List[str]):
+    """ Global options and the command, so the command can be forwarded as is """
+
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument('--database')
+    parser.add_argument('--socket', dest='socket_path',
+                        default=os.environ.get(SOCKET_VARIABLE, DEFAULT_SOCKET))
+    options, command = parser.parse_known_args(argv)
+    return options, command
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    options, command = _split_global_options(argv)
+
+    if command and command[0] not in ('serve', 'shell', '-h', '--help') and \
+            options.database is None:
+        reply = forward(options.socket_path, command)
+        if reply is not None:
+            status, output = reply
+            sys.stdout.write(output)
+            return status
+
+    warm = bool(command) and command[0] in ('serve', 'shell')
+    app = Application(options.database, cache=warm)
+    if warm:
+        args = build_parser().parse_args(argv)
+        return args.handler(args, app, sys.stdout)
+
+    status, output = run(command, app)
+    sys.stdout.write(output)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+""" Group keys and aggregates over the joined user graph
+
+Keys and aggregates are referred to by name and build their expressions for
+the reference date of the query, so ages are computed in SQL. Only tables
+needed by the chosen names are joined to user. Names built from SQLite
+functions are refused on other databases.
+"""
+
+import datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, and_, cast, extract, func, literal, select
+
+from src.people.repository import expressions, orm
+from src.people.repository.exceptions import RepositoryException
+
+
+class Expression(NamedTuple):
+    build: Callable[[Any], Any]
+    tables: Tuple[str, ...]
+    # Dialects the expression can run on, None for any
+    dialects: Optional[Tuple[str, ...]] = None
+
+
+SQLITE_ONLY = ('sqlite',)
+
+
+def _column(table: str, name: str) -> Expression:
+    return Expression(lambda today: getattr(orm, table).c[name], (table,))
+
+
+GROUP_KEYS = {
+    'gender': _column('person', 'gender'),
+    'title': _column('person', 'title'),
+    'year_of_birth': Expression(
+        lambda today: cast(extract('year', orm.person.c.date_of_birth), Integer),
+        ('person',)),
+    'age': Expression(
+        lambda today: expressions.age(orm.person.c.date_of_birth, today), ('person',)),
+    'age_bucket': Expression(
+        lambda today: expressions.age_bucket(orm.person.c.date_of_birth, today),
+        ('person',)),
+    'password_strength': Expression(
+        lambda today: expressions.password_strength(orm.login_info.c.password),
+        ('login_info',), SQLITE_ONLY),
+    'city': _column('location', 'city'),
+    'state': _column('location', 'state'),
+    'nat': _column('nat', 'name'),
+    'timezone': _column('timezone', 'description'),
+}
+
+AGGREGATES = {
+    'count': Expression(lambda today: func.count(orm.user.c.id), ()),
+    'min_date_of_birth': Expression(
+        lambda today: func.min(orm.person.c.date_of_birth), ('person',)),
+    'max_date_of_birth': Expression(
+        lambda today: func.max(orm.person.c.date_of_birth), ('person',)),
+    'avg_age': Expression(
+        lambda today: func.avg(expressions.age(orm.person.c.date_of_birth, today)),
+        ('person',)),
+    'avg_password_strength': Expression(
+        lambda today: func.avg(expressions.password_strength(orm.login_info.c.password)),
+        ('login_info',), SQLITE_ONLY),
+}
+
+# Tables joined to user, in join order, with the table they hang off
+_JOINS = (
+    ('person', 'user', False),
+    ('login_info', 'user', False),
+    ('contact_info', 'user', False),
+    ('location', 'user', True),
+    ('nat', 'location', True),
+    ('timezone', 'location', True),
+    ('coordinates', 'location', True),
+)
+
+
+def _lookup(registry: Dict[str, Expression], name: str, kind: str,
+            dialect: str) -> Expression:
+    try:
+        expression = registry[name]
+    except KeyError:
+        raise RepositoryException(f'Invalid {kind}: {name}')
+
+    if expression.dialects is not None and dialect not in expression.dialects:
+        raise RepositoryException(f'{kind.capitalize()} {name} is not supported on {dialect}')
+
+    return expression
+
+
+def _joined(tables) -> Any:
+    """ User joined with given tables and tables they are reached through """
+
+    needed = set(tables)
+    for table, parent, _ in reversed(_JOINS):
+        if table in needed:
+            needed.add(parent)
+
+    joined = orm.user
+    for table, _, outer in _JOINS:
+        if table in needed:
+            joined = joined.join(getattr(orm, table), isouter=outer)
+
+    return joined
+
+
+def aggregate_query(group_by: Sequence[str], aggregates: Sequence[str] = ('count',),
+                    filters: Dict[str, Any] = None, order_by: Sequence[str] = None,
+                    limit: int = None, today: datetime.date = None,
+                    dialect: str = 'sqlite'):
+    """
+    Build single statement grouping users by keys and computing aggregates
+    :param group_by: Names from GROUP_KEYS
+    :param aggregates: Names from AGGREGATES
+    :param filters: Values of GROUP_KEYS names to keep - optional
+    :param order_by: Names of keys or aggregates, '-' prefix for descending order,
+    group keys by default
+    :param limit: Limit results - optional
+    :param today: Reference date of ages, today by default
+    :param dialect: Name of dialect the statement is run on
+    :return: Select statement with columns labeled by the names
+    """
+
+    today = literal(today or datetime.date.today())
+    filters = filters or {}
+    keys = [(name, _lookup(GROUP_KEYS, name, 'group key', dialect)) for name in group_by]
+    values = [(name, _lookup(AGGREGATES, name, 'aggregate', dialect)) for name in aggregates]
+    conditions = [(_lookup(GROUP_KEYS, name, 'filter', dialect), value)
+                  for name, value in filters.items()]
+
+    columns = {name: expression.build(today).label(name)
+               for name, expression in keys + values}
+    tables = {table for _, expression in keys + values for table in expression.tables}
+    tables.update(table for expression, _ in conditions for table in expression.tables)
+
+    query = select(list(columns.values())).select_from(_joined(tables))
+    if conditions:
+        query = query.where(and_(*(expression.build(today) == value
+                                   for expression, value in conditions)))
+    if keys:
+        query = query.group_by(*(columns[name] for name, _ in keys))
+
+    ordering = []
+    for name in (group_by if order_by is None else order_by):
+        column = columns.get(name.lstrip('-'))
+        if column is None:
+            raise RepositoryException(f'Invalid column to order by: {name}')
+        ordering.append(column.desc() if name.startswith('-') else column)
+    query = query.order_by(*ordering)
+    if limit:
+        query = query.limit(limit)
+
+    return query
@@ -0,0 +1,280 @@
+""" Bulk insertion of whole User graphs with executemany statements """
+
+import hashlib
+import json
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from src.people.domain_models.models import User, normalize_phones
+from src.people.repository import orm
+
+# Natural keys of the small dimension tables, matching their unique constraints
+DIMENSION_KEYS = {
+    'timezone': ('description',),
+    'coordinates': ('latitude', 'longitude'),
+    'nat': ('name',),
+}
+
+# Tables holding one row per user, in the order they are inserted
+ENTITY_TABLES = ('person', 'login_info', 'contact_info', 'personal_id')
+
+# SQLite refuses statements with more bound parameters than this
+MAX_IN_CLAUSE = 500
+
+# Dialects whose keys BulkUserWriter allocates itself, to insert whole batches
+# with one executemany. Others generate keys, advancing their sequences.
+EXPLICIT_ID_DIALECTS = ('sqlite',)
+
+UserRows = Dict[str, Optional[Dict[str, Any]]]
+
+
+@lru_cache(maxsize=None)
+def _data_columns(table) -> Tuple[str, ...]:
+    return tuple(column.name for column in table.columns
+                 if not column.primary_key and not column.foreign_keys
+                 and not column.info.get('derived'))
+
+
+def _model_to_row(model, table) -> Optional[Dict[str, Any]]:
+    if model is None:
+        return None
+
+    return {name: getattr(model, name) for name in _data_columns(table)}
+
+
+def user_to_rows(user: User) -> UserRows:
+    """
+    Flatten User graph into plain column dictionaries, one per table
+    :param user: User to be flattened
+    :return: Table name -> column values, None for missing relations
+    """
+
+    location = user.location
+    rows = {
+        'person': _model_to_row(user.person, orm.person),
+        'login_info': _model_to_row(user.login_info, orm.login_info),
+        'contact_info': _model_to_row(user.contact_info, orm.contact_info),
+        'personal_id': _model_to_row(user.personal_id, orm.personal_id),
+        'location': _model_to_row(location, orm.location),
+        'timezone': None,
+        'coordinates': None,
+        'nat': None,
+    }
+    if location is not None:
+        rows['timezone'] = _model_to_row(location.timezone, orm.timezone)
+        rows['coordinates'] = _model_to_row(location.coordinates, orm.coordinates)
+        rows['nat'] = _model_to_row(location.nat, orm.nat)
+
+    return rows
+
+
+def content_hash(rows: UserRows) -> str:
+    """
+    Hash of flattened user, equal for users with equal values
+    :param rows: User flattened with user_to_rows
+    :return: Hex digest
+    """
+
+    payload = json.dumps(rows, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def with_phone_digits(rows: List[Optional[Dict[str, Any]]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Copy contact_info rows along with canonical digits of their numbers,
+    normalizing each number column of the batch at once
+    :param rows: Contact info rows, None for missing ones
+    :return: Rows with digit columns, in order of rows
+    """
+
+    present = [dict(row) for row in rows if row is not None]
+    for number, digits in orm.PHONE_DIGITS.items():
+        for row, value in zip(present, normalize_phones(row[number] for row in present)):
+            row[digits] = value
+
+    present = iter(present)
+    return [next(present) if row is not None else None for row in rows]
+
+
+def dimension_key(table_name: str, row: Dict[str, Any]) -> Tuple:
+    return tuple(row[name] for name in DIMENSION_KEYS[table_name])
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Split iterable into lists of at most given size
+    :param iterable: Iterable to be split
+    :param size: Maximum size of single batch
+    :return: Generator of batches
+    """
+
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class BulkUserWriter:
+    """ Inserts batches of flattened users with one executemany per table """
+
+    def __init__(self, session, dimensions=None):
+        self.session = session
+        self.dimensions = dimensions
+
+    def write(self, batch: List[UserRows]) -> int:
+        """
+        Insert batch of flattened users, reusing existing dimension rows
+        :param batch: Users flattened with user_to_rows
+        :return: Number of inserted users
+        """
+
+        if not batch:
+            return 0
+
+        dimension_ids = {
+            name: self._resolve_dimension(name, [rows[name] for rows in batch])
+            for name in DIMENSION_KEYS
+        }
+        entity_ids = {
+            name: self._insert_entities(name, [rows[name] for rows in batch])
+            for name in ENTITY_TABLES
+        }
+        location_ids = self._insert_locations(batch, dimension_ids)
+
+        user_rows = [
+            dict(person_id=entity_ids['person'][i],
+                 login_info_id=entity_ids['login_info'][i],
+                 contact_info_id=entity_ids['contact_info'][i],
+                 location_info_id=location_ids[i],
+                 personal_id_id=entity_ids['personal_id'][i],
+                 content_hash=content_hash(batch[i]))
+            for i in range(len(batch))
+        ]
+        self._insert(orm.user, user_rows)
+
+        return len(batch)
+
+    def _next_id(self, table) -> int:
+        max_id = self.session.execute(select([func.max(table.c.id)])).scalar()
+        return (max_id or 0) + 1
+
+    def _insert(self, table, rows: List[Dict[str, Any]]) -> List[int]:
+        """
+        Insert rows, with keys allocated explicitly on SQLite and generated by
+        the database elsewhere
+        :param table: Table to insert into
+        :param rows: Column values of rows to be inserted
+        :return: Ids given to the rows, in order
+        """
+
+        if not rows:
+            return []
+
+        if self.session.get_bind().dialect.name not in EXPLICIT_ID_DIALECTS:
+            return [self.session.execute(table.insert(), row).inserted_primary_key[0]
+                    for row in rows]
+
+        # Assumes a single writer, as SQLite databases of people have one. Two
+        # concurrent writers may allocate the same ids, and the later one then
+        # fails on the primary key instead of overwriting rows.
+        first_id = self._next_id(table)
+        ids = list(range(first_id, first_id + len(rows)))
+        for row_id, row in zip(ids, rows):
+            row['id'] = row_id
+
+        self.session.execute(table.insert(), rows)
+        return ids
+
+    def _insert_entities(self, name: str,
+                         rows: List[Optional[Dict[str, Any]]]) -> List[Optional[int]]:
+        if name == 'contact_info':
+            rows = with_phone_digits(rows)
+        present = [dict(row) for row in rows if row is not None]
+        ids = iter(self._insert(orm.metadata.tables[name], present))
+
+        return [next(ids) if row is not None else None for row in rows]
+
+    def _insert_locations(self, batch: List[UserRows],
+                          dimension_ids: Dict[str, Dict[Tuple, int]]) -> List[Optional[int]]:
+        rows = [self._location_row(user_rows, dimension_ids) for user_rows in batch]
+        ids = iter(self._insert(orm.location, [row for row in rows if row is not None]))
+        return [next(ids) if row is not None else None for row in rows]
+
+    @staticmethod
+    def _location_row(user_rows: UserRows,
+                      dimension_ids: Dict[str, Dict[Tuple, int]]) -> Optional[Dict[str, Any]]:
+        """ Location row of flattened user pointing to ids of its dimension rows """
+
+        if user_rows['location'] is None:
+            return None
+
+        row = dict(user_rows['location'])
+        for name, foreign_key in (('timezone', 'timezone_id'),
+                                  ('coordinates', 'coordinates_id'),
+                                  ('nat', 'nat_id')):
+            dimension = user_rows[name]
+            row[foreign_key] = (None if dimension is None else
+                                dimension_ids[name][dimension_key(name, dimension)])
+
+        return row
+
+    def _resolve_dimension(self, name: str,
+                           rows: List[Optional[Dict[str, Any]]]) -> Dict[Tuple, int]:
+        """
+        Map natural keys of dimension rows to ids, inserting the missing ones
+        :param name: Name of dimension table
+        :param rows: Dimension rows of the batch, duplicates allowed
+        :return: Natural key -> id
+        """
+
+        wanted = {}
+        for row in rows:
+            if row is not None:
+                wanted.setdefault(dimension_key(name, row), row)
+
+        ids = {}
+        if self.dimensions is not None:
+            for key in wanted:
+                row_id = self.dimensions.get_id(name, key)
+                if row_id is not None:
+                    ids[key] = row_id
+
+        ids.update(self._lookup_dimension(name, [key for key in wanted if key not in ids]))
+        missing = [key for key in wanted if key not in ids]
+        new_ids = self._insert(orm.metadata.tables[name],
+                               [dict(wanted[key]) for key in missing])
+        ids.update(zip(missing, new_ids))
+
+        if self.dimensions is not None:
+            for key, row_id in ids.items():
+                self.dimensions.remember_id(name, key, row_id)
+
+        return ids
+
+    def _lookup_dimension(self, name: str, keys: List[Tuple]) -> Dict[Tuple, int]:
+        if not keys:
+            return {}
+
+        table = orm.metadata.tables[name]
+        key_columns = [table.c[column] for column in DIMENSION_KEYS[name]]
+        wanted = set(keys)
+        first_components = {key[0] for key in keys}
+
+        # IN never matches NULL, which natural keys may hold
+        conditions = [key_columns[0].in_(chunk) for chunk in batched(
+            [value for value in first_components if value is not None], MAX_IN_CLAUSE)]
+        if None in first_components:
+            conditions.append(key_columns[0].is_(None))
+
+        ids = {}
+        for condition in conditions:
+            query = select([table.c.id] + key_columns).where(condition)
+            for row_id, *key in self.session.execute(query):
+                if tuple(key) in wanted:
+                    ids[tuple(key)] = row_id
+
+        return ids
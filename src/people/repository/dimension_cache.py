@@ -0,0 +1,161 @@
+""" Identity map for the small timezone, nat and coordinates dimension tables """
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import inspect
+
+from src.people.domain_models.models import Location, Timezone, Coordinates, Nat
+from src.people.repository.bulk import DIMENSION_KEYS
+
+DIMENSION_MODELS = {
+    'timezone': Timezone,
+    'coordinates': Coordinates,
+    'nat': Nat,
+}
+
+
+class LruDict:
+    """ Dictionary dropping least recently used keys above given size """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+
+class DimensionCache:
+    """
+    Keeps canonical persisted Timezone, Nat and Coordinates instances, and ids of
+    their rows, keyed on the unique columns. Timezone and nat tables are small and
+    loaded whole; coordinates are kept in bounded LRU order.
+    """
+
+    def __init__(self, max_coordinates: int = 100000):
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+        self._instances = {name: LruDict(max_coordinates if name == 'coordinates' else None)
+                           for name in DIMENSION_KEYS}
+        self._ids = {name: LruDict(max_coordinates if name == 'coordinates' else None)
+                     for name in DIMENSION_KEYS}
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate,
+                    **{name: len(instances) for name, instances in self._instances.items()})
+
+    def load(self, session):
+        """
+        Fill cache with whole timezone and nat tables, once until invalidated
+        :param session: Session to query with
+        :return:
+        """
+
+        if self._loaded:
+            return
+
+        for name in ('timezone', 'nat'):
+            for instance in session.query(DIMENSION_MODELS[name]):
+                key = self._key(name, instance)
+                self._instances[name][key] = instance
+                self._ids[name][key] = instance.id
+
+        self._loaded = True
+
+    def invalidate(self):
+        """ Forget everything, e.g. after rollback dropped rows the cache knows of """
+
+        for name in DIMENSION_KEYS:
+            self._instances[name].clear()
+            self._ids[name].clear()
+        self._loaded = False
+
+    def canonical(self, session, name: str, instance):
+        """
+        Get persisted instance equal to given one, or make given one canonical
+        :param session: Session of current unit of work
+        :param name: Name of dimension table
+        :param instance: Timezone, Coordinates or Nat to be matched
+        :return: Canonical instance, attached to the session
+        """
+
+        key = self._key(name, instance)
+        cached = self._instances[name].get(key)
+
+        if cached is not None:
+            self.hits += 1
+            if inspect(cached).session is not session:
+                cached = session.merge(cached, load=False)
+                self._instances[name][key] = cached
+            return cached
+
+        self.misses += 1
+        model = DIMENSION_MODELS[name]
+        columns = dict(zip(DIMENSION_KEYS[name], key))
+        canonical = session.query(model).filter_by(**columns).one_or_none() or instance
+        self._instances[name][key] = canonical
+
+        return canonical
+
+    def intern(self, session, location: Location):
+        """
+        Replace dimensions of location with their canonical instances
+        :param session: Session of current unit of work
+        :param location: Location to be stored
+        :return:
+        """
+
+        canonical = {name: self.canonical(session, name, getattr(location, name))
+                     for name in DIMENSION_KEYS if getattr(location, name) is not None}
+
+        replaced = []
+        for name, instance in canonical.items():
+            current = getattr(location, name)
+            if current is not instance:
+                setattr(location, name, instance)
+                replaced.append(current)
+
+        # Assigning persisted instance cascades location, along with the dimensions
+        # not replaced yet, into the session through backrefs
+        for instance in replaced:
+            if inspect(instance).pending:
+                session.expunge(instance)
+
+    def get_id(self, name: str, key: Tuple) -> Optional[int]:
+        row_id = self._ids[name].get(key)
+        if row_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return row_id
+
+    def remember_id(self, name: str, key: Tuple, row_id: int):
+        self._ids[name][key] = row_id
+
+    @staticmethod
+    def _key(name: str, instance) -> Tuple:
+        return tuple(getattr(instance, column) for column in DIMENSION_KEYS[name])
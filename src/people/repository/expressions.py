@@ -0,0 +1,76 @@
+""" SQL counterparts of domain model calculations """
+
+from functools import reduce
+
+from sqlalchemy import case, func, cast, extract, Integer
+
+# LoginInfo.REGEX_RULES as SQLite GLOB patterns, '.{8,}' is checked with length
+PASSWORD_GLOB_RULES = (
+    ('*[a-z]*', 1),
+    ('*[A-Z]*', 2),
+    ('*[0-9]*', 1),
+    ('*[!@#$%^&*(),.?":{}|<>]*', 3),
+)
+PASSWORD_LENGTH_RULE = (8, 5)
+
+
+def password_strength(password):
+    """
+    Expression scoring password column the way LoginInfo.password_strength does.
+    Uses SQLite GLOB and counts newlines towards the length rule.
+    :param password: Password column
+    :return: SQL expression
+    """
+
+    length, length_points = PASSWORD_LENGTH_RULE
+    rules = [case([(password.op('GLOB')(pattern), points)], else_=0)
+             for pattern, points in PASSWORD_GLOB_RULES]
+    rules.append(case([(func.length(password) >= length, length_points)], else_=0))
+
+    return reduce(lambda left, right: left + right, rules)
+
+
+def age(date_of_birth, today):
+    """
+    Expression calculating age the way Person.age does, from date parts any
+    database can extract
+    :param date_of_birth: Date of birth column
+    :param today: Reference date expression
+    :return: SQL expression
+    """
+
+    def month_day(date):
+        return extract('month', date) * 100 + extract('day', date)
+
+    return (extract('year', today) - extract('year', date_of_birth) -
+            case([(month_day(today) < month_day(date_of_birth), 1)], else_=0))
+
+
+def days_to_birthday(date_of_birth, today):
+    """
+    Expression calculating days to next birthday the way Person.days_to_birthday
+    does, for SQLite date strings only. SQLite date() normalizes Feb 29 of
+    common years to Mar 1.
+    :param date_of_birth: Date of birth column
+    :param today: Reference date expression
+    :return: SQL expression
+    """
+
+    anniversary = func.strftime('%Y', today).op('||')(func.substr(date_of_birth, 5))
+    this_year = func.date(anniversary, '+0 days')
+    next_year = func.date(anniversary, '+1 years')
+    birthday = case([(this_year < func.date(today), next_year)], else_=this_year)
+
+    return cast(func.julianday(birthday) - func.julianday(today), Integer)
+
+
+def age_bucket(date_of_birth, today, width: int = 10):
+    """
+    Expression rounding age down to multiple of width, e.g. 37 to 30
+    :param date_of_birth: Date of birth column
+    :param today: Reference date expression
+    :param width: Width of bucket in years
+    :return: SQL expression
+    """
+
+    return cast(age(date_of_birth, today) / width, Integer) * width
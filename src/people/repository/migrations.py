@@ -0,0 +1,91 @@
+""" Bringing databases created by older versions up to the schema in orm.py """
+
+from typing import List
+
+from sqlalchemy import bindparam, inspect, select
+from sqlalchemy.schema import CreateColumn
+
+from src.people.domain_models.models import normalize_phones
+from src.people.repository.orm import PHONE_DIGITS, contact_info, metadata
+from src.people.repository.search import SEARCH_TABLES
+from src.people.repository.spatial import SPATIAL_TABLES
+
+# Rows of contact_info normalized per executemany when filling added digit columns
+FILL_BATCH_SIZE = 10000
+
+
+def upgrade_schema(engine) -> List[str]:
+    """
+    Create tables, columns and indexes declared in orm.py but missing in the
+    database. Added columns are nullable and start empty, except phone digit
+    columns which are filled from the stored numbers.
+    Search and spatial tables of SQLite databases are created, where the
+    SQLite build supports them, filled with existing users and coordinates.
+    Safe to run repeatedly.
+    :param engine: Engine of the database to upgrade
+    :return: Names of created tables, columns as table.column, and indexes
+    """
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = [table.name for table in metadata.sorted_tables
+               if table.name not in existing_tables]
+    metadata.create_all(engine)
+    if engine.dialect.name == 'sqlite':
+        # Virtual tables are created only where the SQLite build supports them
+        tables = set(inspect(engine).get_table_names())
+        created += [table for table in SEARCH_TABLES + SPATIAL_TABLES
+                    if table in tables and table not in existing_tables]
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        table_name = engine.dialect.identifier_preparer.format_table(table)
+        for column in table.columns:
+            if column.name not in existing_columns:
+                definition = CreateColumn(column).compile(dialect=engine.dialect)
+                engine.execute(f'ALTER TABLE {table_name} ADD COLUMN {definition}')
+                created.append(f'{table.name}.{column.name}')
+        if table is contact_info:
+            _fill_phone_digits(engine, [number for number, digits in PHONE_DIGITS.items()
+                                        if digits not in existing_columns])
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+                created.append(index.name)
+
+    return created
+
+
+def _fill_phone_digits(engine, numbers: List[str]):
+    """
+    Store canonical digits of numbers written before their digit columns existed
+    :param engine: Engine of the database to upgrade
+    :param numbers: Number columns whose digit columns were just added
+    """
+
+    if not numbers:
+        return
+
+    statement = contact_info.update() \
+        .where(contact_info.c.id == bindparam('b_id')) \
+        .values({PHONE_DIGITS[number]: bindparam(f'b_{number}') for number in numbers})
+    query = select([contact_info.c.id] + [contact_info.c[number] for number in numbers]) \
+        .where(contact_info.c.id > bindparam('after')) \
+        .order_by(contact_info.c.id).limit(FILL_BATCH_SIZE)
+    with engine.begin() as connection:
+        # Each chunk is read whole before it is updated, keeping no cursor
+        # open over the rows being written
+        chunk = connection.execute(query, after=0).fetchall()
+        while chunk:
+            columns = list(zip(*chunk))
+            updates = [dict(b_id=row_id) for row_id in columns[0]]
+            for number, values in zip(numbers, columns[1:]):
+                for update, digits in zip(updates, normalize_phones(values)):
+                    update[f'b_{number}'] = digits
+            connection.execute(statement, updates)
+            chunk = connection.execute(query, after=columns[0][-1]).fetchall()
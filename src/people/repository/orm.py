@@ -1,14 +1,21 @@
+import threading
+
 from sqlalchemy import (
     Table, MetaData, Column, Integer, String, Date,
-    ForeignKey, Float, UniqueConstraint
+    ForeignKey, Float, UniqueConstraint, Index, event, inspect
 )
-from sqlalchemy.orm import mapper, relationship
+from sqlalchemy.orm import configure_mappers, mapper, relationship
 
 from src.people.domain_models.models import Timezone, Coordinates, Location, \
-    Person, ContactInfo, PersonalId, Nat, User, LoginInfo
+    Person, ContactInfo, PersonalId, Nat, User, LoginInfo, normalize_phone
+from src.people.repository.search import create_search_index, drop_search_index
+from src.people.repository.spatial import create_spatial_index, drop_spatial_index
 
 metadata = MetaData()
 
+# Serializes mapping of models by threads starting at the same time
+_mappers_lock = threading.Lock()
+
 user = Table(
     'user', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
@@ -16,7 +23,14 @@ user = Table(
     Column('login_info_id', Integer, ForeignKey('login_info.id'), nullable=False),
     Column('contact_info_id', Integer, ForeignKey('contact_info.id'), nullable=False),
     Column('location_info_id', Integer, ForeignKey('location.id')),
-    Column('personal_id_id', Integer, ForeignKey('personal_id.id'))
+    Column('personal_id_id', Integer, ForeignKey('personal_id.id')),
+    # Hash of the whole user graph, written by bulk inserts and synchronization
+    Column('content_hash', String(32)),
+    Index('ix_user_person_id', 'person_id'),
+    Index('ix_user_login_info_id', 'login_info_id'),
+    Index('ix_user_contact_info_id', 'contact_info_id'),
+    Index('ix_user_location_info_id', 'location_info_id'),
+    Index('ix_user_personal_id_id', 'personal_id_id'),
 )
 
 person = Table(
@@ -27,6 +41,8 @@ person = Table(
     Column('first_name', String(50)),
     Column('second_name', String(50)),
     Column('date_of_birth', Date),
+    Index('ix_person_date_of_birth', 'date_of_birth'),
+    Index('ix_person_gender_date_of_birth', 'gender', 'date_of_birth'),
 )
 
 login_info = Table(
@@ -48,8 +64,16 @@ contact_info = Table(
     Column('phone', String),
     Column('cell', String),
     Column('email', String),
+    # Canonical digits of numbers, derived on write (see PHONE_DIGITS)
+    Column('phone_digits', String, info={'derived': True}),
+    Column('cell_digits', String, info={'derived': True}),
+    Index('ix_contact_info_phone_digits', 'phone_digits'),
+    Index('ix_contact_info_cell_digits', 'cell_digits'),
 )
 
+# Contact number column -> column of its canonical digits
+PHONE_DIGITS = {'phone': 'phone_digits', 'cell': 'cell_digits'}
+
 timezone = Table(
     'timezone', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
@@ -81,6 +105,9 @@ location = Table(
     Column('timezone_id', Integer, ForeignKey('timezone.id')),
     Column('coordinates_id', Integer, ForeignKey('coordinates.id')),
     Column('nat_id', Integer, ForeignKey('nat.id')),
+    Index('ix_location_nat_id_city', 'nat_id', 'city'),
+    Index('ix_location_timezone_id', 'timezone_id'),
+    Index('ix_location_coordinates_id', 'coordinates_id'),
 )
 
 personal_id = Table(
@@ -91,8 +118,38 @@ personal_id = Table(
 )
 
 
+@event.listens_for(metadata, 'after_create')
+def _create_virtual_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_search_index(connection)
+        create_spatial_index(connection)
+
+
+@event.listens_for(metadata, 'before_drop')
+def _drop_virtual_tables(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        drop_search_index(connection)
+        drop_spatial_index(connection)
+
+
 def start_mappers():
-    user_mapper = mapper(User, user)
+    """
+    Map domain models to tables and configure their relationships, once per process.
+    Further calls are no-ops until clear_mappers, so workers inheriting mapped models
+    and threads starting together can all call it.
+    """
+
+    with _mappers_lock:
+        if inspect(User, raiseerr=False) is not None:
+            return
+        _map_models()
+        # Backrefs like User.person exist only after configuration, done here
+        # instead of lazily on the first query
+        configure_mappers()
+
+
+def _map_models():
+    user_mapper = mapper(User, user, exclude_properties=['content_hash'])
     person_mapper = mapper(Person, person, properties={
         'user': relationship(user_mapper, backref='person', uselist=False)
     })
@@ -111,9 +168,19 @@ def start_mappers():
     login_info_mapper = mapper(LoginInfo, login_info, properties={
         'person': relationship(user_mapper, backref='login_info', uselist=False)
     })
+    # Numbers are mapped behind the phone and cell properties stripping dashes
     contact_info_mapper = mapper(ContactInfo, contact_info, properties={
+        '_phone_num': contact_info.c.phone,
+        '_cell_num': contact_info.c.cell,
         'person': relationship(user_mapper, backref='contact_info', uselist=False)
     })
+    event.listen(contact_info_mapper, 'before_insert', _set_phone_digits)
+    event.listen(contact_info_mapper, 'before_update', _set_phone_digits)
     personal_id_mapper = mapper(PersonalId, personal_id, properties={
         'person': relationship(user_mapper, backref='personal_id', uselist=False)
     })
+
+
+def _set_phone_digits(mapper, connection, target: ContactInfo):
+    for number, digits in PHONE_DIGITS.items():
+        setattr(target, digits, normalize_phone(getattr(target, number)))
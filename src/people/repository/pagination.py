@@ -0,0 +1,107 @@
+""" Keyset pagination: pages continue after the sort key of the last item
+
+Cursors are opaque to callers: URL-safe base64 of the kind of ordering and the
+sort key of the last item of the page. Next page is found with an index seek,
+so deep pages cost as much as the first one, and rows inserted meanwhile do not
+shift pages.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass
+from typing import Generic, List, Optional, Sequence, TypeVar
+
+from src.people.repository.exceptions import RepositoryException
+
+T = TypeVar('T')
+
+MAX_PAGE_SIZE = 1000
+
+
+@dataclass
+class Page(Generic[T]):
+    """ Items of single page and cursor of the next one, None on the last page """
+
+    items: List[T]
+    next_cursor: Optional[str]
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.date):
+        return {'date': value.isoformat()}
+
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.date.fromisoformat(value['date'])
+
+    return value
+
+
+def encode_cursor(kind: str, key: Sequence) -> str:
+    """
+    Create cursor pointing after given sort key
+    :param kind: Name of ordering the cursor belongs to
+    :param key: Sort key of the last item of page
+    :return: Cursor
+    """
+
+    payload = json.dumps([kind, [_encode_value(value) for value in key]],
+                         separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(kind: str, cursor: str, types: Sequence[type]) -> list:
+    """
+    Read sort key from cursor
+    :param kind: Name of ordering the cursor is expected to belong to
+    :param cursor: Cursor from Page.next_cursor
+    :param types: Expected types of sort key values
+    :return: Sort key
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_kind, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        key = [_decode_value(value) for value in key]
+    except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+        raise RepositoryException(f'Invalid cursor: {cursor}')
+
+    if cursor_kind != kind:
+        raise RepositoryException(f'Cursor of {cursor_kind} used for {kind}')
+    if len(key) != len(types) or not all(type(value) is expected
+                                         for value, expected in zip(key, types)):
+        raise RepositoryException(f'Invalid cursor: {cursor}')
+
+    return key
+
+
+def check_page_size(limit: int):
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise RepositoryException(f'Page size must be between 1 and {MAX_PAGE_SIZE}')
+
+
+def make_page(rows: list, limit: int, kind: str, sort_key) -> Page:
+    """
+    Build page from up to limit + 1 fetched rows
+    :param rows: Rows, one more than limit when there is next page
+    :param limit: Page size
+    :param kind: Name of ordering
+    :param sort_key: Function returning sort key of row
+    :return: Page
+    """
+
+    if len(rows) <= limit:
+        return Page(rows, None)
+
+    items = rows[:limit]
+    return Page(items, encode_cursor(kind, sort_key(items[-1])))
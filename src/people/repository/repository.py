@@ -1,9 +1,85 @@
 import abc
-from sqlalchemy import func, text, desc, and_
+import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, desc, and_, or_, select, literal, tuple_, Date
 from sqlalchemy.exc import CompileError, InvalidRequestError
+from sqlalchemy.orm import joinedload
 
-from src.people.domain_models.models import Person
+from src.people.domain_models.models import ContactInfo, Person, User, Location, \
+    ages, days_to_birthdays, normalize_phone, score_passwords
+from src.people.domain_models.projections import PersonView, LoginInfoView, \
+    ContactInfoView, PersonalIdView, LocationView, CoordinatesView, TimezoneView, \
+    NatView, UserView, make_view
+from src.people.repository import expressions, orm
+from src.people.repository.aggregation import aggregate_query
+from src.people.repository.bulk import MAX_IN_CLAUSE, BulkUserWriter, UserRows, batched, \
+    user_to_rows
 from src.people.repository.exceptions import RepositoryException
+from src.people.repository.pagination import Page, check_page_size, decode_cursor, \
+    make_page
+from src.people.repository.result_cache import MISSING, freeze, statement_key, \
+    statement_tables, thaw, track_writes, written_tables
+from src.people.repository.search import fuzzy_search, prefix_search
+from src.people.repository.spatial import nearest, within_box, within_radius
+from src.people.repository.sync import SyncReport, UserSynchronizer
+
+
+def _summary_profile():
+    return joinedload(User.person), joinedload(User.login_info)
+
+
+def _full_profile():
+    return (
+        joinedload(User.person), joinedload(User.login_info),
+        joinedload(User.contact_info), joinedload(User.personal_id),
+        joinedload(User.location).selectinload(Location.timezone),
+        joinedload(User.location).selectinload(Location.coordinates),
+        joinedload(User.location).selectinload(Location.nat),
+    )
+
+
+# Loader options fetching User graphs in constant number of queries: summary
+# joins person and login info, full also contact info, personal id and location,
+# with the dimensions shared between users loaded once per query
+LOADING_PROFILES = {
+    'summary': _summary_profile,
+    'full': _full_profile,
+}
+
+
+# Columns with few distinct values, equal values of which are shared between user views
+_SHARED_VALUE_COLUMNS = ('person.gender', 'person.title', 'location.city', 'location.state',
+                         'personal_id.name')
+
+
+def _user_view_columns():
+    """ Columns selected for user views, grouped per view, each led by its id """
+
+    def columns(table, view_type):
+        return [table.c.id] + [table.c[name] for name in view_type.__slots__]
+
+    return (
+        ('person', PersonView, columns(orm.person, PersonView)),
+        ('login_info', LoginInfoView, columns(orm.login_info, LoginInfoView)),
+        ('contact_info', ContactInfoView, columns(orm.contact_info, ContactInfoView)),
+        ('personal_id', PersonalIdView, columns(orm.personal_id, PersonalIdView)),
+        ('location', None, [orm.location.c.id, orm.location.c.street, orm.location.c.city,
+                            orm.location.c.state, orm.location.c.postcode]),
+        ('coordinates', CoordinatesView, columns(orm.coordinates, CoordinatesView)),
+        ('timezone', TimezoneView, columns(orm.timezone, TimezoneView)),
+        ('nat', NatView, columns(orm.nat, NatView)),
+    )
+
+
+def _iter_result(result, chunk_size: int) -> Iterator:
+    try:
+        rows = result.fetchmany(chunk_size)
+        while rows:
+            yield from rows
+            rows = result.fetchmany(chunk_size)
+    finally:
+        result.close()
 
 
 class AbstractRepository(abc.ABC):
@@ -21,18 +97,92 @@ class AbstractRepository(abc.ABC):
 class SqlAlchemyRepository(AbstractRepository):
     """ Repository based on SqlAlchemy orm """
 
-    def __init__(self, session):
+    def __init__(self, session, dimensions=None, result_cache=None):
         self.session = session
+        self.dimensions = dimensions
+        self.result_cache = result_cache
+        if result_cache is not None:
+            track_writes(session, result_cache)
 
     def add(self, model):
         """
-        Add object to the database
+        Add object to the database. With dimension cache given, timezone, nat
+        and coordinates of the location are swapped for the persisted ones.
         :param model: Model to be added
         :return:
         """
 
+        location = model.location if isinstance(model, User) else model
+        if self.dimensions is not None and isinstance(location, Location):
+            self.dimensions.load(self.session)
+            self.dimensions.intern(self.session, location)
+
         self.session.add(model)
 
+    def add_many(self, users: Iterable[User], batch_size: int = 1000) -> int:
+        """
+        Add users in batches, with one executemany insert per table instead of
+        a unit of work flush per user. Existing timezone, nat and coordinates rows
+        are reused. Added users are not attached to the session.
+        :param users: Users to be added
+        :param batch_size: Number of users inserted by single statement per table
+        :return: Number of added users
+        """
+
+        return self.add_user_rows((user_to_rows(user) for user in users), batch_size)
+
+    def add_user_rows(self, rows: Iterable[UserRows], batch_size: int = 1000) -> int:
+        """
+        Bulk add users already flattened with bulk.user_to_rows, e.g. by worker
+        processes
+        :param rows: Flattened users
+        :param batch_size: Number of users inserted by single statement per table
+        :return: Number of added users
+        """
+
+        self.session.flush()
+        if self.dimensions is not None:
+            self.dimensions.load(self.session)
+        writer = BulkUserWriter(self.session, self.dimensions)
+
+        added = 0
+        for batch in batched(rows, batch_size):
+            added += writer.write(batch)
+
+        return added
+
+    def sync_users(self, users: Iterable[User], batch_size: int = 1000) -> SyncReport:
+        """
+        Insert users with new login uuid and update stored users with the same
+        uuid, e.g. when pulling users from the API again. Users whose values did
+        not change are skipped without writes, updated ones have only their
+        changed rows written. Users are not attached to the session.
+        :param users: Users to be synchronized
+        :param batch_size: Number of users looked up and written at once
+        :return: Numbers of inserted, updated and unchanged users
+        """
+
+        return self.sync_user_rows((user_to_rows(user) for user in users), batch_size)
+
+    def sync_user_rows(self, rows: Iterable[UserRows], batch_size: int = 1000) -> SyncReport:
+        """
+        Synchronize users already flattened with bulk.user_to_rows
+        :param rows: Flattened users
+        :param batch_size: Number of users looked up and written at once
+        :return: Numbers of inserted, updated and unchanged users
+        """
+
+        self.session.flush()
+        if self.dimensions is not None:
+            self.dimensions.load(self.session)
+        synchronizer = UserSynchronizer(self.session, self.dimensions)
+
+        report = SyncReport()
+        for batch in batched(rows, batch_size):
+            report += synchronizer.sync(batch)
+
+        return report
+
     def get(self, model, model_id: str):
         """
         Get single object by id
@@ -43,6 +193,286 @@ class SqlAlchemyRepository(AbstractRepository):
 
         return self.session.query(model).filter_by(id=model_id).one()
 
+    def get_many(self, model, model_ids: Sequence[int]) -> List:
+        """
+        Get objects by ids, in one query per MAX_IN_CLAUSE ids
+        :param model: Type of objects to be retrieved
+        :param model_ids: Ids of objects to be retrieved
+        :return: List of found objects, in order of the ids
+        """
+
+        found = {}
+        for chunk in batched(model_ids, MAX_IN_CLAUSE):
+            found.update((item.id, item) for item in
+                         self.session.query(model).filter(model.id.in_(chunk)))
+
+        return [found[model_id] for model_id in model_ids if model_id in found]
+
+    def get_user(self, user_id: int, profile: str = 'full') -> User:
+        """
+        Get single user along with relations of given loading profile
+        :param user_id: Id of user to be retrieved
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: User
+        """
+
+        return self._users_query(profile).filter(User.id == user_id).one()
+
+    def list_users(self, profile: str = 'summary', limit: Optional[int] = None) -> List[User]:
+        """
+        List users along with relations of given loading profile, so reading them
+        does not issue query per user
+        :param profile: Name of profile from LOADING_PROFILES
+        :param limit: Limit results - optional
+        :return: List of users
+        """
+
+        query = self._users_query(profile).order_by(User.id)
+        if limit:
+            query = query.limit(limit)
+
+        return query.all()
+
+    def _users_query(self, profile: str):
+        try:
+            options = LOADING_PROFILES[profile]()
+        except KeyError:
+            raise RepositoryException(f'Invalid loading profile: {profile}')
+
+        return self.session.query(User).options(*options)
+
+    def iter_user_views(self, chunk_size: int = 1000) -> Iterator[UserView]:
+        """
+        Stream read-only slotted views of all users, bypassing ORM and identity map.
+        Equal coordinates, timezone and nat views are shared between users, and so
+        are equal values of _SHARED_VALUE_COLUMNS.
+        :param chunk_size: Number of rows fetched at once
+        :return: Iterator of user views ordered by id
+        """
+
+        groups = _user_view_columns()
+        selected = [orm.user.c.id] + [c for _, _, columns in groups for c in columns]
+        shared_positions = [position for position, column in enumerate(selected)
+                            if f'{column.table.name}.{column.name}' in _SHARED_VALUE_COLUMNS]
+        query = select(selected) \
+            .select_from(
+                orm.user
+                .join(orm.person)
+                .join(orm.login_info)
+                .join(orm.contact_info)
+                .outerjoin(orm.personal_id)
+                .outerjoin(orm.location)
+                .outerjoin(orm.coordinates)
+                .outerjoin(orm.timezone)
+                .outerjoin(orm.nat)
+            ).order_by(orm.user.c.id)
+
+        shared, shared_values = {}, {}
+        for row in _iter_result(self.session.execute(query), chunk_size):
+            row = list(row)
+            for position in shared_positions:
+                row[position] = shared_values.setdefault(row[position], row[position])
+
+            views = {}
+            position = 1
+            for name, view_type, columns in groups:
+                values = tuple(row[position + 1:position + len(columns)])
+                if row[position] is None:
+                    views[name] = None
+                elif view_type is None:
+                    views[name] = values
+                else:
+                    views[name] = make_view(view_type, values,
+                                            shared if name in ('coordinates', 'timezone',
+                                                               'nat') else None)
+                position += len(columns)
+
+            location = views['location']
+            if location is not None:
+                location = LocationView(*location, views['coordinates'], views['timezone'],
+                                        views['nat'])
+
+            yield UserView(row[0], views['person'], location, views['login_info'],
+                           views['contact_info'], views['personal_id'])
+
+    def page_users(self, limit: int = 50, cursor: str = None,
+                   profile: str = 'summary') -> Page[User]:
+        """
+        Get page of users ordered by id, along with relations of loading profile
+        :param limit: Page size
+        :param cursor: Cursor of the page, first page by default
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: Page of users
+        """
+
+        check_page_size(limit)
+        key = None if cursor is None else decode_cursor('User.id', cursor, (int,))
+        query = self._users_query(profile)
+        if key is not None:
+            query = query.filter(User.id > key[0])
+
+        users = query.order_by(User.id).limit(limit + 1).all()
+
+        return make_page(users, limit, 'User.id', lambda user: (user.id,))
+
+    def page_model(self, model, limit: int = 50, cursor: str = None, **filters) -> Page:
+        """
+        Get page of models matching filters, ordered by id
+        :param model: Type of model to be retrieved
+        :param limit: Page size
+        :param cursor: Cursor of the page, first page by default
+        :param filters: Filters to use
+        :return: Page of models
+        """
+
+        check_page_size(limit)
+        kind = f'{model.__name__}.id'
+        query = self._filter_model_by_query(model, filters)
+        if cursor is not None:
+            [last_id] = decode_cursor(kind, cursor, (int,))
+            query = query.filter(model.id > last_id)
+
+        items = query.order_by(model.id).limit(limit + 1).all()
+
+        return make_page(items, limit, kind, lambda item: (item.id,))
+
+    def page_persons_by_date_of_birth(self, limit: int = 50, cursor: str = None,
+                                      date_1: datetime.date = None,
+                                      date_2: datetime.date = None) -> Page[Person]:
+        """
+        Get page of persons ordered by date of birth, persons born the same day by
+        id. Persons without date of birth are skipped.
+        :param limit: Page size
+        :param cursor: Cursor of the page, first page by default
+        :param date_1: Earliest date of birth - optional
+        :param date_2: Latest date of birth - optional
+        :return: Page of persons
+        """
+
+        check_page_size(limit)
+        query = self.session.query(Person).filter(Person.date_of_birth.isnot(None))
+        if date_1 is not None:
+            query = query.filter(Person.date_of_birth >= date_1)
+        if date_2 is not None:
+            query = query.filter(Person.date_of_birth <= date_2)
+        if cursor is not None:
+            last_date, last_id = decode_cursor('Person.date_of_birth', cursor,
+                                              (datetime.date, int))
+            query = query.filter(tuple_(Person.date_of_birth, Person.id) >
+                                 tuple_(literal(last_date, Date), last_id))
+
+        persons = query.order_by(Person.date_of_birth, Person.id).limit(limit + 1).all()
+
+        return make_page(persons, limit, 'Person.date_of_birth',
+                         lambda person: (person.date_of_birth, person.id))
+
+    def search_users(self, text: str, fields: Sequence[str] = None, limit: int = 20,
+                     profile: str = 'summary') -> List[User]:
+        """
+        Find users by prefixes of words of their names, username, email or city,
+        e.g. 'jo sm' finds John Smith
+        :param text: Searched text
+        :param fields: Fields to search in, all of search.SEARCH_FIELDS by default
+        :param limit: Maximum number of results
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users ordered by id
+        """
+
+        return self._users_by_ids(prefix_search(self.session, text, fields, limit), profile)
+
+    def fuzzy_search_users(self, text: str, limit: int = 20, cutoff: float = 0.6,
+                           profile: str = 'summary') -> List[User]:
+        """
+        Find users by words similar to words of the text, e.g. 'jhon smtih'
+        :param text: Searched text
+        :param limit: Maximum number of results
+        :param cutoff: Minimum similarity, 0 to 1
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users, most similar first
+        """
+
+        return self._users_by_ids(fuzzy_search(self.session, text, limit, cutoff), profile)
+
+    def find_users_by_phone(self, number: str, profile: str = 'summary') -> List[User]:
+        """
+        Find users whose phone or cell number has the same canonical digits,
+        e.g. '+41 (0)44 123 45 67' finds '41-44-1234567', with index lookups
+        :param number: Phone number as written
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users ordered by id
+        """
+
+        digits = normalize_phone(number)
+        if not digits:
+            return []
+
+        return self._users_query(profile).join(User.contact_info) \
+            .filter(or_(ContactInfo.phone_digits == digits,
+                        ContactInfo.cell_digits == digits)) \
+            .order_by(User.id).all()
+
+    def users_within_box(self, south: float, west: float, north: float, east: float,
+                         profile: str = 'summary') -> List[User]:
+        """
+        Find users located within the box, using the spatial index. Box with
+        west edge east of its east edge crosses the antimeridian.
+        :param south: Latitude of the south edge
+        :param west: Longitude of the west edge
+        :param north: Latitude of the north edge
+        :param east: Longitude of the east edge
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users ordered by id
+        """
+
+        return self._users_by_ids(within_box(self.session, south, west, north, east),
+                                  profile)
+
+    def users_within_radius(self, latitude: float, longitude: float, radius_km: float,
+                            profile: str = 'summary') -> List[Tuple[User, float]]:
+        """
+        Find users located within radius of the centre, using the spatial index
+        :param latitude: Latitude of the centre
+        :param longitude: Longitude of the centre
+        :param radius_km: Radius in kilometres
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users along with distances in kilometres, nearest first
+        """
+
+        return self._users_with_distances(
+            within_radius(self.session, latitude, longitude, radius_km), profile)
+
+    def nearest_users(self, latitude: float, longitude: float, count: int = 10,
+                      profile: str = 'summary') -> List[Tuple[User, float]]:
+        """
+        Find users nearest to the point, using the spatial index
+        :param latitude: Latitude of the point
+        :param longitude: Longitude of the point
+        :param count: Number of users to find
+        :param profile: Name of profile from LOADING_PROFILES
+        :return: List of users along with distances in kilometres, nearest first
+        """
+
+        return self._users_with_distances(
+            nearest(self.session, latitude, longitude, count), profile)
+
+    def _users_with_distances(self, found: List[Tuple[int, float]],
+                              profile: str) -> List[Tuple[User, float]]:
+        distances = dict(found)
+        users = self._users_by_ids([user_id for user_id, _ in found], profile)
+
+        return [(user, distances[user.id]) for user in users]
+
+    def _users_by_ids(self, ids: List[int], profile: str) -> List[User]:
+        query = self._users_query(profile)
+        if not ids:
+            return []
+
+        users = {}
+        for chunk in batched(ids, MAX_IN_CLAUSE):
+            users.update((user.id, user) for user in query.filter(User.id.in_(chunk)))
+
+        return [users[user_id] for user_id in ids if user_id in users]
+
     def group_by_and_count(self, model, column, limit: int = None,
                            descending: bool = True):
         """
@@ -55,17 +485,62 @@ class SqlAlchemyRepository(AbstractRepository):
         """
 
         try:
-            q = self.session.query(model, func.count(column)).group_by(
-                column)
-            if descending:
-                q = q.order_by(desc(text('count_1')))
-            if limit:
-                q = q.limit(limit)
-
-            return q.all()
+            return self._cached(self._group_by_and_count_query(model, column, limit,
+                                                               descending))
         except CompileError:
             raise RepositoryException(f'Invalid column to group by: {column}')
 
+    def iter_group_by_and_count(self, model, column, limit: int = None,
+                                descending: bool = True, chunk_size: int = 1000,
+                                as_rows: bool = False) -> Iterator:
+        """
+        Streaming variant of group_by_and_count
+        :param model: Model type of objects to be used
+        :param column: Column to perform group by operation
+        :param limit: Limit results - optional
+        :param descending: Filtering the results, descending is default
+        :param chunk_size: Number of rows fetched at once
+        :param as_rows: Yield plain rows instead of models
+        :return: Iterator of results
+        """
+
+        try:
+            return self._stream(self._group_by_and_count_query(model, column, limit,
+                                                               descending),
+                                chunk_size, as_rows)
+        except CompileError:
+            raise RepositoryException(f'Invalid column to group by: {column}')
+
+    def _group_by_and_count_query(self, model, column, limit, descending):
+        count = func.count(column)
+        q = self.session.query(model, count).group_by(column)
+        if descending:
+            q = q.order_by(desc(count))
+        if limit:
+            q = q.limit(limit)
+
+        return q
+
+    def aggregate(self, group_by: Sequence[str], aggregates: Sequence[str] = ('count',),
+                  filters: Dict[str, Any] = None, order_by: Sequence[str] = None,
+                  limit: int = None, today: datetime.date = None) -> List:
+        """
+        Group users by several keys across joined tables and compute aggregates
+        in single statement, e.g. aggregate(['nat', 'gender', 'age_bucket'],
+        ['count', 'avg_password_strength'])
+        :param group_by: Names of keys from aggregation.GROUP_KEYS
+        :param aggregates: Names of aggregates from aggregation.AGGREGATES
+        :param filters: Values of group keys to keep - optional
+        :param order_by: Names of keys or aggregates, '-' prefix for descending
+        order, group keys by default
+        :param limit: Limit results - optional
+        :param today: Reference date of ages, today by default
+        :return: List of rows with values accessible by the names
+        """
+
+        return self._cached(aggregate_query(group_by, aggregates, filters, order_by, limit,
+                                            today, self._dialect()))
+
     def filter_person_by_date_of_birth(self, date_1, date_2):
         """
         Specific filter to match person date of birth between two given dates
@@ -73,12 +548,27 @@ class SqlAlchemyRepository(AbstractRepository):
         :param date_2: Later date to match
         :return:
         """
-        query = self.session.query(Person).filter(and_(
+
+        return self._cached(self._date_of_birth_query(date_1, date_2))
+
+    def iter_person_by_date_of_birth(self, date_1, date_2, chunk_size: int = 1000,
+                                     as_rows: bool = False) -> Iterator:
+        """
+        Streaming variant of filter_person_by_date_of_birth
+        :param date_1: Earlier date to match
+        :param date_2: Later date to match
+        :param chunk_size: Number of rows fetched at once
+        :param as_rows: Yield plain rows instead of models
+        :return: Iterator of results
+        """
+
+        return self._stream(self._date_of_birth_query(date_1, date_2), chunk_size, as_rows)
+
+    def _date_of_birth_query(self, date_1, date_2):
+        return self.session.query(Person).filter(and_(
             Person.date_of_birth >= date_1,
             Person.date_of_birth <= date_2))
 
-        return query.all()
-
     def filter_model_by(self, model, **filters):
         """
         Perform filter by operation
@@ -87,7 +577,133 @@ class SqlAlchemyRepository(AbstractRepository):
         :return:
         """
 
+        return self._cached(self._filter_model_by_query(model, filters))
+
+    def iter_model_by(self, model, chunk_size: int = 1000, as_rows: bool = False,
+                      **filters) -> Iterator:
+        """
+        Streaming variant of filter_model_by
+        :param model: Type of model to be retrieved
+        :param chunk_size: Number of rows fetched at once
+        :param as_rows: Yield plain rows instead of models
+        :param filters: Filters to use
+        :return: Iterator of results
+        """
+
+        return self._stream(self._filter_model_by_query(model, filters), chunk_size,
+                            as_rows)
+
+    def _filter_model_by_query(self, model, filters):
         try:
-            return self.session.query(model).filter_by(**filters).all()
+            return self.session.query(model).filter_by(**filters)
         except InvalidRequestError:
             raise RepositoryException(f"Invalid columns given: {filters}")
+
+    def _dialect(self) -> str:
+        return self.session.get_bind().dialect.name
+
+    def _cached(self, query) -> List:
+        """
+        Fetch all results of ORM query or Core statement, through result cache
+        when given. Tables written in current unit of work bypass the cache.
+        :param query: Query or statement to be executed
+        :return: List of results
+        """
+
+        def fetch():
+            if hasattr(query, 'statement'):
+                return query.all()
+            return self.session.execute(query).fetchall()
+
+        if self.result_cache is None:
+            return fetch()
+
+        statement = getattr(query, 'statement', query)
+        tables = statement_tables(statement)
+        key = statement_key(statement, self.session.get_bind().dialect)
+        if key is None or tables & written_tables(self.session):
+            return fetch()
+
+        cached = self.result_cache.get(key)
+        if cached is not MISSING:
+            return thaw(self.session, cached)
+
+        result = fetch()
+        self.result_cache.put(key, tables, freeze(result))
+
+        return result
+
+    def _stream(self, query, chunk_size: int, as_rows: bool) -> Iterator:
+        """
+        Execute query and fetch results chunk by chunk, so memory use does not grow
+        with number of results as long as caller drops them
+        :param query: Query to be executed
+        :param chunk_size: Number of rows fetched at once
+        :param as_rows: Skip ORM and identity map, yield plain rows
+        :return: Iterator of results
+        """
+
+        if not as_rows:
+            return iter(query.yield_per(chunk_size))
+
+        result = self.session.execute(query.statement)
+        return _iter_result(result, chunk_size)
+
+    def password_strengths(self) -> List[Tuple[int, int]]:
+        """
+        Score every stored password in the database instead of loading LoginInfo
+        :return: List of (login info id, password strength)
+        """
+
+        if self._dialect() != 'sqlite':
+            # Scoring in SQL relies on SQLite GLOB
+            rows = self._cached(select([orm.login_info.c.id, orm.login_info.c.password])
+                                .order_by(orm.login_info.c.id))
+            return list(zip((row_id for row_id, _ in rows),
+                            score_passwords(password or '' for _, password in rows)))
+
+        query = select([orm.login_info.c.id,
+                        expressions.password_strength(orm.login_info.c.password)]).order_by(
+            orm.login_info.c.id)
+
+        return self._cached(query)
+
+    def ages_and_days_to_birthday(self, today: datetime.date = None,
+                                  within_days: int = None) -> List[Tuple[int, int, int]]:
+        """
+        Calculate age and days to birthday of every person in the database
+        :param today: Reference date, today by default
+        :param within_days: Keep only birthdays in given number of days - optional
+        :return: List of (person id, age, days to birthday), closest birthdays first
+        """
+
+        date_of_birth = orm.person.c.date_of_birth
+        if self._dialect() != 'sqlite':
+            # Days to birthday in SQL rely on SQLite date strings
+            return self._ages_and_days_to_birthday(today or datetime.date.today(),
+                                                   within_days)
+
+        today = literal(today or datetime.date.today())
+        days = expressions.days_to_birthday(date_of_birth, today).label('days')
+
+        query = select([orm.person.c.id, expressions.age(date_of_birth, today), days]).where(
+            date_of_birth.isnot(None)).order_by(days, orm.person.c.id)
+        if within_days is not None:
+            query = query.where(days <= within_days)
+
+        return self._cached(query)
+
+    def _ages_and_days_to_birthday(self, today: datetime.date,
+                                   within_days: Optional[int]) -> List[Tuple[int, int, int]]:
+        """ ages_and_days_to_birthday calculated in Python from fetched dates of birth """
+
+        date_of_birth = orm.person.c.date_of_birth
+        rows = self._cached(select([orm.person.c.id, date_of_birth])
+                            .where(date_of_birth.isnot(None)))
+        dates = [row_date for _, row_date in rows]
+        found = sorted(
+            (days, person_id, age) for (person_id, _), age, days in zip(
+                rows, ages(dates, today), days_to_birthdays(dates, today))
+            if within_days is None or days <= within_days)
+
+        return [(person_id, age, days) for days, person_id, age in found]
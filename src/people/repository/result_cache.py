@@ -0,0 +1,255 @@
+""" Cache of query results shared between units of work
+
+Results are keyed on the compiled statement and its parameters and remember
+the tables they were read from. Sessions watched with track_writes record the
+tables their statements write to and drop cached results of those tables once
+they commit. Models are cached as their loaded column values and merged into
+the session asking for them without loading them again.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, NamedTuple, Optional, \
+    Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, object_mapper
+from sqlalchemy.orm.attributes import instance_state, set_committed_value
+from sqlalchemy.orm.exc import UnmappedInstanceError
+from sqlalchemy.sql.util import find_tables
+
+WRITTEN_TABLES = 'people_written_tables'
+MISSING = object()
+
+_WRITE_STATEMENT = re.compile(
+    r'^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)'
+    r'\s+["`\[]?(\w+)', re.IGNORECASE)
+
+
+class ResultCache:
+    """ Results of read queries with LRU eviction and time to live in seconds """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._keys_by_table = {}
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate,
+                    invalidations=self.invalidations, entries=len(self))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get cached result
+        :param key: Key of the query
+        :return: Result or MISSING
+        """
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= self._clock():
+            self._discard(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return entry[2]
+
+    def put(self, key: Hashable, tables: Iterable[str], result: Any):
+        """
+        Cache result of the query
+        :param key: Key of the query
+        :param tables: Names of tables the query reads
+        :param result: Result to be cached
+        :return:
+        """
+
+        self._discard(key)
+        tables = frozenset(tables)
+        expires = None if self.ttl is None else self._clock() + self.ttl
+        self._entries[key] = (expires, tables, result)
+        for table in tables:
+            self._keys_by_table.setdefault(table, set()).add(key)
+
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, tables: Iterable[str] = None):
+        """
+        Drop results read from given tables
+        :param tables: Names of written tables, all results by default
+        :return:
+        """
+
+        if tables is None:
+            keys = list(self._entries)
+        else:
+            keys = {key for table in tables for key in self._keys_by_table.get(table, ())}
+
+        for key in keys:
+            self._discard(key)
+        self.invalidations += len(keys)
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        for table in entry[1]:
+            keys = self._keys_by_table[table]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_table[table]
+
+
+def statement_key(statement, dialect) -> Optional[Tuple]:
+    """
+    Normalized key of the statement: its SQL and parameters
+    :param statement: Core statement
+    :param dialect: Dialect to compile with
+    :return: Key, None when parameters are not hashable
+    """
+
+    compiled = statement.compile(dialect=dialect)
+    key = (str(compiled), tuple(sorted(compiled.params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+
+def statement_tables(statement) -> FrozenSet[str]:
+    """ Names of tables the statement reads from """
+
+    return frozenset(table.name for table in find_tables(statement, check_columns=True,
+                                                         include_joins=True)
+                     if hasattr(table, 'name'))
+
+
+def _written_table(statement) -> Optional[str]:
+    if isinstance(statement, str):
+        match = _WRITE_STATEMENT.match(statement)
+        return match.group(1) if match else None
+
+    if getattr(statement, 'is_dml', False):
+        return statement.table.name
+
+    text = getattr(statement, 'text', None)
+    return _written_table(text) if isinstance(text, str) else None
+
+
+def track_writes(session, cache: ResultCache):
+    """
+    Record tables written by statements of the session and invalidate their
+    results in the cache once the session commits. Safe to call repeatedly.
+    :param session: Session to watch
+    :param cache: Cache to invalidate
+    :return:
+    """
+
+    if WRITTEN_TABLES in session.info:
+        return
+    session.info[WRITTEN_TABLES] = set()
+
+    def record(conn, clauseelement, multiparams, params):
+        table = _written_table(clauseelement)
+        if table is not None:
+            session.info[WRITTEN_TABLES].add(table)
+
+    def after_flush(session, flush_context):
+        # Flushes write through connections of their own, not seen by record
+        session.info[WRITTEN_TABLES].update(_pending_tables(session))
+
+    def after_begin(session, transaction, connection):
+        if not event.contains(connection, 'before_execute', record):
+            event.listen(connection, 'before_execute', record)
+
+    def after_commit(session):
+        cache.invalidate(session.info[WRITTEN_TABLES])
+        session.info[WRITTEN_TABLES] = set()
+
+    def after_rollback(session):
+        session.info[WRITTEN_TABLES] = set()
+
+    event.listen(session, 'after_begin', after_begin)
+    event.listen(session, 'after_flush', after_flush)
+    event.listen(session, 'after_commit', after_commit)
+    event.listen(session, 'after_rollback', after_rollback)
+
+
+def written_tables(session) -> Set[str]:
+    """ Tables written or about to be flushed by the session since last commit """
+
+    return set(session.info.get(WRITTEN_TABLES, ())) | _pending_tables(session)
+
+
+def _pending_tables(session) -> Set[str]:
+    return {object_mapper(instance).local_table.name
+            for instance in (*session.new, *session.dirty, *session.deleted)}
+
+
+class _FrozenModel(NamedTuple):
+    class_manager: Any
+    key: Tuple
+    values: Dict[str, Any]
+
+
+def _freeze_model(value):
+    try:
+        mapper = object_mapper(value)
+    except UnmappedInstanceError:
+        return value
+
+    return _FrozenModel(mapper.class_manager, instance_state(value).key,
+                        {attribute.key: getattr(value, attribute.key)
+                         for attribute in mapper.column_attrs})
+
+
+def freeze(result: list) -> list:
+    """ Copy of query result safe to keep after its session is gone """
+
+    return [type(item)(map(_freeze_model, item)) if isinstance(item, tuple)
+            else _freeze_model(item) for item in result]
+
+
+def thaw(session, frozen: list) -> list:
+    """ Cached query result with models attached to the session """
+
+    def attach(value):
+        if not isinstance(value, _FrozenModel):
+            return value
+
+        current = session.identity_map.get(value.key)
+        if current is not None:
+            return current
+
+        instance = value.class_manager.new_instance()
+        for key, column_value in value.values.items():
+            set_committed_value(instance, key, column_value)
+        make_transient_to_detached(instance)
+        return session.merge(instance, load=False)
+
+    # Named tuple rows of ORM queries with several entities are rebuilt
+    return [type(item)(map(attach, item)) if isinstance(item, tuple) and
+            not isinstance(item, _FrozenModel) else attach(item) for item in frozen]
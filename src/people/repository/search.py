@@ -0,0 +1,384 @@
+""" Full-text search over names, usernames, emails and cities of users
+
+Two SQLite FTS5 tables hold one row per user, with rowid equal to the user id:
+
+- user_search - words, with prefix indexes making 'jo*' a lookup instead of a scan
+- user_search_trigram - trigrams, candidates of fuzzy search
+
+Triggers on user and the tables the fields come from keep both in sync with
+every insert, update and delete, whether done by the ORM, bulk writes or raw
+SQL. They are created along with the schema by metadata.create_all and filled
+from existing users by upgrade_schema.
+
+Only tables the SQLite build supports are created: FTS5 must be compiled in,
+and the trigram tokenizer needs SQLite 3.34 or newer. Without them searches
+fall back to scanning users. Prefix search then matches words the way the
+unicode61 tokenizer splits and folds them, and fuzzy search ranks users
+containing a candidate trigram, found with LIKE.
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Sequence, Set
+
+from sqlalchemy.exc import OperationalError
+
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.virtual_tables import VirtualTables
+
+SEARCH_TABLE = 'user_search'
+TRIGRAM_TABLE = 'user_search_trigram'
+SEARCH_TABLES = (SEARCH_TABLE, TRIGRAM_TABLE)
+SEARCH_FIELDS = ('first_name', 'second_name', 'username', 'email', 'city')
+
+# Fuzzy search ranks this many trigram candidates per requested result
+FUZZY_CANDIDATES = 10
+
+_TOKENIZERS = {
+    SEARCH_TABLE: "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'",
+    TRIGRAM_TABLE: "tokenize = 'trigram'",
+}
+
+# Columns of the joined users the fields are read from
+_FIELD_COLUMNS = {
+    'first_name': 'p.first_name',
+    'second_name': 'p.second_name',
+    'username': 'l.username',
+    'email': 'c.email',
+    'city': 'loc.city',
+}
+
+_JOINS = (
+    'FROM "user" AS u '
+    'JOIN person AS p ON p.id = u.person_id '
+    'JOIN login_info AS l ON l.id = u.login_info_id '
+    'JOIN contact_info AS c ON c.id = u.contact_info_id '
+    'LEFT JOIN location AS loc ON loc.id = u.location_info_id'
+)
+
+_COLUMNS = f"u.id, {', '.join(_FIELD_COLUMNS[field] for field in SEARCH_FIELDS)}"
+_SOURCE = f'SELECT {_COLUMNS} {_JOINS}'
+
+# Table, its columns indexed as fields and foreign key of user pointing to it
+_FIELD_SOURCES = (
+    ('person', ('first_name', 'second_name'), 'person_id'),
+    ('login_info', ('username',), 'login_info_id'),
+    ('contact_info', ('email',), 'contact_info_id'),
+    ('location', ('city',), 'location_info_id'),
+)
+
+_WORD = re.compile(r'\w+')
+
+_PRESENT = VirtualTables(SEARCH_TABLES)
+
+
+def _insert(table: str, where: str) -> str:
+    return f"INSERT INTO {table} (rowid, {', '.join(SEARCH_FIELDS)}) {_SOURCE} WHERE {where};"
+
+
+def _triggers(tables: List[str]) -> List[str]:
+    """ Triggers keeping the given search tables in sync """
+
+    def each_table(statement):
+        return ' '.join(statement.format(table=table) for table in tables)
+
+    foreign_keys = ', '.join(foreign_key for _, _, foreign_key in _FIELD_SOURCES)
+    triggers = [
+        f'CREATE TRIGGER user_search_insert AFTER INSERT ON "user" BEGIN '
+        f"{' '.join(_insert(table, 'u.id = new.id') for table in tables)} END",
+        f'CREATE TRIGGER user_search_delete AFTER DELETE ON "user" BEGIN '
+        f"{each_table('DELETE FROM {table} WHERE rowid = old.id;')} END",
+        f'CREATE TRIGGER user_search_update AFTER UPDATE OF {foreign_keys} '
+        f'ON "user" BEGIN '
+        f"{each_table('DELETE FROM {table} WHERE rowid = old.id;')} "
+        f"{' '.join(_insert(table, 'u.id = new.id') for table in tables)} END",
+    ]
+
+    for source, columns, foreign_key in _FIELD_SOURCES:
+        assignments = ', '.join(f'{column} = new.{column}' for column in columns)
+        triggers.append(
+            f"CREATE TRIGGER user_search_{source}_update AFTER UPDATE OF "
+            f"{', '.join(columns)} ON {source} BEGIN "
+            + each_table(f'UPDATE {{table}} SET {assignments} WHERE rowid IN '
+                         f'(SELECT id FROM "user" WHERE {foreign_key} = new.id);')
+            + ' END')
+
+    return triggers
+
+
+def _trigger_names() -> List[str]:
+    return ['user_search_insert', 'user_search_delete', 'user_search_update'] + [
+        f'user_search_{source}_update' for source, _, _ in _FIELD_SOURCES]
+
+
+def supported_search_tables(connection) -> List[str]:
+    """
+    Search tables the SQLite build can create, probed with throwaway temporary tables
+    :param connection: Connection to SQLite database
+    :return: Names of supported search tables
+    """
+
+    supported = []
+    for table in SEARCH_TABLES:
+        try:
+            connection.execute(f'CREATE VIRTUAL TABLE temp.search_probe USING fts5('
+                               f'value, {_TOKENIZERS[table]})')
+        except OperationalError:
+            continue
+        connection.execute('DROP TABLE temp.search_probe')
+        supported.append(table)
+
+    return supported
+
+
+def existing_search_tables(connection) -> List[str]:
+    """ Search tables present in the database, in order of SEARCH_TABLES """
+
+    return list(_PRESENT.lookup(connection))
+
+
+def create_search_index(connection) -> List[str]:
+    """
+    Create supported search tables missing in the database and fill them from
+    existing users, along with triggers keeping them in sync. Safe to run repeatedly.
+    :param connection: Connection to SQLite database
+    :return: Names of created search tables
+    """
+
+    _PRESENT.forget(connection)
+    existing = existing_search_tables(connection)
+    created = [table for table in supported_search_tables(connection)
+               if table not in existing]
+
+    for table in created:
+        connection.execute(f"CREATE VIRTUAL TABLE {table} USING fts5("
+                           f"{', '.join(SEARCH_FIELDS)}, {_TOKENIZERS[table]})")
+        connection.execute(f"INSERT INTO {table} (rowid, {', '.join(SEARCH_FIELDS)}) "
+                           f"{_SOURCE}")
+
+    tables = existing_search_tables(connection)
+    _drop_triggers(connection)
+    if tables:
+        for trigger in _triggers(tables):
+            connection.execute(trigger)
+
+    return created
+
+
+def _drop_triggers(connection):
+    for trigger in _trigger_names():
+        connection.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def drop_search_index(connection):
+    _PRESENT.forget(connection)
+    _drop_triggers(connection)
+    for table in SEARCH_TABLES:
+        connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def rebuild_search_index(connection):
+    """ Refill search tables from users, e.g. after restoring a backup taken without them """
+
+    for table in existing_search_tables(connection):
+        connection.execute(f'DELETE FROM {table}')
+        connection.execute(f"INSERT INTO {table} (rowid, {', '.join(SEARCH_FIELDS)}) "
+                           f"{_SOURCE}")
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def prefix_query(text: str, fields: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    FTS5 query matching users with words starting with every word of the text
+    :param text: Searched text, e.g. 'jo smi'
+    :param fields: Fields to search in, all of SEARCH_FIELDS by default
+    :return: Query, None when the text has no words
+    """
+
+    words = _WORD.findall(text)
+    if not words:
+        return None
+
+    query = ' '.join(_quote(word) + '*' for word in words)
+    if fields is not None:
+        fields = list(fields)
+        invalid = [field for field in fields if field not in SEARCH_FIELDS]
+        if invalid or not fields:
+            raise RepositoryException(f'Invalid search fields: {invalid or fields}')
+        query = f"{{{' '.join(fields)}}} : ({query})"
+
+    return query
+
+
+def prefix_search(session, text: str, fields: Optional[Iterable[str]] = None,
+                  limit: int = 20) -> List[int]:
+    """
+    Find users with words starting with every word of the text
+    :param session: Session of the people database
+    :param text: Searched text
+    :param fields: Fields to search in, all of SEARCH_FIELDS by default
+    :param limit: Maximum number of results
+    :return: Ids of users, ascending
+    """
+
+    query = prefix_query(text, fields)
+    if query is None:
+        return []
+    if SEARCH_TABLE not in _PRESENT.present(session):
+        return _scan_prefixes(session, _WORD.findall(text),
+                              list(fields) if fields is not None else SEARCH_FIELDS, limit)
+
+    # Ordering by rank would score every match before the limit applies, which
+    # for short prefixes is most of the table
+    return [user_id for user_id, in session.execute(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query '
+        f'ORDER BY rowid LIMIT :limit', dict(query=query, limit=limit))]
+
+
+def _fold(text: str) -> str:
+    """ Text lowercased and without diacritics, as the unicode61 tokenizer folds it """
+
+    if text.isascii():
+        return text.lower()
+
+    return ''.join(character for character in unicodedata.normalize('NFKD', text.casefold())
+                   if not unicodedata.combining(character))
+
+
+def _scan_prefixes(session, words: List[str], fields: Sequence[str], limit: int) -> List[int]:
+    """
+    Scan users with words starting with every word in the fields, used without
+    search table. LIKE narrows users down to ones containing the words, or
+    containing characters beyond ASCII which may fold to them.
+    :param session: Session of the people database
+    :param words: Words of the searched text
+    :param fields: Fields to look for words in
+    :param limit: Maximum number of results
+    :return: Ids of users, ascending
+    """
+
+    # Word of the text starts a word of the fields where no word character precedes it
+    patterns = [re.compile(r'(?<!\w)' + re.escape(_fold(word))).search for word in words]
+    columns = ' || char(10) || '.join(f"coalesce({_FIELD_COLUMNS[field]}, '')"
+                                      for field in fields)
+    # Text holds characters beyond ASCII where its length in bytes differs
+    beyond_ascii = [f'length({_FIELD_COLUMNS[field]}) != length(CAST({_FIELD_COLUMNS[field]} '
+                    f'AS BLOB))' for field in fields]
+    conditions, parameters = [], {}
+    for position, word in enumerate(map(_fold, words)):
+        if word.isascii():
+            parameters[f'word_{position}'] = _like(word)
+            conditions.append('(' + ' OR '.join(
+                [f"{_FIELD_COLUMNS[field]} LIKE :word_{position} ESCAPE '\\'"
+                 for field in fields] + beyond_ascii) + ')')
+
+    found = []
+    result = session.execute(f"SELECT u.id, {columns} {_JOINS} "
+                             f"WHERE {' AND '.join(conditions) or '1'} ORDER BY u.id",
+                             parameters)
+    try:
+        for user_id, values in result:
+            values = _fold(values)
+            if all(search(values) for search in patterns):
+                found.append(user_id)
+                if len(found) == limit:
+                    break
+    finally:
+        result.close()
+
+    return found
+
+
+def _like(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _scan(session, terms: Sequence[str], limit: int) -> List:
+    """
+    Scan users with a field containing any of the terms, used without trigram table
+    :param session: Session of the people database
+    :param terms: Terms, matched case-insensitively for ASCII letters only
+    :param limit: Maximum number of results
+    :return: Rows of _COLUMNS, ascending by user id
+    """
+
+    parameters = dict(limit=limit)
+    matches = []
+    for position, term in enumerate(terms):
+        parameters[f'term_{position}'] = _like(term)
+        matches += [f"{_FIELD_COLUMNS[field]} LIKE :term_{position} ESCAPE '\\'"
+                    for field in SEARCH_FIELDS]
+
+    return list(session.execute(f"SELECT {_COLUMNS} {_JOINS} WHERE {' OR '.join(matches)} "
+                                f"ORDER BY u.id LIMIT :limit", parameters))
+
+
+def _trigrams(word: str) -> Set[str]:
+    return {word[start:start + 3] for start in range(len(word) - 2)}
+
+
+def _candidate_trigrams(word: str) -> Set[str]:
+    """ Trigrams of the word and of its variants with one character dropped or two
+    neighbours swapped, so that short words with a typo, e.g. 'jhon', still share
+    a trigram with the intended one """
+
+    variants = {word}
+    for position in range(len(word)):
+        variants.add(word[:position] + word[position + 1:])
+        if position + 1 < len(word):
+            variants.add(word[:position] + word[position + 1] + word[position] +
+                         word[position + 2:])
+
+    return {trigram for variant in variants for trigram in _trigrams(variant)}
+
+
+def _similarity(word: str, values: Iterable[Optional[str]]) -> float:
+    best = 0.0
+    for value in values:
+        for candidate in _WORD.findall((value or '').lower()):
+            matcher = SequenceMatcher(None, word, candidate)
+            if matcher.real_quick_ratio() > best and matcher.quick_ratio() > best:
+                best = max(best, matcher.ratio())
+
+    return best
+
+
+def fuzzy_search(session, text: str, limit: int = 20, cutoff: float = 0.6) -> List[int]:
+    """
+    Find users with words similar to words of the text, tolerating typos.
+    Candidates sharing trigrams with the text or its one-typo variants are
+    ranked by difflib similarity of their closest words, averaged over words of
+    the text.
+    :param session: Session of the people database
+    :param text: Searched text, words shorter than 3 characters are ignored
+    :param limit: Maximum number of results
+    :param cutoff: Minimum similarity, 0 to 1
+    :return: Ids of users, most similar first
+    """
+
+    words = [word for word in _WORD.findall(text.lower()) if len(word) >= 3]
+    trigrams = {trigram for word in words for trigram in _candidate_trigrams(word)}
+    if not trigrams:
+        return []
+
+    if TRIGRAM_TABLE in _PRESENT.present(session):
+        candidates = session.execute(
+            f"SELECT rowid, {', '.join(SEARCH_FIELDS)} FROM {TRIGRAM_TABLE} "
+            f"WHERE {TRIGRAM_TABLE} MATCH :query ORDER BY rank LIMIT :limit",
+            dict(query=' OR '.join(map(_quote, sorted(trigrams))),
+                 limit=limit * FUZZY_CANDIDATES))
+    else:
+        candidates = _scan(session, sorted(trigrams), limit * FUZZY_CANDIDATES)
+
+    scored = []
+    for user_id, *values in candidates:
+        score = sum(_similarity(word, values) for word in words) / len(words)
+        if score >= cutoff:
+            scored.append((-score, user_id))
+    scored.sort()
+
+    return [user_id for _, user_id in scored[:limit]]
@@ -0,0 +1,394 @@
+""" Columnar read-only snapshot of the joined user graph for analytics
+
+Every column is a file of native machine values (stdlib array typecodes), read
+back through mmap without copying, so aggregations run over flat memory
+instead of ORM objects and do not touch the database. Layout of a snapshot
+directory:
+
+- meta.json - number of rows, last exported user id, column kinds, categories
+- <column>.col - one value per row: 'number' columns as is, 'date' columns as
+  proleptic Gregorian ordinals (0 for missing), 'category' columns as codes into
+  the categories list stored in meta.json (-1 for missing)
+- <column>.offsets and <column>.blob - 'text' columns, UTF-8 encoded values
+  concatenated in blob and end offset of every value; missing text reads as ''
+
+Files of 'number', 'date' and 'category' columns can be opened with
+numpy.memmap(path, dtype=typecode) where NumPy is available. Snapshot uses
+NumPy for count_by and filter_by_date when it is installed and falls back to
+C-level iteration of the mapped columns otherwise.
+"""
+
+import datetime
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from src.people.repository import expressions, orm
+from src.people.repository.exceptions import RepositoryException
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+
+class SnapshotColumn(NamedTuple):
+    name: str
+    kind: str
+    typecode: str
+    source: Any
+
+
+def snapshot_columns() -> Tuple[SnapshotColumn, ...]:
+    """ Columns of the snapshot, in order, with their source expressions """
+
+    return (
+        SnapshotColumn('user_id', 'number', 'q', orm.user.c.id),
+        SnapshotColumn('gender', 'category', 'i', orm.person.c.gender),
+        SnapshotColumn('title', 'category', 'i', orm.person.c.title),
+        SnapshotColumn('first_name', 'text', 'q', orm.person.c.first_name),
+        SnapshotColumn('second_name', 'text', 'q', orm.person.c.second_name),
+        SnapshotColumn('date_of_birth', 'date', 'i', orm.person.c.date_of_birth),
+        SnapshotColumn('username', 'text', 'q', orm.login_info.c.username),
+        SnapshotColumn('password_strength', 'number', 'b',
+                       expressions.password_strength(orm.login_info.c.password)),
+        SnapshotColumn('date_registered', 'date', 'i', orm.login_info.c.date_registered),
+        SnapshotColumn('email', 'text', 'q', orm.contact_info.c.email),
+        SnapshotColumn('city', 'category', 'i', orm.location.c.city),
+        SnapshotColumn('state', 'category', 'i', orm.location.c.state),
+        SnapshotColumn('postcode', 'text', 'q', orm.location.c.postcode),
+        SnapshotColumn('latitude', 'number', 'd', orm.coordinates.c.latitude),
+        SnapshotColumn('longitude', 'number', 'd', orm.coordinates.c.longitude),
+        SnapshotColumn('timezone', 'category', 'i', orm.timezone.c.description),
+        SnapshotColumn('nat', 'category', 'i', orm.nat.c.name),
+    )
+
+
+def _new_meta(columns) -> Dict[str, Any]:
+    return {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'rows': 0,
+        'last_user_id': 0,
+        'columns': {column.name: {'kind': column.kind, 'typecode': column.typecode}
+                    for column in columns},
+        'categories': {column.name: [] for column in columns if column.kind == 'category'},
+        'blob_sizes': {column.name: 0 for column in columns if column.kind == 'text'},
+    }
+
+
+def _read_meta(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    if meta.get('version') != FORMAT_VERSION or meta.get('byteorder') != sys.byteorder:
+        raise RepositoryException(f'Incompatible snapshot in {path}')
+
+    return meta
+
+
+def _write_meta(path: str, meta: Dict[str, Any]):
+    temporary = os.path.join(path, META_FILE + '.tmp')
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+    os.replace(temporary, os.path.join(path, META_FILE))
+
+
+def _data_file(path: str, name: str, kind: str) -> str:
+    return os.path.join(path, name + ('.offsets' if kind == 'text' else '.col'))
+
+
+def _truncate(path: str, size: int):
+    """ Drop data appended by an interrupted refresh, not covered by meta.json """
+
+    try:
+        if os.path.getsize(path) > size:
+            os.truncate(path, size)
+    except FileNotFoundError:
+        pass
+
+
+def _encode(kind: str, value, codes: Dict[Any, int], categories: List):
+    if kind == 'number':
+        return value if value is not None else 0
+    if kind == 'date':
+        return value.toordinal() if value is not None else 0
+    if kind == 'category':
+        if value is None:
+            return -1
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(categories)
+            categories.append(value)
+        return code
+
+    raise ValueError(f'Not a fixed size column kind: {kind}')
+
+
+def refresh_snapshot(connectable, path: str, chunk_size: int = 10000) -> int:
+    """
+    Create snapshot or append users added since the last refresh, i.e. with id
+    greater than the last exported one. Changes of already exported users are
+    not picked up, remove the directory to rebuild from scratch.
+    :param connectable: Engine, connection or session of the people database
+    :param path: Directory of the snapshot, created when missing
+    :param chunk_size: Number of rows fetched and written at once
+    :return: Number of appended rows
+    """
+
+    columns = snapshot_columns()
+    os.makedirs(path, exist_ok=True)
+    meta = _read_meta(path) or _new_meta(columns)
+
+    for column in columns:
+        itemsize = array(column.typecode).itemsize
+        _truncate(_data_file(path, column.name, column.kind), meta['rows'] * itemsize)
+        if column.kind == 'text':
+            _truncate(os.path.join(path, column.name + '.blob'),
+                      meta['blob_sizes'][column.name])
+
+    query = select([column.source for column in columns]).select_from(
+        orm.user
+        .join(orm.person)
+        .join(orm.login_info)
+        .join(orm.contact_info)
+        .outerjoin(orm.location)
+        .outerjoin(orm.coordinates)
+        .outerjoin(orm.timezone)
+        .outerjoin(orm.nat)
+    ).where(orm.user.c.id > meta['last_user_id']).order_by(orm.user.c.id)
+
+    categories = meta['categories']
+    codes = {name: {value: code for code, value in enumerate(values)}
+             for name, values in categories.items()}
+    appended = 0
+    files = {}
+    result = connectable.execute(query)
+
+    try:
+        for column in columns:
+            files[column.name] = open(_data_file(path, column.name, column.kind), 'ab')
+            if column.kind == 'text':
+                files[column.name + '.blob'] = open(
+                    os.path.join(path, column.name + '.blob'), 'ab')
+
+        rows = result.fetchmany(chunk_size)
+        while rows:
+            for position, column in enumerate(columns):
+                values = [row[position] for row in rows]
+                if column.kind == 'text':
+                    encoded = [(value or '').encode('utf-8') for value in values]
+                    data = array(column.typecode)
+                    end = meta['blob_sizes'][column.name]
+                    for value in encoded:
+                        end += len(value)
+                        data.append(end)
+                    files[column.name + '.blob'].write(b''.join(encoded))
+                    meta['blob_sizes'][column.name] = end
+                elif column.typecode == 'd':
+                    data = array('d', (float('nan') if value is None else value
+                                       for value in values))
+                else:
+                    data = array(column.typecode, (
+                        _encode(column.kind, value, codes.get(column.name),
+                                categories.get(column.name))
+                        for value in values))
+                data.tofile(files[column.name])
+
+            appended += len(rows)
+            meta['last_user_id'] = rows[-1][0]
+            rows = result.fetchmany(chunk_size)
+    finally:
+        result.close()
+        for file in files.values():
+            file.close()
+
+    meta['rows'] += appended
+    _write_meta(path, meta)
+
+    return appended
+
+
+class Snapshot:
+    """ Memory mapped snapshot written by refresh_snapshot """
+
+    def __init__(self, path: str):
+        meta = _read_meta(path)
+        if meta is None:
+            raise RepositoryException(f'No snapshot in {path}')
+
+        self.path = path
+        self.meta = meta
+        self._maps = []
+        self._views = []
+        self._columns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def last_user_id(self) -> int:
+        return self.meta['last_user_id']
+
+    def close(self):
+        """ Unmap files, columns returned before can not be used afterwards """
+
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._views, self._maps, self._columns = [], [], {}
+
+    def _kind(self, name: str) -> str:
+        try:
+            return self.meta['columns'][name]['kind']
+        except KeyError:
+            raise RepositoryException(f'Invalid snapshot column: {name}')
+
+    def _map(self, file_path: str, typecode: str, length: int) -> memoryview:
+        if length == 0:
+            return memoryview(array(typecode))
+
+        with open(file_path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), length * array(typecode).itemsize,
+                               access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        view = memoryview(mapped)
+        self._views.append(view)
+        cast = view.cast(typecode)
+        self._views.append(cast)
+
+        return cast
+
+    def column(self, name: str) -> memoryview:
+        """
+        Raw values of the column, without copying; offsets for 'text' columns
+        :param name: Name of the column
+        :return: Memoryview of the mapped file
+        """
+
+        if name not in self._columns:
+            kind = self._kind(name)
+            self._columns[name] = self._map(_data_file(self.path, name, kind),
+                                            self.meta['columns'][name]['typecode'],
+                                            len(self))
+
+        return self._columns[name]
+
+    def values(self, name: str) -> Iterator:
+        """
+        Decoded values of the column
+        :param name: Name of the column
+        :return: Iterator of values, None for missing ones
+        """
+
+        kind = self._kind(name)
+        raw = self.column(name)
+
+        if kind == 'category':
+            categories = self.meta['categories'][name] + [None]
+            return (categories[code] for code in raw)
+        if kind == 'date':
+            return (datetime.date.fromordinal(day) if day else None for day in raw)
+        if kind == 'text':
+            return self._texts(name, raw)
+
+        return iter(raw)
+
+    def _texts(self, name: str, offsets: memoryview) -> Iterator[str]:
+        key = name + '.blob'
+        if key not in self._columns:
+            self._columns[key] = self._map(os.path.join(self.path, key), 'B',
+                                           self.meta['blob_sizes'][name])
+        blob = self._columns[key]
+        start = 0
+        for end in offsets:
+            yield str(blob[start:end], 'utf-8')
+            start = end
+
+    def count_by(self, name: str, limit: int = None,
+                 descending: bool = True) -> List[Tuple[Any, int]]:
+        """
+        Snapshot counterpart of SqlAlchemyRepository.group_by_and_count
+        :param name: Name of the column to group by
+        :param limit: Limit results - optional
+        :param descending: Most common values first, default
+        :return: List of (value, count)
+        """
+
+        kind = self._kind(name)
+        if kind == 'text':
+            counts = list(Counter(self.values(name)).items())
+        else:
+            counts = [(self._decode(name, kind, value), count)
+                      for value, count in self._count_raw(name, kind)]
+
+        if descending:
+            counts.sort(key=lambda item: item[1], reverse=True)
+
+        return counts[:limit] if limit else counts
+
+    def _count_raw(self, name: str, kind: str) -> List[Tuple[Any, int]]:
+        """ Counts of raw values of fixed size column, decoded by the caller """
+
+        column = self.column(name)
+        if numpy is None:
+            return list(Counter(column).items())
+
+        values = numpy.frombuffer(column, dtype=column.format)
+        if kind == 'category':
+            # codes are assigned in order of first appearance, -1 counted last
+            counts = numpy.bincount(values + 1, minlength=1).tolist()
+            return [(code, count) for code, count in enumerate(counts[1:]) if count] + (
+                [(-1, counts[0])] if counts[0] else [])
+
+        unique, counts = numpy.unique(values, return_counts=True)
+        return list(zip(unique.tolist(), counts.tolist()))
+
+    def _decode(self, name: str, kind: str, value):
+        if kind == 'category':
+            return self.meta['categories'][name][value] if value >= 0 else None
+        if kind == 'date':
+            return datetime.date.fromordinal(value) if value else None
+
+        return value
+
+    def filter_by_date(self, name: str, date_1: datetime.date,
+                       date_2: datetime.date) -> List[int]:
+        """
+        Snapshot counterpart of filter_person_by_date_of_birth for any date column
+        :param name: Name of the date column
+        :param date_1: Earlier date to match
+        :param date_2: Later date to match
+        :return: Ids of matching users
+        """
+
+        if self._kind(name) != 'date':
+            raise RepositoryException(f'Not a date column: {name}')
+
+        first, last = date_1.toordinal(), date_2.toordinal()
+        days, user_ids = self.column(name), self.column('user_id')
+        if numpy is not None:
+            days = numpy.frombuffer(days, dtype=days.format)
+            user_ids = numpy.frombuffer(user_ids, dtype=user_ids.format)
+            return user_ids[(days >= first) & (days <= last)].tolist()
+
+        return [user_id for user_id, day in zip(user_ids, days) if first <= day <= last]
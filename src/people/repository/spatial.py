@@ -0,0 +1,269 @@
+""" Bounding-box, radius and nearest-neighbour queries over coordinates of users
+
+An SQLite R*Tree table, coordinates_rtree, holds one point per coordinates row,
+with id equal to the coordinates id. Triggers on coordinates keep it in sync
+with every insert, update and delete, whether done by the ORM, bulk writes or
+raw SQL. It is created along with the schema by metadata.create_all and filled
+from existing coordinates by upgrade_schema.
+
+The R*Tree narrows queries down to points inside a box; radius and nearest
+queries then rank those candidates by exact haversine distance. R*Tree stores
+32-bit floats rounded outwards, so boxes never miss a point, and every
+candidate is checked against the stored 64-bit coordinates.
+
+The R*Tree is created only where the SQLite build has the rtree module.
+Without it queries fall back to a range scan of the unique
+(latitude, longitude) index of coordinates.
+"""
+
+from math import asin, cos, degrees, pi, radians, sin, sqrt
+from typing import List, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.virtual_tables import VirtualTables
+
+SPATIAL_TABLE = 'coordinates_rtree'
+SPATIAL_TABLES = (SPATIAL_TABLE,)
+
+_PRESENT = VirtualTables(SPATIAL_TABLES)
+
+# Mean radius of the Earth
+EARTH_RADIUS_KM = 6371.0088
+
+# Distance beyond which a circle covers the whole Earth
+HALF_CIRCUMFERENCE_KM = pi * EARTH_RADIUS_KM
+
+# First radius tried by nearest, grown GROWTH times until enough users fit in
+NEAREST_START_KM = 10.0
+NEAREST_GROWTH = 4
+
+# South, west, north and east edges, in degrees
+Box = Tuple[float, float, float, float]
+
+_CANDIDATES = (
+    f'SELECT u.id, c.latitude, c.longitude FROM {SPATIAL_TABLE} AS r '
+    f'JOIN coordinates AS c ON c.id = r.id '
+    f'JOIN location AS loc ON loc.coordinates_id = c.id '
+    f'JOIN "user" AS u ON u.location_info_id = loc.id '
+    f'WHERE r.min_lat <= :north AND r.max_lat >= :south '
+    f'AND r.min_lon <= :east AND r.max_lon >= :west'
+)
+
+# Candidates without the R*Tree
+_SCANNED_CANDIDATES = (
+    'SELECT u.id, c.latitude, c.longitude FROM coordinates AS c '
+    'JOIN location AS loc ON loc.coordinates_id = c.id '
+    'JOIN "user" AS u ON u.location_info_id = loc.id '
+    'WHERE c.latitude BETWEEN :south AND :north '
+    'AND c.longitude BETWEEN :west AND :east'
+)
+
+_POINT = 'SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude ' \
+         'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;'
+
+_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_insert AFTER INSERT ON coordinates '
+    f'BEGIN INSERT INTO {SPATIAL_TABLE} {_POINT} END',
+    f'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_delete AFTER DELETE ON coordinates '
+    f'BEGIN DELETE FROM {SPATIAL_TABLE} WHERE id = old.id; END',
+    f'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_update '
+    f'AFTER UPDATE OF id, latitude, longitude ON coordinates BEGIN '
+    f'DELETE FROM {SPATIAL_TABLE} WHERE id = old.id; '
+    f'INSERT INTO {SPATIAL_TABLE} {_POINT} END',
+)
+
+_TRIGGER_NAMES = ('coordinates_rtree_insert', 'coordinates_rtree_delete',
+                  'coordinates_rtree_update')
+
+_FILL = (f'INSERT INTO {SPATIAL_TABLE} SELECT id, latitude, latitude, longitude, longitude '
+         f'FROM coordinates WHERE latitude IS NOT NULL AND longitude IS NOT NULL')
+
+
+def spatial_index_supported(connection) -> bool:
+    """ Whether the SQLite build has the rtree module, probed with a throwaway temporary table """
+
+    try:
+        connection.execute('CREATE VIRTUAL TABLE temp.spatial_probe USING rtree(id, a, b)')
+    except OperationalError:
+        return False
+    connection.execute('DROP TABLE temp.spatial_probe')
+
+    return True
+
+
+def spatial_index_exists(connection) -> bool:
+    return SPATIAL_TABLE in _PRESENT.lookup(connection)
+
+
+def create_spatial_index(connection) -> List[str]:
+    """
+    Create spatial table missing in the database, where supported, and fill it
+    from existing coordinates, along with triggers keeping it in sync. Safe to
+    run repeatedly.
+    :param connection: Connection to SQLite database
+    :return: Names of created spatial tables
+    """
+
+    _PRESENT.forget(connection)
+    created = []
+    if not spatial_index_exists(connection):
+        if not spatial_index_supported(connection):
+            return created
+        connection.execute(f'CREATE VIRTUAL TABLE {SPATIAL_TABLE} USING rtree('
+                           f'id, min_lat, max_lat, min_lon, max_lon)')
+        connection.execute(_FILL)
+        created.append(SPATIAL_TABLE)
+    for trigger in _TRIGGERS:
+        connection.execute(trigger)
+
+    return created
+
+
+def drop_spatial_index(connection):
+    _PRESENT.forget(connection)
+    for trigger in _TRIGGER_NAMES:
+        connection.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    for table in SPATIAL_TABLES:
+        connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def rebuild_spatial_index(connection):
+    """ Refill spatial table from coordinates, e.g. after restoring a backup taken without it """
+
+    if spatial_index_exists(connection):
+        connection.execute(f'DELETE FROM {SPATIAL_TABLE}')
+        connection.execute(_FILL)
+
+
+def haversine(latitude_1: float, longitude_1: float, latitude_2: float,
+              longitude_2: float) -> float:
+    """
+    Great-circle distance between two points
+    :return: Distance in kilometres
+    """
+
+    phi_1, phi_2 = radians(latitude_1), radians(latitude_2)
+    a = (sin((phi_2 - phi_1) / 2) ** 2 +
+         cos(phi_1) * cos(phi_2) * sin(radians(longitude_2 - longitude_1) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def _check_point(latitude: float, longitude: float):
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise RepositoryException(f'Invalid point: {latitude}, {longitude}')
+
+
+def _split_antimeridian(south: float, west: float, north: float, east: float) -> List[Box]:
+    """ Boxes with west edge past east edge, or edges past +-180, as boxes within -180..180 """
+
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    if west > east:
+        return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+    return [(south, west, north, east)]
+
+
+def circle_boxes(latitude: float, longitude: float, radius_km: float) -> List[Box]:
+    """
+    Boxes covering every point within radius of the centre
+    :param latitude: Latitude of the centre
+    :param longitude: Longitude of the centre
+    :param radius_km: Radius in kilometres
+    :return: One box, or two when the circle crosses the antimeridian
+    """
+
+    angle = min(radius_km / EARTH_RADIUS_KM, pi)
+    south, north = latitude - degrees(angle), latitude + degrees(angle)
+    if south <= -90 or north >= 90:
+        # Circle covers a pole, and with it every longitude
+        return [(max(south, -90.0), -180.0, min(north, 90.0), 180.0)]
+
+    spread = degrees(asin(sin(angle) / cos(radians(latitude))))
+    return _split_antimeridian(south, longitude - spread, north, longitude + spread)
+
+
+def _candidates(session, boxes: List[Box]) -> List[Tuple[int, float, float]]:
+    """ Users located in the boxes, along with their exact latitude and longitude """
+
+    query = _CANDIDATES if SPATIAL_TABLE in _PRESENT.present(session) else _SCANNED_CANDIDATES
+    found = {}
+    for south, west, north, east in boxes:
+        for user_id, latitude, longitude in session.execute(
+                query, dict(south=south, west=west, north=north, east=east)):
+            if south <= latitude <= north and west <= longitude <= east:
+                found[user_id] = (user_id, latitude, longitude)
+
+    return list(found.values())
+
+
+def within_box(session, south: float, west: float, north: float,
+               east: float) -> List[int]:
+    """
+    Find users located within the box. Box with west edge east of its east
+    edge crosses the antimeridian.
+    :param session: Session of the people database
+    :return: Ids of users, ascending
+    """
+
+    _check_point(south, west)
+    _check_point(north, east)
+    if south > north:
+        raise RepositoryException(f'Invalid box: south {south} is north of {north}')
+
+    return sorted(user_id for user_id, _, _ in _candidates(
+        session, _split_antimeridian(south, west, north, east)))
+
+
+def within_radius(session, latitude: float, longitude: float,
+                  radius_km: float) -> List[Tuple[int, float]]:
+    """
+    Find users located within radius of the centre
+    :param session: Session of the people database
+    :param latitude: Latitude of the centre
+    :param longitude: Longitude of the centre
+    :param radius_km: Radius in kilometres
+    :return: Ids of users along with distances in kilometres, nearest first
+    """
+
+    _check_point(latitude, longitude)
+    if radius_km < 0:
+        raise RepositoryException(f'Invalid radius: {radius_km}')
+
+    found = []
+    for user_id, user_latitude, user_longitude in _candidates(
+            session, circle_boxes(latitude, longitude, radius_km)):
+        distance = haversine(latitude, longitude, user_latitude, user_longitude)
+        if distance <= radius_km:
+            found.append((distance, user_id))
+    found.sort()
+
+    return [(user_id, distance) for distance, user_id in found]
+
+
+def nearest(session, latitude: float, longitude: float,
+            count: int) -> List[Tuple[int, float]]:
+    """
+    Find users nearest to the point, searching growing circles around it until
+    enough users fit in
+    :param session: Session of the people database
+    :param latitude: Latitude of the point
+    :param longitude: Longitude of the point
+    :param count: Number of users to find
+    :return: Ids of users along with distances in kilometres, nearest first
+    """
+
+    if count < 1:
+        raise RepositoryException(f'Invalid count: {count}')
+
+    radius_km = NEAREST_START_KM
+    while True:
+        found = within_radius(session, latitude, longitude, radius_km)
+        if len(found) >= count or radius_km >= HALF_CIRCUMFERENCE_KM:
+            return found[:count]
+        radius_km = min(radius_km * NEAREST_GROWTH, HALF_CIRCUMFERENCE_KM)
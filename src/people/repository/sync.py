@@ -0,0 +1,196 @@
+""" Synchronization of re-imported users with the stored ones, keyed on login uuid
+
+Every user row keeps a hash of its flattened graph. Users whose hash did not
+change are skipped without writes; for changed ones only rows whose values
+differ are updated.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select
+
+from src.people.repository import orm
+from src.people.repository.bulk import DIMENSION_KEYS, ENTITY_TABLES, MAX_IN_CLAUSE, \
+    BulkUserWriter, UserRows, batched, content_hash, with_phone_digits
+from src.people.repository.exceptions import RepositoryException
+
+# Foreign keys of user row pointing to rows of the user graph
+USER_FOREIGN_KEYS = {
+    'person': 'person_id',
+    'login_info': 'login_info_id',
+    'contact_info': 'contact_info_id',
+    'personal_id': 'personal_id_id',
+    'location': 'location_info_id',
+}
+
+
+@dataclass
+class SyncReport:
+    """ Numbers of users inserted, updated and left unchanged by synchronization """
+
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    def __add__(self, other: 'SyncReport') -> 'SyncReport':
+        return SyncReport(self.inserted + other.inserted, self.updated + other.updated,
+                          self.unchanged + other.unchanged)
+
+    def __str__(self):
+        return (f'{self.inserted} inserted, {self.updated} updated, '
+                f'{self.unchanged} unchanged')
+
+
+class _Stored:
+    """ User row found by uuid: its id, ids of its graph rows and content hash """
+
+    __slots__ = ('id', 'ids', 'hash')
+
+    def __init__(self, user_id: int, ids: Dict[str, Optional[int]], hash_: Optional[str]):
+        self.id = user_id
+        self.ids = ids
+        self.hash = hash_
+
+
+class UserSynchronizer(BulkUserWriter):
+    """ Inserts new users of a batch and updates changed ones, in executemany statements """
+
+    def sync(self, batch: List[UserRows]) -> SyncReport:
+        """
+        Synchronize batch of flattened users with the stored ones. Later users of
+        the batch win over earlier ones with the same uuid.
+        :param batch: Users flattened with user_to_rows
+        :return: Sync report
+        """
+
+        by_uuid = {}
+        for rows in batch:
+            uuid = rows['login_info'] and rows['login_info'].get('uuid')
+            if uuid is None:
+                raise RepositoryException('Users without login uuid can not be synchronized')
+            by_uuid[uuid] = rows
+
+        stored = self._lookup_users(list(by_uuid))
+        new, changed, unchanged = [], [], 0
+        for uuid, rows in by_uuid.items():
+            user = stored.get(uuid)
+            if user is None:
+                new.append(rows)
+            elif user.hash != content_hash(rows):
+                changed.append((user, rows))
+            else:
+                unchanged += 1
+
+        inserted = self.write(new)
+        updated = self._update(changed)
+
+        return SyncReport(inserted, updated, unchanged + len(changed) - updated)
+
+    def _lookup_users(self, uuids: List[str]) -> Dict[str, _Stored]:
+        user = orm.user
+        query = select([orm.login_info.c.uuid, user.c.id, user.c.content_hash] +
+                       [user.c[column] for column in USER_FOREIGN_KEYS.values()]) \
+            .select_from(user.join(orm.login_info))
+
+        stored = {}
+        for chunk in batched(uuids, MAX_IN_CLAUSE):
+            for uuid, user_id, hash_, *ids in self.session.execute(
+                    query.where(orm.login_info.c.uuid.in_(chunk))):
+                stored[uuid] = _Stored(user_id, dict(zip(USER_FOREIGN_KEYS, ids)), hash_)
+
+        return stored
+
+    def _update(self, changed: List[Tuple[_Stored, UserRows]]) -> int:
+        """
+        Write differences of changed users, rows with equal values are not touched
+        :param changed: Stored users along with their new flattened graphs
+        :return: Number of users with at least one changed row
+        """
+
+        if not changed:
+            return 0
+
+        dimension_ids = {
+            name: self._resolve_dimension(name, [rows[name] for _, rows in changed])
+            for name in DIMENSION_KEYS
+        }
+        new_rows = {name: [rows[name] for _, rows in changed] for name in ENTITY_TABLES}
+        new_rows['contact_info'] = with_phone_digits(new_rows['contact_info'])
+        new_rows['location'] = [self._location_row(rows, dimension_ids)
+                                for _, rows in changed]
+
+        differs = [False] * len(changed)
+        new_ids = [dict(user.ids) for user, _ in changed]
+        deletes = {}
+        for name, rows in new_rows.items():
+            table = orm.metadata.tables[name]
+            stored_ids = [user.ids[name] for user, _ in changed]
+            current = self._fetch(table, [row_id for row_id in stored_ids
+                                          if row_id is not None])
+
+            updates, inserts = [], []
+            for position, (row_id, row) in enumerate(zip(stored_ids, rows)):
+                if row is None and row_id is None:
+                    continue
+                if row is None:
+                    deletes.setdefault(table, []).append(row_id)
+                    new_ids[position][name] = None
+                elif row_id is None:
+                    inserts.append((position, row))
+                elif current.get(row_id) != row:
+                    updates.append(dict(row, b_id=row_id))
+                else:
+                    continue
+                differs[position] = True
+
+            if updates:
+                self.session.execute(
+                    table.update().where(table.c.id == bindparam('b_id')), updates)
+            inserted_ids = self._insert(table, [dict(row) for _, row in inserts])
+            for (position, _), row_id in zip(inserts, inserted_ids):
+                new_ids[position][name] = row_id
+
+        self._write_user_rows(changed, new_ids)
+        for table, ids in deletes.items():
+            for chunk in batched(ids, MAX_IN_CLAUSE):
+                self.session.execute(table.delete().where(table.c.id.in_(chunk)))
+
+        return sum(differs)
+
+    def _write_user_rows(self, changed: List[Tuple[_Stored, UserRows]],
+                         new_ids: List[Dict[str, Optional[int]]]):
+        """ Point users to inserted and away from deleted rows, record new hashes """
+
+        relinked, rehashed = [], []
+        for (user, rows), ids in zip(changed, new_ids):
+            values = dict(b_id=user.id, content_hash=content_hash(rows))
+            if ids != user.ids:
+                values.update({USER_FOREIGN_KEYS[name]: row_id for name, row_id in ids.items()})
+                relinked.append(values)
+            else:
+                rehashed.append(values)
+
+        table = orm.user
+        # Foreign keys are set only when they change, keeping search triggers quiet
+        for rows in (relinked, rehashed):
+            if rows:
+                self.session.execute(
+                    table.update().where(table.c.id == bindparam('b_id')), rows)
+
+    def _fetch(self, table, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """ Stored values of rows, in the shape of their new rows """
+
+        columns = [column for column in table.columns if not column.primary_key]
+        current = {}
+        for chunk in batched(ids, MAX_IN_CLAUSE):
+            query = select([table.c.id] + columns).where(table.c.id.in_(chunk))
+            for row_id, *values in self.session.execute(query):
+                current[row_id] = {column.name: value
+                                   for column, value in zip(columns, values)}
+
+        return current
@@ -0,0 +1,57 @@
+""" Optional SQLite virtual tables present in databases, looked up once per engine
+
+Search and spatial queries choose their SQL by whether their virtual tables
+exist. Looking them up in sqlite_master on every query would add a statement
+to each of them, so the answer is remembered per engine and forgotten whenever
+the tables are created or dropped through this package.
+"""
+
+import weakref
+from typing import Sequence, Tuple
+
+
+def _engine(connectable):
+    """ Engine of engine, connection or session """
+
+    engine = getattr(connectable, 'engine', None)
+    return engine if engine is not None else connectable.get_bind()
+
+
+class VirtualTables:
+    """ Which of given tables are present, per engine """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        self._present = weakref.WeakKeyDictionary()
+
+    def lookup(self, connectable) -> Tuple[str, ...]:
+        """
+        Tables present in the database, without remembering them
+        :param connectable: Engine, connection or session of SQLite database
+        :return: Names of present tables, in order of names
+        """
+
+        present = {name for name, in connectable.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN "
+            f"({', '.join(repr(name) for name in self.names)})")}
+
+        return tuple(name for name in self.names if name in present)
+
+    def present(self, connectable) -> Tuple[str, ...]:
+        """
+        Tables present in the database, looked up on the first call per engine
+        :param connectable: Engine, connection or session of SQLite database
+        :return: Names of present tables, in order of names
+        """
+
+        engine = _engine(connectable)
+        present = self._present.get(engine)
+        if present is None:
+            present = self._present[engine] = self.lookup(connectable)
+
+        return present
+
+    def forget(self, connectable):
+        """ Look tables up again on next call, after they were created or dropped """
+
+        self._present.pop(_engine(connectable), None)
@@ -0,0 +1,182 @@
+""" Awaitable unit of work for asyncio applications
+
+SQLAlchemy 1.3 has no asyncio support, so the synchronous unit of work runs on a
+worker thread started by `async with` and stopped when the block exits. Awaiting
+database calls frees the event loop for other tasks, such as downloading the
+next page of users.
+
+Models returned by queries are detached on the worker thread, with their related
+single objects loaded, so reading e.g. user.person on the event loop does not
+touch the session of another thread. Collections such as nat.locations are not
+loaded. Changes to returned models are not saved, write through the repository.
+As every unit of work runs on its own thread, in-memory SQLite databases, whose
+connections are per thread, are not shared between units of work.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Iterable
+
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+
+
+def _detach(session, result: Any) -> Any:
+    """
+    Load single-object relationships of models in the result, recursively, and
+    expunge the models from session. Runs on the worker thread.
+    :param session: Session the result was loaded with
+    :param result: Model, or list or tuple of models and other values
+    :return: The result
+    """
+
+    from sqlalchemy import inspect
+    from sqlalchemy.orm.state import InstanceState
+
+    pending = [result]
+    seen = {}
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (list, tuple)):
+            pending.extend(value)
+            continue
+        state = inspect(value, raiseerr=False)
+        if not isinstance(state, InstanceState) or id(value) in seen:
+            continue
+        seen[id(value)] = state
+        for relationship in state.mapper.relationships:
+            if not relationship.uselist:
+                pending.append(getattr(value, relationship.key))
+
+    # Expunged only once loaded, so lazy loads find related models in identity map
+    for state in seen.values():
+        if state.persistent:
+            session.expunge(state.obj())
+
+    return result
+
+
+class AsyncSqlAlchemyRepository:
+    """ Awaitable counterpart of SqlAlchemyRepository """
+
+    def __init__(self, run, repository):
+        self._run = run
+        self._repository = repository
+
+    async def _query(self, function, *args, **kwargs):
+        def query():
+            return _detach(self._repository.session, function(*args, **kwargs))
+
+        return await self._run(query)
+
+    async def add(self, model):
+        return await self._run(self._repository.add, model)
+
+    async def add_many(self, users: Iterable, batch_size: int = 1000) -> int:
+        return await self._run(self._repository.add_many, users, batch_size)
+
+    async def sync_users(self, users: Iterable, batch_size: int = 1000):
+        return await self._run(self._repository.sync_users, users, batch_size)
+
+    async def get(self, model, model_id: str):
+        return await self._query(self._repository.get, model, model_id)
+
+    async def filter_model_by(self, model, **filters):
+        return await self._query(self._repository.filter_model_by, model, **filters)
+
+    async def filter_person_by_date_of_birth(self, date_1, date_2):
+        return await self._query(self._repository.filter_person_by_date_of_birth,
+                               date_1, date_2)
+
+    async def group_by_and_count(self, model, column, limit: int = None,
+                                 descending: bool = True):
+        return await self._query(self._repository.group_by_and_count, model, column,
+                               limit, descending)
+
+    async def aggregate(self, group_by, aggregates=('count',), filters=None,
+                        order_by=None, limit: int = None, today=None):
+        return await self._query(self._repository.aggregate, group_by, aggregates, filters,
+                               order_by, limit, today)
+
+    async def search_users(self, text: str, fields=None, limit: int = 20,
+                           profile: str = 'summary'):
+        return await self._query(self._repository.search_users, text, fields, limit, profile)
+
+    async def fuzzy_search_users(self, text: str, limit: int = 20, cutoff: float = 0.6,
+                                 profile: str = 'summary'):
+        return await self._query(self._repository.fuzzy_search_users, text, limit, cutoff,
+                               profile)
+
+    async def find_users_by_phone(self, number: str, profile: str = 'summary'):
+        return await self._query(self._repository.find_users_by_phone, number, profile)
+
+    async def users_within_box(self, south: float, west: float, north: float, east: float,
+                               profile: str = 'summary'):
+        return await self._query(self._repository.users_within_box, south, west, north, east,
+                               profile)
+
+    async def users_within_radius(self, latitude: float, longitude: float,
+                                  radius_km: float, profile: str = 'summary'):
+        return await self._query(self._repository.users_within_radius, latitude, longitude,
+                               radius_km, profile)
+
+    async def nearest_users(self, latitude: float, longitude: float, count: int = 10,
+                            profile: str = 'summary'):
+        return await self._query(self._repository.nearest_users, latitude, longitude, count,
+                               profile)
+
+
+class AsyncSqlAlchemyDbConnection:
+    """ Async context manager committing or rolling back SqlAlchemyDbConnection """
+
+    def __init__(self, session_factory=None, dimensions=None, profile=None,
+                 result_cache=None, instrumentation=None):
+        self._connection = SqlAlchemyDbConnection(session_factory, dimensions, profile,
+                                                  result_cache, instrumentation)
+        self._executor = None
+
+    @property
+    def dimensions(self):
+        return self._connection.dimensions
+
+    async def __aenter__(self):
+        if self._executor is not None:
+            raise RuntimeError('Unit of work is already in progress')
+        # Single thread serializes session use and keeps SQLite connections on the
+        # thread that created them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='people-db')
+        try:
+            await self._run(self._connection.__enter__)
+        except BaseException:
+            self._shutdown()
+            raise
+        self.database = AsyncSqlAlchemyRepository(self._run, self._connection.database)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self._run(self._connection.__exit__, exc_type, exc_val, exc_tb)
+        finally:
+            self._shutdown()
+
+    async def commit(self):
+        await self._run(self._connection.commit)
+
+    async def rollback(self):
+        await self._run(self._connection.rollback)
+
+    def close(self):
+        """ Stop worker thread of unit of work left unfinished, e.g. by a cancelled task """
+
+        self._shutdown()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(function, *args, **kwargs))
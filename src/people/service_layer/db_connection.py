@@ -1,9 +1,21 @@
+""" Units of work. SQLAlchemy is imported on first use, keeping the import cheap
+for processes that never touch the database. """
+
 import abc
+import os
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Optional, TYPE_CHECKING
+
+from src.people.service_layer.instrumentation import Instrumentation, \
+    InstrumentedRepository, UnitOfWorkTimer, current as current_instrumentation
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+if TYPE_CHECKING:
+    from src.people.repository.dimension_cache import DimensionCache
+    from src.people.repository.result_cache import ResultCache
 
-from src.people.repository.repository import SqlAlchemyRepository
+DATABASE_URL_VARIABLE = 'PEOPLE_DATABASE_URL'
+PROFILE_VARIABLE = 'PEOPLE_DB_PROFILE'
 
 
 class AbstractDbConnection(abc.ABC):
@@ -27,29 +39,190 @@ class AbstractDbConnection(abc.ABC):
         raise NotImplementedError
 
 
-DEFAULT_SESSION_FACTORY = sessionmaker(bind=create_engine(
-    'sqlite:///ppl_db.db'
-))
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    """
+    Settings of engine, pragmas are applied on SQLite only and pool settings on
+    databases using connection pool. None leaves the driver default.
+    """
+
+    url: str = 'sqlite:///ppl_db.db'
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    cache_size: Optional[int] = None
+    mmap_size: Optional[int] = None
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    pool_recycle: Optional[int] = None
+    pool_pre_ping: bool = False
+
+    def __post_init__(self):
+        if self.journal_mode is not None and self.journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f'Invalid journal mode: {self.journal_mode}')
+        if self.synchronous is not None and self.synchronous.upper() not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f'Invalid synchronous level: {self.synchronous}')
+
+    @property
+    def pragmas(self):
+        pragmas = dict(journal_mode=self.journal_mode, synchronous=self.synchronous,
+                       cache_size=self.cache_size, mmap_size=self.mmap_size)
+
+        return {name: value for name, value in pragmas.items() if value is not None}
+
+    def create_engine(self):
+        """
+        Create engine configured with this profile
+        :return: Engine
+        """
+
+        from sqlalchemy import create_engine, event
+
+        options = dict(pool_size=self.pool_size, max_overflow=self.max_overflow,
+                       pool_recycle=self.pool_recycle)
+        engine = create_engine(self.url, pool_pre_ping=self.pool_pre_ping,
+                               **{name: value for name, value in options.items()
+                                  if value is not None})
+
+        pragmas = self.pragmas
+        if engine.dialect.name == 'sqlite' and pragmas:
+            @event.listens_for(engine, 'connect')
+            def set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+                cursor.close()
+
+        return engine
+
+
+DEFAULT_PROFILE = EngineProfile()
+
+# Write ahead log lets readers run alongside the writer, synchronous NORMAL is
+# still durable in WAL mode apart from power loss
+FAST_SQLITE_PROFILE = EngineProfile(journal_mode='WAL', synchronous='NORMAL',
+                                    cache_size=-64000, mmap_size=256 * 2 ** 20)
+
+PROFILES = {
+    'default': DEFAULT_PROFILE,
+    'fast': FAST_SQLITE_PROFILE,
+}
+
+_configured_profile: Optional[EngineProfile] = None
+
+
+def configure(profile: Optional[EngineProfile]):
+    """
+    Set profile used by connections created without one, None restores the one
+    resolved from the environment
+    :param profile: Engine profile
+    :return:
+    """
+
+    global _configured_profile
+    _configured_profile = profile
+
+
+def default_profile() -> EngineProfile:
+    """
+    Profile used by connections created without one: the configured one, or the
+    one named by PEOPLE_DB_PROFILE with url taken from PEOPLE_DATABASE_URL
+    :return: Engine profile
+    """
+
+    if _configured_profile is not None:
+        return _configured_profile
+
+    name = os.environ.get(PROFILE_VARIABLE, 'default')
+    try:
+        profile = PROFILES[name]
+    except KeyError:
+        raise ValueError(f'Invalid {PROFILE_VARIABLE}: {name}')
+
+    url = os.environ.get(DATABASE_URL_VARIABLE)
+    return replace(profile, url=url) if url else profile
+
+
+@lru_cache(maxsize=None)
+def session_factory_for(profile: EngineProfile):
+    """
+    Get session factory of given profile, engine and its pool are created on the
+    first call and shared afterwards
+    :param profile: Engine profile
+    :return: Session factory
+    """
+
+    from sqlalchemy.orm import sessionmaker
+
+    return sessionmaker(bind=profile.create_engine())
+
+
+def __getattr__(name: str):
+    # DEFAULT_SESSION_FACTORY is resolved on access, creating the engine of the
+    # default profile only when it is used
+    if name == 'DEFAULT_SESSION_FACTORY':
+        return session_factory_for(default_profile())
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class SqlAlchemyDbConnection(AbstractDbConnection):
     """ Db Connection class for SqlAlchemy orm """
 
-    def __init__(self, session_factory=DEFAULT_SESSION_FACTORY):
+    def __init__(self, session_factory=None, dimensions: 'DimensionCache' = None,
+                 profile: EngineProfile = None, result_cache: 'ResultCache' = None,
+                 instrumentation: Instrumentation = None):
         self.session_factory = session_factory
+        self.dimensions = dimensions
+        self.profile = profile
+        # Shared between units of work, commits drop results of written tables
+        self.result_cache = result_cache
+        self.instrumentation = instrumentation
+        self._timer = None
 
     def __enter__(self):
+        from src.people.repository.repository import SqlAlchemyRepository
+
+        if self.session_factory is None:
+            self.session_factory = session_factory_for(self.profile or default_profile())
+
         self.session = self.session_factory()
-        self.database = SqlAlchemyRepository(self.session)
+        self.database = SqlAlchemyRepository(self.session, self.dimensions,
+                                             self.result_cache)
+
+        instrumentation = self.instrumentation or current_instrumentation()
+        if instrumentation.enabled:
+            self._timer = UnitOfWorkTimer(self.session, instrumentation)
+            self.database = InstrumentedRepository(self.database, instrumentation)
 
         return super().__enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        super(SqlAlchemyDbConnection, self).__exit__(exc_type, exc_val, exc_tb)
-        self.session.close()
+        try:
+            super(SqlAlchemyDbConnection, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.session.close()
+            if self._timer is not None:
+                self._timer.finish()
+                self._timer = None
 
     def commit(self):
-        self.session.commit()
+        try:
+            self._timed('unit_of_work.commit_seconds', self.session.commit)
+        except Exception:
+            self.rollback()
+            raise
 
     def rollback(self):
-        self.session.rollback()
+        self._timed('unit_of_work.rollback_seconds', self.session.rollback)
+        if self.dimensions is not None:
+            self.dimensions.invalidate()
+
+    def _timed(self, metric: str, function):
+        if self._timer is None:
+            return function()
+
+        return self._timer.timed(metric, function)
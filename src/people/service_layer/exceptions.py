@@ -0,0 +1,2 @@
+class ImportException(Exception):
+    pass
@@ -0,0 +1,312 @@
+""" Streaming import of randomuser.me style records into the repository """
+
+import asyncio
+import datetime
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from src.people.domain_models.models import Person, ContactInfo, Timezone, \
+    Coordinates, Nat, Location, PersonalId, LoginInfo, User
+from src.people.repository.bulk import batched
+from src.people.repository.sync import SyncReport
+from src.people.service_layer.exceptions import ImportException
+
+API_URL = 'https://randomuser.me/api/'
+
+Record = Dict[str, Any]
+
+
+def iter_ndjson_lines(path: str) -> Iterator[str]:
+    """
+    Stream not decoded records from file with one JSON document per line
+    :param path: Path to the file
+    :return: Generator of lines
+    """
+
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield line
+
+
+def iter_ndjson_records(path: str) -> Iterator[Record]:
+    """
+    Stream records from file with one JSON document per line
+    :param path: Path to the file
+    :return: Generator of records
+    """
+
+    return map(json.loads, iter_ndjson_lines(path))
+
+
+def iter_json_records(path: str, key: str = 'results',
+                      chunk_size: int = 1 << 16) -> Iterator[Record]:
+    """
+    Stream records of JSON array, either top level one or the one under given key,
+    without loading whole document into memory
+    :param path: Path to the file
+    :param key: Key of records array in top level object
+    :param chunk_size: Number of characters read at once
+    :return: Generator of records
+    """
+
+    decoder = json.JSONDecoder()
+    array_start = re.compile(r'^\s*\[|"%s"\s*:\s*\[' % re.escape(key))
+
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(chunk_size)
+        match = array_start.search(buffer)
+        while match is None:
+            more = file.read(chunk_size)
+            if not more:
+                raise ImportException(f'No records array found in {path}')
+            buffer += more
+            match = array_start.search(buffer)
+
+        position = match.end()
+        while True:
+            position = _skip_separators(buffer, position)
+            if position == len(buffer):
+                buffer, position = _read_more(file, buffer, position, chunk_size, path)
+                continue
+            if buffer[position] == ']':
+                return
+
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                buffer, position = _read_more(file, buffer, position, chunk_size, path)
+                continue
+
+            yield record
+
+
+def _skip_separators(buffer: str, position: int) -> int:
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+
+    return position
+
+
+def _read_more(file, buffer: str, position: int, chunk_size: int, path: str):
+    more = file.read(chunk_size)
+    if not more:
+        raise ImportException(f'Unexpected end of file {path}')
+
+    return buffer[position:] + more, 0
+
+
+def iter_file_records(path: str) -> Iterator[Record]:
+    """
+    Stream records from .ndjson/.jsonl or .json file
+    :param path: Path to the file
+    :return: Generator of records
+    """
+
+    if path.endswith(('.ndjson', '.jsonl')):
+        return iter_ndjson_records(path)
+
+    return iter_json_records(path)
+
+
+def fetch_api_page(page: int, results: int = 1000, seed: str = 'people',
+                   url: str = API_URL, session=None, timeout: float = 30) -> List[Record]:
+    """
+    Download single page of randomuser.me API
+    :param page: Number of page, starting from 1
+    :param results: Number of records per page
+    :param seed: Seed making pages consistent between requests
+    :param url: Url of the API
+    :param session: Requests session to be used - optional
+    :param timeout: Timeout of request in seconds
+    :return: Records of the page
+    """
+
+    http = session or requests
+    response = http.get(url, params=dict(page=page, results=results, seed=seed),
+                        timeout=timeout)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        raise ImportException(f'Could not download page {page}: {e}')
+
+    return response.json()['results']
+
+
+def iter_api_records(pages: int, results: int = 1000, seed: str = 'people',
+                     url: str = API_URL, session=None,
+                     timeout: float = 30) -> Iterator[Record]:
+    """
+    Stream records from paged randomuser.me API, holding one page at a time
+    :param pages: Number of pages to download
+    :param results: Number of records per page
+    :param seed: Seed making pages consistent between requests
+    :param url: Url of the API
+    :param session: Requests session to be used - optional
+    :param timeout: Timeout of single request in seconds
+    :return: Generator of records
+    """
+
+    http = session or requests.Session()
+
+    for page in range(1, pages + 1):
+        yield from fetch_api_page(page, results, seed, url, http, timeout)
+
+
+def _parse_date(value: str) -> datetime.date:
+    return datetime.date.fromisoformat(value[:10])
+
+
+def _street(street) -> str:
+    if isinstance(street, dict):
+        return f"{street['number']} {street['name']}"
+
+    return street
+
+
+def user_from_record(record: Record) -> User:
+    """
+    Build domain models from single randomuser.me record
+    :param record: Decoded JSON record
+    :return: User
+    """
+
+    try:
+        name = record['name']
+        location = record['location']
+        login = record['login']
+
+        return User(
+            person=Person(record['gender'], name['title'], name['first'], name['last'],
+                          _parse_date(record['dob']['date'])),
+            location=Location(
+                _street(location['street']), location['city'], location['state'],
+                str(location['postcode']),
+                Coordinates(float(location['coordinates']['latitude']),
+                            float(location['coordinates']['longitude'])),
+                Timezone(location['timezone']['offset'],
+                         location['timezone']['description']),
+                Nat(record['nat'])
+            ),
+            login_info=LoginInfo(login['uuid'], login['username'], login['password'],
+                                 login['salt'], login['md5'], login['sha1'],
+                                 login['sha256'],
+                                 _parse_date(record['registered']['date'])),
+            contact_info=ContactInfo(record['phone'], record['cell'], record['email']),
+            personal_id=PersonalId(record['id']['name'], record['id']['value']),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise ImportException(f'Invalid record: {e!r}')
+
+
+def peak_rss_kib() -> int:
+    """ Peak resident set size of the current process in KiB """
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+
+    return peak
+
+
+@dataclass
+class ImportReport:
+    """ Summary of single import """
+
+    records: int
+    seconds: float
+    peak_rss_kib: int
+    # Outcome per user of synchronizing import, None for plain one
+    changes: Optional[SyncReport] = None
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        report = (f'{self.records} records in {self.seconds:.2f}s '
+                  f'({self.records_per_second:.0f} records/s), '
+                  f'peak RSS {self.peak_rss_kib / 1024:.1f} MiB')
+        if self.changes is not None:
+            report += f', {self.changes}'
+
+        return report
+
+
+def import_users(records: Iterable[Record], db_connection, chunk_size: int = 1000,
+                 sync: bool = False) -> ImportReport:
+    """
+    Import records chunk by chunk, each chunk in its own unit of work, so only
+    single chunk of models is kept in memory
+    :param records: Records, e.g. from iter_file_records or iter_api_records
+    :param db_connection: Db connection to store users with
+    :param chunk_size: Number of users stored in single unit of work
+    :param sync: Update users already stored under the same login uuid instead
+    of failing on them, see SqlAlchemyRepository.sync_users
+    :return: Import report
+    """
+
+    start = time.perf_counter()
+    imported = 0
+    changes = SyncReport() if sync else None
+
+    for chunk in batched((user_from_record(record) for record in records), chunk_size):
+        with db_connection as conn:
+            if sync:
+                report = conn.database.sync_users(chunk, batch_size=chunk_size)
+                changes += report
+                imported += report.total
+            else:
+                imported += conn.database.add_many(chunk, batch_size=chunk_size)
+
+    return ImportReport(imported, time.perf_counter() - start, peak_rss_kib(), changes)
+
+
+async def import_pages_async(pages: int, db_connection,
+                             fetch_page: Callable[[int], Awaitable[List[Record]]] = None
+                             ) -> ImportReport:
+    """
+    Import paged records, downloading next page while the current one is stored
+    :param pages: Number of pages to import
+    :param db_connection: AsyncSqlAlchemyDbConnection to store users with
+    :param fetch_page: Coroutine function returning records of given page, by
+    default fetch_api_page run in the default executor
+    :return: Import report
+    """
+
+    if fetch_page is None:
+        async def fetch_page(page: int) -> List[Record]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, fetch_api_page, page)
+
+    start = time.perf_counter()
+    imported = 0
+    if pages < 1:
+        return ImportReport(imported, time.perf_counter() - start, peak_rss_kib())
+    next_page = asyncio.ensure_future(fetch_page(1))
+
+    try:
+        for page in range(1, pages + 1):
+            records = await next_page
+            if page < pages:
+                next_page = asyncio.ensure_future(fetch_page(page + 1))
+
+            # Models are built lazily by add_many, off the event loop
+            users = map(user_from_record, records)
+            async with db_connection as conn:
+                imported += await conn.database.add_many(users, batch_size=len(records) or 1)
+    finally:
+        # Download of the next page is not needed when storing a page failed
+        if not next_page.done():
+            next_page.cancel()
+        await asyncio.gather(next_page, return_exceptions=True)
+
+    return ImportReport(imported, time.perf_counter() - start, peak_rss_kib())
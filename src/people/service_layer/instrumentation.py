@@ -0,0 +1,248 @@
+""" Timing of repository calls and units of work
+
+Units of work report to the configured Instrumentation. The default one is
+disabled, so connections skip measuring altogether. HistogramCollector keeps
+in-process histograms of every metric:
+
+- repository.<method>.seconds and repository.<method>.rows
+- unit_of_work.seconds - time the unit of work stays open
+- unit_of_work.statements - SQL statements executed by the unit of work
+- unit_of_work.commit_seconds and unit_of_work.rollback_seconds
+
+Usage: python -m src.people.service_layer.instrumentation metrics.json
+"""
+
+import json
+import math
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+STATEMENT_COUNTER = 'people_statements'
+
+
+class Instrumentation:
+    """ Receiver of measurements, this base class ignores them """
+
+    enabled = False
+
+    def record(self, metric: str, value: float):
+        pass
+
+
+class Histogram:
+    """ Counts of values in buckets growing by BASE, i.e. with ~19% resolution """
+
+    BASE = 2 ** 0.25
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = {}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.ceil(math.log(value, self.BASE)) if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimate value below which given percent of values fall
+        :param percent: Percent, 0 to 100
+        :return: Upper bound of the bucket holding the percentile
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = math.ceil(self.count * percent / 100) or 1
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = 0.0 if bucket is None else self.BASE ** bucket
+                return min(max(upper, self.min), self.max)
+
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return dict(count=self.count, sum=self.total,
+                    mean=self.total / self.count if self.count else 0.0,
+                    min=self.min if self.count else 0.0,
+                    max=self.max if self.count else 0.0,
+                    p50=self.percentile(50), p95=self.percentile(95),
+                    p99=self.percentile(99))
+
+
+class HistogramCollector(Instrumentation):
+    """ Keeps histogram of every metric in memory, safe to share between threads """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, metric: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(metric)
+            if histogram is None:
+                histogram = self._histograms[metric] = Histogram()
+            histogram.add(value)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {metric: histogram.summary()
+                    for metric, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def dump(self, path: str):
+        """ Write report as JSON, to be printed with format_report """
+
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+def format_report(report: Dict[str, Dict[str, float]]) -> str:
+    """ Report of HistogramCollector as text table """
+
+    lines = [f"{'metric':48} {'count':>8} {'mean':>10} {'p50':>10} {'p95':>10} "
+             f"{'p99':>10} {'max':>10}"]
+    for metric, summary in report.items():
+        lines.append(f"{metric:48} {summary['count']:8} " + ' '.join(
+            f'{summary[name]:10.4g}' for name in ('mean', 'p50', 'p95', 'p99', 'max')))
+
+    return '\n'.join(lines)
+
+
+_configured = Instrumentation()
+
+
+def configure(instrumentation: Optional[Instrumentation]):
+    """
+    Set instrumentation used by connections created without one, None disables it
+    :param instrumentation: Instrumentation, e.g. HistogramCollector
+    :return:
+    """
+
+    global _configured
+    _configured = instrumentation or Instrumentation()
+
+
+def current() -> Instrumentation:
+    return _configured
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    info = conn.info
+    info[STATEMENT_COUNTER] = info.get(STATEMENT_COUNTER, 0) + 1
+
+
+class UnitOfWorkTimer:
+    """ Measures single unit of work: how long it is open and statements it runs """
+
+    def __init__(self, session, instrumentation: Instrumentation):
+        from sqlalchemy import event
+
+        self.instrumentation = instrumentation
+        self.started = time.perf_counter()
+        self._connections = []
+
+        engine = session.get_bind()
+        if not event.contains(engine, 'before_cursor_execute', _count_statement):
+            event.listen(engine, 'before_cursor_execute', _count_statement)
+
+        # Statements are counted per database connection, starting from the count
+        # at the moment the session checks it out
+        @event.listens_for(session, 'after_begin')
+        def after_begin(session, transaction, connection):
+            self._connections.append((connection.info,
+                                      connection.info.get(STATEMENT_COUNTER, 0)))
+
+    def timed(self, metric: str, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.instrumentation.record(metric, time.perf_counter() - start)
+
+    def finish(self):
+        record = self.instrumentation.record
+        record('unit_of_work.seconds', time.perf_counter() - self.started)
+        record('unit_of_work.statements',
+               sum(info.get(STATEMENT_COUNTER, 0) - start for info, start in self._connections))
+
+
+class InstrumentedRepository:
+    """ Proxy of repository recording duration and number of rows of every call """
+
+    def __init__(self, repository, instrumentation: Instrumentation):
+        self._repository = repository
+        self._instrumentation = instrumentation
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._repository, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+
+        record = self._instrumentation.record
+        prefix = f'repository.{name}.'
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = attribute(*args, **kwargs)
+            if isinstance(result, Iterator):
+                return self._timed_iterator(prefix, start, result)
+
+            record(prefix + 'seconds', time.perf_counter() - start)
+            rows = _rows(result)
+            if rows is not None:
+                record(prefix + 'rows', rows)
+            return result
+
+        return timed
+
+    def _timed_iterator(self, prefix: str, start: float, iterator: Iterator) -> Iterator:
+        """ Streaming results are measured until exhausted or closed """
+
+        rows = 0
+        try:
+            for rows, item in enumerate(iterator, 1):
+                yield item
+        finally:
+            self._instrumentation.record(prefix + 'seconds', time.perf_counter() - start)
+            self._instrumentation.record(prefix + 'rows', rows)
+
+
+def _rows(result: Any) -> Optional[int]:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+
+    return None
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 2
+
+    with open(argv[0], encoding='utf-8') as file:
+        print(format_report(json.load(file)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+""" Import with records parsed and flattened by a pool of worker processes
+
+Workers turn chunks of records into per-table rows (bulk.user_to_rows), the
+parent process is the only writer. Chunks are written in input order, so new
+timezone, nat and coordinates rows get the same ids as in a sequential import
+regardless of which worker finishes first.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, List, Optional, Union
+
+from src.people.repository.bulk import UserRows, batched, user_to_rows
+from src.people.service_layer.importer import ImportReport, Record, peak_rss_kib, \
+    user_from_record
+
+
+def build_rows(records: List[Union[Record, str]]) -> List[UserRows]:
+    """
+    Decode, validate and flatten chunk of records, run by worker processes
+    :param records: Decoded records or raw JSON lines
+    :return: Flattened users
+    """
+
+    return [user_to_rows(user_from_record(json.loads(record) if isinstance(record, str)
+                                          else record))
+            for record in records]
+
+
+def parallel_import(records: Iterable[Union[Record, str]], db_connection,
+                    workers: Optional[int] = None, chunk_size: int = 1000,
+                    max_pending: Optional[int] = None,
+                    executor: Optional[Executor] = None) -> ImportReport:
+    """
+    Import records with parsing and model building spread over processes
+    :param records: Decoded records or raw JSON lines, e.g. from iter_ndjson_lines
+    :param db_connection: Db connection of the single writer
+    :param workers: Number of worker processes, number of CPUs by default
+    :param chunk_size: Number of records per task and per unit of work
+    :param max_pending: Maximum number of chunks in flight, twice the number of
+    workers by default. Reading records stops until the writer catches up.
+    :param executor: Executor to be used instead of own process pool - optional
+    :return: Import report
+    """
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    start = time.perf_counter()
+    imported = 0
+    pending = deque()
+
+    def write_oldest() -> int:
+        rows = pending.popleft().result()
+        with db_connection as conn:
+            return conn.database.add_user_rows(rows, batch_size=chunk_size)
+
+    try:
+        for chunk in batched(records, chunk_size):
+            if len(pending) >= max_pending:
+                imported += write_oldest()
+            pending.append(executor.submit(build_rows, chunk))
+
+        while pending:
+            imported += write_oldest()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+    return ImportReport(imported, time.perf_counter() - start, peak_rss_kib())
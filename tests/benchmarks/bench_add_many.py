@@ -0,0 +1,83 @@
+""" Compare per-object SqlAlchemyRepository.add with bulk add_many, and the cost
+the triggers of search and spatial tables add to add_many
+
+Usage: python -m tests.benchmarks.bench_add_many [count]
+"""
+
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository.search import drop_search_index
+from src.people.repository.spatial import drop_spatial_index
+from tests.benchmarks.datasets import make_users
+
+
+# Virtual tables kept in the database -> functions dropping the others
+VIRTUAL_TABLES = {
+    'none': (drop_search_index, drop_spatial_index),
+    'search': (drop_spatial_index,),
+    'spatial': (drop_search_index,),
+    'search and spatial': (),
+}
+
+
+def _session(drop=()):
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        for drop_index in drop:
+            drop_index(connection)
+    return sessionmaker(bind=engine)()
+
+
+def bench_add(count: int) -> float:
+    users = make_users(count, seed=1)
+    session = _session()
+    repo = SqlAlchemyRepository(session)
+
+    start = time.perf_counter()
+    for user in users:
+        repo.add(user)
+        session.flush()
+    session.commit()
+
+    return count / (time.perf_counter() - start)
+
+
+def bench_add_many(count: int, batch_size: int = 1000, drop=()) -> float:
+    users = make_users(count, seed=1)
+    session = _session(drop)
+    repo = SqlAlchemyRepository(session)
+
+    start = time.perf_counter()
+    repo.add_many(users, batch_size=batch_size)
+    session.commit()
+
+    return count / (time.perf_counter() - start)
+
+
+def main(count: int = 10000):
+    start_mappers()
+    try:
+        per_object = bench_add(count)
+        bulk = bench_add_many(count)
+        by_tables = {tables: bench_add_many(count, drop=drop)
+                     for tables, drop in VIRTUAL_TABLES.items()}
+    finally:
+        clear_mappers()
+
+    print(f'users: {count}')
+    print(f'add:      {per_object:10.0f} users/s')
+    print(f'add_many: {bulk:10.0f} users/s ({bulk / per_object:.1f}x)')
+    print('add_many by virtual tables:')
+    for tables, rate in by_tables.items():
+        print(f"  {tables:20} {rate:10.0f} users/s ({rate / by_tables['none']:.2f}x)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
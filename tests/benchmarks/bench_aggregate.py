@@ -0,0 +1,70 @@
+""" Multi-column aggregate compared with group_by_and_count and Python aggregation
+
+Usage: python -m tests.benchmarks.bench_aggregate [count]
+"""
+
+import os
+import sys
+import tempfile
+from collections import defaultdict
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Person, Nat
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def main(count: int = 100000):
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            session = Session()
+            SqlAlchemyRepository(session).add_many(make_users(count))
+            session.commit()
+            session.close()
+
+            def group_by_and_count():
+                # One call per key, without the cross product nor other aggregates
+                repo = SqlAlchemyRepository(Session())
+                return sum(len(repo.group_by_and_count(model, column))
+                           for model, column in ((Nat, Nat.name),
+                                                 (Person, Person.gender),
+                                                 (Person, Person.date_of_birth)))
+
+            def python_aggregation():
+                repo = SqlAlchemyRepository(Session())
+                groups = defaultdict(lambda: [0, None, None, 0])
+                for user in repo.list_users('full'):
+                    person = user.person
+                    group = groups[(user.location.nat.name, person.gender,
+                                    person.age // 10 * 10)]
+                    group[0] += 1
+                    group[1] = min(group[1] or person.date_of_birth, person.date_of_birth)
+                    group[2] = max(group[2] or person.date_of_birth, person.date_of_birth)
+                    group[3] += user.login_info.password_strength
+                return len(groups)
+
+            def aggregate():
+                repo = SqlAlchemyRepository(Session())
+                return len(repo.aggregate(
+                    ['nat', 'gender', 'age_bucket'],
+                    ['count', 'min_date_of_birth', 'max_date_of_birth',
+                     'avg_password_strength']))
+
+            measure('group_by_and_count per key', group_by_and_count, unit='groups')
+            measure('list_users and Python aggregation', python_aggregation, unit='groups')
+            measure('aggregate', aggregate, unit='groups')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
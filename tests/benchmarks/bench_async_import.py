@@ -0,0 +1,70 @@
+""" Sequential fetch-then-store import against the async overlapping pipeline
+
+Download latency is simulated with sleep, storing uses a file SQLite database.
+
+Usage: python -m tests.benchmarks.bench_async_import [pages] [page_size] [latency_ms]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.orm import metadata, start_mappers
+from src.people.service_layer.async_db_connection import AsyncSqlAlchemyDbConnection
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.importer import import_pages_async, import_users
+from tests.benchmarks.datasets import make_records
+
+
+def _session_factory(path: str):
+    engine = create_engine(f'sqlite:///{path}')
+    metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def bench_sync(path: str, pages, latency: float) -> float:
+    def records():
+        for page in pages:
+            time.sleep(latency)
+            yield from page
+
+    report = import_users(records(), SqlAlchemyDbConnection(_session_factory(path)),
+                          chunk_size=len(pages[0]))
+    return report.records_per_second
+
+
+def bench_async(path: str, pages, latency: float) -> float:
+    async def fetch_page(page: int):
+        await asyncio.sleep(latency)
+        return pages[page - 1]
+
+    connection = AsyncSqlAlchemyDbConnection(_session_factory(path))
+    try:
+        report = asyncio.run(import_pages_async(len(pages), connection, fetch_page))
+    finally:
+        connection.close()
+
+    return report.records_per_second
+
+
+def main(pages: int = 20, page_size: int = 1000, latency_ms: int = 500):
+    start_mappers()
+    records = list(make_records(pages * page_size))
+    pages = [records[i:i + page_size] for i in range(0, len(records), page_size)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync = bench_sync(os.path.join(directory, 'sync.db'), pages, latency_ms / 1000)
+        overlapped = bench_async(os.path.join(directory, 'async.db'), pages,
+                                 latency_ms / 1000)
+
+    print(f'sync:  {sync:8.0f} records/s')
+    print(f'async: {overlapped:8.0f} records/s ({overlapped / sync:.2f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
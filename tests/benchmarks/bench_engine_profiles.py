@@ -0,0 +1,59 @@
+""" Write and read throughput of SQLite engine profiles
+
+Usage: python -m tests.benchmarks.bench_engine_profiles [count] [transaction_size]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import date
+
+from src.people.repository.orm import metadata, start_mappers
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection, EngineProfile, \
+    FAST_SQLITE_PROFILE
+from tests.benchmarks.datasets import make_users
+
+PROFILES = {
+    'default': EngineProfile(),
+    'wal': EngineProfile(journal_mode='WAL'),
+    'wal+normal': EngineProfile(journal_mode='WAL', synchronous='NORMAL'),
+    'fast': FAST_SQLITE_PROFILE,
+}
+
+
+def bench_profile(profile: EngineProfile, users, transaction_size: int):
+    metadata.create_all(profile.create_engine())
+    connection = SqlAlchemyDbConnection(profile=profile)
+
+    start = time.perf_counter()
+    for i in range(0, len(users), transaction_size):
+        with connection as conn:
+            conn.database.add_many(users[i:i + transaction_size])
+    write = len(users) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rows = 0
+    for _ in range(5):
+        with connection as conn:
+            rows += sum(1 for _ in conn.database.iter_person_by_date_of_birth(
+                date(1900, 1, 1), date(2100, 1, 1), as_rows=True))
+    read = rows / (time.perf_counter() - start)
+
+    return write, read
+
+
+def main(count: int = 20000, transaction_size: int = 100):
+    start_mappers()
+    users = make_users(count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, profile in PROFILES.items():
+            url = f"sqlite:///{os.path.join(directory, name + '.db')}"
+            write, read = bench_profile(replace(profile, url=url), users, transaction_size)
+            print(f'{name:12} write {write:9.0f} users/s   read {read:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
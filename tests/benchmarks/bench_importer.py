@@ -0,0 +1,41 @@
+""" Measure streaming import throughput and peak memory
+
+Usage: python -m tests.benchmarks.bench_importer [count] [chunk_size]
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.dimension_cache import DimensionCache
+from src.people.repository.orm import metadata, start_mappers
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.importer import import_users, iter_file_records
+from tests.benchmarks.datasets import make_records
+
+
+def main(count: int = 100000, chunk_size: int = 1000):
+    start_mappers()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'users.ndjson')
+        with open(source, 'w', encoding='utf-8') as file:
+            for record in make_records(count):
+                file.write(json.dumps(record) + '\n')
+
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+        metadata.create_all(engine)
+        connection = SqlAlchemyDbConnection(sessionmaker(bind=engine), DimensionCache())
+
+        report = import_users(iter_file_records(source), connection,
+                              chunk_size=chunk_size)
+
+    print(report)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,46 @@
+""" Cost of instrumentation per unit of work and repository call
+
+Usage: python -m tests.benchmarks.bench_instrumentation [repeats]
+"""
+
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Nat
+from src.people.repository.orm import metadata, start_mappers
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.instrumentation import HistogramCollector, format_report
+
+
+def run(connection, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        with connection as conn:
+            conn.database.filter_model_by(Nat, name='CH')
+
+    return (time.perf_counter() - start) / repeats
+
+
+def main(repeats: int = 10000):
+    start_mappers()
+
+    try:
+        engine = create_engine('sqlite://')
+        metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        collector = HistogramCollector()
+
+        disabled = run(SqlAlchemyDbConnection(Session), repeats)
+        enabled = run(SqlAlchemyDbConnection(Session, instrumentation=collector), repeats)
+        print(f'disabled {disabled * 1e6:8.1f}us per unit of work')
+        print(f'enabled  {enabled * 1e6:8.1f}us per unit of work')
+        print(format_report(collector.report()))
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
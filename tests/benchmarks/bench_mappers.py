@@ -0,0 +1,37 @@
+""" Cost of mapper setup and of the first query, with lazy and eager configuration
+
+Usage: python -m tests.benchmarks.bench_mappers [repeats]
+"""
+
+import sys
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import User
+from src.people.repository import orm
+from tests.benchmarks.suite import measure
+
+
+def main(repeats: int = 50):
+    engine = create_engine('sqlite://')
+    orm.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    for name, setup in (('lazy configuration', orm._map_models),
+                        ('start_mappers', orm.start_mappers)):
+        measure(f'{name}, setup', setup, repeat=repeats, prepare=clear_mappers)
+        measure(f'{name}, first query', lambda: Session().query(User).first(),
+                repeat=repeats, prepare=lambda: (clear_mappers(), setup()))
+    clear_mappers()
+
+    orm.start_mappers()
+    try:
+        measure('100 repeated start_mappers',
+                lambda: [orm.start_mappers() for _ in range(100)], repeat=repeats)
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+""" Keyset pages compared with LIMIT/OFFSET pages, near the start and deep in the table
+
+Usage: python -m tests.benchmarks.bench_pagination [count] [page_size]
+"""
+
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Person
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.pagination import encode_cursor
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def main(count: int = 100000, page_size: int = 50):
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            session = Session()
+            SqlAlchemyRepository(session).add_many(make_users(count))
+            session.commit()
+            session.close()
+
+            repo = SqlAlchemyRepository(Session())
+            deep = count - page_size
+            [last] = repo.session.query(Person.date_of_birth, Person.id).filter(
+                Person.date_of_birth.isnot(None)).order_by(
+                Person.date_of_birth, Person.id).offset(deep - 1).limit(1).all()
+
+            def offset_page(offset):
+                def run():
+                    repo.session.expunge_all()
+                    return len(repo.session.query(Person).order_by(
+                        Person.date_of_birth, Person.id).offset(offset).limit(page_size).all())
+                return run
+
+            def keyset_page(cursor):
+                def run():
+                    repo.session.expunge_all()
+                    return len(repo.page_persons_by_date_of_birth(page_size, cursor).items)
+                return run
+
+            measure('OFFSET, first page', offset_page(0), repeat=20, unit='rows')
+            measure('OFFSET, last page', offset_page(deep), repeat=20, unit='rows')
+            measure('keyset, first page', keyset_page(None), repeat=20, unit='rows')
+            measure('keyset, last page',
+                    keyset_page(encode_cursor('Person.date_of_birth', tuple(last))),
+                    repeat=20, unit='rows')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,50 @@
+""" Scaling of parallel import with number of worker processes
+
+Usage: python -m tests.benchmarks.bench_parallel_import [count] [max_workers]
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.orm import metadata
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.importer import import_users, iter_ndjson_lines, \
+    iter_ndjson_records
+from src.people.service_layer.parallel_import import parallel_import
+from tests.benchmarks.datasets import make_records
+
+
+def _connection(path: str) -> SqlAlchemyDbConnection:
+    engine = create_engine(f'sqlite:///{path}')
+    metadata.create_all(engine)
+    return SqlAlchemyDbConnection(sessionmaker(bind=engine))
+
+
+def main(count: int = 100000, max_workers: int = os.cpu_count()):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'users.ndjson')
+        with open(source, 'w', encoding='utf-8') as file:
+            for record in make_records(count):
+                file.write(json.dumps(record) + '\n')
+
+        sequential = import_users(iter_ndjson_records(source),
+                                  _connection(os.path.join(directory, 'sequential.db')))
+        print(f'sequential  {sequential.records_per_second:9.0f} records/s')
+
+        workers = 1
+        while workers <= max_workers:
+            path = os.path.join(directory, f'parallel{workers}.db')
+            report = parallel_import(iter_ndjson_lines(source), _connection(path),
+                                     workers=workers)
+            print(f'workers {workers:3} {report.records_per_second:9.0f} records/s '
+                  f'({report.records_per_second / sequential.records_per_second:.2f}x)')
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
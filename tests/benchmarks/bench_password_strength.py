@@ -0,0 +1,53 @@
+""" Compare password scoring paths with the original per-read regex compilation
+
+Usage: python -m tests.benchmarks.bench_password_strength [count]
+"""
+
+import re
+import sys
+import timeit
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.domain_models.models import LoginInfo, score_password, score_passwords
+from src.people.repository.orm import metadata
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+
+
+def legacy_password_strength(password: str) -> int:
+    """ LoginInfo.password_strength before rules were precompiled """
+
+    strength = 0
+    for pattern in LoginInfo.REGEX_RULES:
+        if re.compile(pattern['rule']).search(password):
+            strength += pattern['points']
+
+    return strength
+
+
+def main(count: int = 100000):
+    passwords = [user.login_info.password for user in make_users(count)]
+
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    engine.execute(metadata.tables['login_info'].insert(),
+                   [dict(password=password) for password in passwords])
+    repo = SqlAlchemyRepository(sessionmaker(bind=engine)())
+
+    cases = {
+        'legacy property': lambda: [legacy_password_strength(p) for p in passwords],
+        'score_password': lambda: [score_password(p) for p in passwords],
+        'score_passwords': lambda: score_passwords(passwords),
+        'sql password_strengths': repo.password_strengths,
+    }
+
+    print(f'passwords: {count}')
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=3))
+        print(f'{name:24} {count / seconds:12.0f} passwords/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,55 @@
+""" Reverse phone lookups by digit columns compared with scans stripping separators,
+and batch normalization compared with normalizing one number at a time
+
+Usage: python -m tests.benchmarks.bench_phone [count]
+"""
+
+import sys
+
+from sqlalchemy import create_engine, func, or_
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import ContactInfo, normalize_phone, normalize_phones
+from src.people.repository.orm import contact_info, metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def stripped(column):
+    return func.replace(func.replace(column, '-', ''), ' ', '')
+
+
+def main(count: int = 100000):
+    start_mappers()
+
+    try:
+        engine = create_engine('sqlite://')
+        metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        users = make_users(count)
+        SqlAlchemyRepository(session).add_many(users)
+        session.commit()
+
+        numbers = [user.contact_info.cell for user in users]
+        measure('normalize_phone per number', lambda: len(list(map(normalize_phone, numbers))),
+                repeat=3, unit='rows')
+        measure('normalize_phones', lambda: len(normalize_phones(numbers)), repeat=3, unit='rows')
+
+        number = users[count // 2].contact_info.cell
+        digits = normalize_phone(number)
+        measure('scan stripping separators', lambda: session.query(ContactInfo.id).filter(or_(
+            stripped(contact_info.c.phone) == digits,
+            stripped(contact_info.c.cell) == digits)).count(), repeat=20, unit='rows')
+        measure('digit columns lookup', lambda: session.query(ContactInfo.id).filter(or_(
+            ContactInfo.phone_digits == digits,
+            ContactInfo.cell_digits == digits)).count(), repeat=20, unit='rows')
+        repo = SqlAlchemyRepository(session)
+        measure('find_users_by_phone', lambda: len(repo.find_users_by_phone(number)),
+                repeat=20, unit='rows')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
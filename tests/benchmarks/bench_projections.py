@@ -0,0 +1,63 @@
+""" Bytes per User graph held in memory as plain models, mapped models and views
+
+Mapped models and views are both loaded from the database, and views of
+models are projected from the plain models, so these pairs compare alike.
+Plain models of the dataset share the constant salt, hash and password
+strings of the factories, which rows loaded from the database do not, so
+plain models against views loaded from the database is not a fair match.
+
+Usage: python -m tests.benchmarks.bench_projections [count]
+"""
+
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.projections import UserView
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def main(count: int = 100000):
+    measure('models', lambda: make_users(count), memory=True, items=count)
+
+    start_mappers()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+
+            session = Session()
+            SqlAlchemyRepository(session).add_many(make_users(count))
+            session.commit()
+            session.close()
+
+            def load_models():
+                session = Session()
+                users = SqlAlchemyRepository(session).list_users('full')
+                return session, users
+
+            def load_views():
+                return list(SqlAlchemyRepository(Session()).iter_user_views())
+
+            mapped = measure('mapped models', load_models, memory=True, items=count)
+            del mapped
+            measure('views', load_views, memory=True, items=count)
+    finally:
+        clear_mappers()
+
+    def project_models():
+        shared = {}
+        return [UserView.from_user(user, shared) for user in make_users(count)]
+
+    measure('views of models', project_models, memory=True, items=count)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
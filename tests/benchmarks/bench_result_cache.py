@@ -0,0 +1,66 @@
+""" Repeated dashboard queries with and without the result cache
+
+Usage: python -m tests.benchmarks.bench_result_cache [count] [repeats]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Nat
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository.result_cache import ResultCache
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from tests.benchmarks.datasets import make_users
+
+
+QUERIES = {
+    'group_by_and_count': lambda repo: repo.group_by_and_count(Nat, Nat.name),
+    'aggregate': lambda repo: repo.aggregate(['nat', 'gender', 'age_bucket'],
+                                             ['count', 'avg_password_strength']),
+    'filter_person_by_date_of_birth': lambda repo: repo.filter_person_by_date_of_birth(
+        date(1970, 1, 1), date(1970, 12, 31)),
+}
+
+
+def dashboard(connection, query, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        with connection as conn:
+            query(conn.database)
+
+    return time.perf_counter() - start
+
+
+def main(count: int = 100000, repeats: int = 100):
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            session = Session()
+            SqlAlchemyRepository(session).add_many(make_users(count))
+            session.commit()
+            session.close()
+
+            for name, query in QUERIES.items():
+                cache = ResultCache()
+                without = dashboard(SqlAlchemyDbConnection(Session), query, repeats)
+                cached = dashboard(SqlAlchemyDbConnection(Session, result_cache=cache),
+                                   query, repeats)
+                print(f'{name:32} without cache {without:7.3f}s with cache {cached:7.3f}s '
+                      f'hit rate {cache.hit_rate:.2f}')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,67 @@
+""" Search index lookups compared with LIKE scans and with the scans used
+without search tables. Cost of the search tables on add_many is measured by
+bench_add_many.
+
+Usage: python -m tests.benchmarks.bench_search [count]
+"""
+
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Person
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository.search import drop_search_index, fuzzy_search, prefix_search
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def populate(path: str, users):
+    engine = create_engine(f'sqlite:///{path}')
+    metadata.create_all(engine)
+
+    session = sessionmaker(bind=engine)()
+    SqlAlchemyRepository(session).add_many(users)
+    session.commit()
+    session.close()
+
+
+def main(count: int = 100000):
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'people.db')
+            populate(path, make_users(count))
+
+            engine = create_engine(f'sqlite:///{path}')
+            session = sessionmaker(bind=engine)()
+            word = f'first{count // 2}'
+
+            queries = {
+                'LIKE prefix scan': lambda: session.query(Person.id).filter(or_(
+                    Person.first_name.like(f'{word}%'),
+                    Person.second_name.like(f'{word}%'))).limit(20).all(),
+                'prefix search': lambda: prefix_search(session, word),
+                'prefix search, short prefix': lambda: prefix_search(session, 'fi'),
+                'fuzzy search': lambda: fuzzy_search(session, word[:-2] + 'x'),
+            }
+            for name, query in queries.items():
+                measure(name, lambda: len(query()), repeat=20, unit='rows')
+
+            drop_search_index(session.connection())
+            measure('prefix scan without search table', lambda: len(prefix_search(session, word)),
+                    repeat=3, unit='rows')
+            measure('fuzzy scan without search table',
+                    lambda: len(fuzzy_search(session, word[:-2] + 'x')), repeat=3, unit='rows')
+            session.rollback()
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
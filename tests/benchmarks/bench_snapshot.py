@@ -0,0 +1,62 @@
+""" Aggregations over the database compared with the columnar snapshot
+
+Usage: python -m tests.benchmarks.bench_snapshot [count]
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import Person
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository import snapshot as snapshot_module
+from src.people.repository.snapshot import Snapshot, refresh_snapshot
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def main(count: int = 200000):
+    first, last = date(1960, 1, 1), date(1980, 1, 1)
+    print(f"NumPy {'used' if snapshot_module.numpy is not None else 'not available'}")
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            repo = SqlAlchemyRepository(session)
+            repo.add_many(make_users(count))
+            session.commit()
+
+            path = os.path.join(directory, 'snapshot')
+            measure('refresh snapshot', lambda: refresh_snapshot(engine, path), unit='rows')
+
+            with Snapshot(path) as snapshot:
+                measure('group_by_and_count', lambda: repo.group_by_and_count(
+                    Person, Person.gender))
+                measure('snapshot count_by', lambda: snapshot.count_by('gender'))
+                measure('snapshot rows count date', lambda: Counter(
+                    snapshot.values('date_of_birth')))
+                measure('snapshot count_by date', lambda: snapshot.count_by(
+                    'date_of_birth'))
+                measure('filter_person_by_date_of_birth', lambda: len(
+                    repo.filter_person_by_date_of_birth(first, last)), unit='rows')
+                measure('snapshot filter_by_date', lambda: len(
+                    snapshot.filter_by_date('date_of_birth', first, last)), unit='rows')
+                measure('snapshot rows filter date', lambda: len([
+                    user_id for user_id, born in zip(snapshot.values('user_id'),
+                                                     snapshot.values('date_of_birth'))
+                    if born and first <= born <= last]), unit='rows')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,89 @@
+""" Radius, bounding-box and nearest queries through the R*Tree index compared with
+brute-force haversine scans, and cost of the index on inserts of coordinates
+
+Usage: python -m tests.benchmarks.bench_spatial [count]
+"""
+
+import random
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.orm import metadata
+from src.people.repository.search import drop_search_index
+from src.people.repository.spatial import drop_spatial_index, haversine, nearest, \
+    within_box, within_radius
+from tests.benchmarks.suite import measure
+
+
+def populate(engine, count: int, spatial_index: bool) -> float:
+    """ Insert users located at random points, with the bare rows spatial queries join """
+
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Users inserted here have no names to index
+        drop_search_index(connection)
+        if not spatial_index:
+            drop_spatial_index(connection)
+
+    rnd = random.Random(0)
+    points = {(round(rnd.uniform(-90, 90), 6), round(rnd.uniform(-180, 180), 6))
+              for _ in range(count)}
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute('INSERT INTO coordinates (id, latitude, longitude) VALUES (?, ?, ?)',
+                           [(i, latitude, longitude)
+                            for i, (latitude, longitude) in enumerate(points, 1)])
+        connection.execute('INSERT INTO location (id, coordinates_id) VALUES (?, ?)',
+                           [(i, i) for i in range(1, len(points) + 1)])
+        connection.execute('INSERT INTO "user" (id, person_id, login_info_id, '
+                           'contact_info_id, location_info_id) VALUES (?, 0, 0, 0, ?)',
+                           [(i, i) for i in range(1, len(points) + 1)])
+
+    return time.perf_counter() - start
+
+
+def scan(session):
+    return session.execute(
+        'SELECT u.id, c.latitude, c.longitude FROM "user" AS u '
+        'JOIN location AS loc ON loc.id = u.location_info_id '
+        'JOIN coordinates AS c ON c.id = loc.coordinates_id').fetchall()
+
+
+def scan_radius(session, latitude: float, longitude: float, radius_km: float) -> int:
+    return sum(1 for _, point_latitude, point_longitude in scan(session)
+               if haversine(latitude, longitude, point_latitude, point_longitude) <= radius_km)
+
+
+def scan_nearest(session, latitude: float, longitude: float, count: int) -> int:
+    distances = sorted(haversine(latitude, longitude, point_latitude, point_longitude)
+                       for _, point_latitude, point_longitude in scan(session))
+    return len(distances[:count])
+
+
+def main(count: int = 1000000):
+    plain = populate(create_engine('sqlite://'), count, False)
+    engine = create_engine('sqlite://')
+    indexed = populate(engine, count, True)
+    print(f"{'insert without spatial index':40} {plain:10.3f}s")
+    print(f"{'insert with spatial index':40} {indexed:10.3f}s")
+
+    session = sessionmaker(bind=engine)()
+    measure('haversine scan, 50km radius', lambda: scan_radius(session, 47.4, 8.5, 50),
+            repeat=1, unit='rows')
+    measure('haversine scan, 10 nearest', lambda: scan_nearest(session, 47.4, 8.5, 10),
+            repeat=1, unit='rows')
+    queries = {
+        'within_radius, 50km': lambda: within_radius(session, 47.4, 8.5, 50),
+        'within_radius, 500km': lambda: within_radius(session, 47.4, 8.5, 500),
+        'within_box, 1 by 1 degree': lambda: within_box(session, 47, 8, 48, 9),
+        'nearest, 10': lambda: nearest(session, 47.4, 8.5, 10),
+        'nearest, 10 across antimeridian': lambda: nearest(session, 0, 180, 10),
+    }
+    for name, query in queries.items():
+        measure(name, lambda: len(query()), repeat=20, unit='rows')
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+""" Peak memory of reading all persons as list, streamed models and streamed rows
+
+Usage: python -m tests.benchmarks.bench_streaming [count] [chunk_size]
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.repository.orm import metadata, person, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.suite import measure
+
+
+def populate(engine, count: int):
+    first_day = date(1940, 1, 1)
+    with engine.begin() as connection:
+        for start in range(0, count, 10000):
+            connection.execute(person.insert(), [
+                dict(gender='male' if i % 2 else 'female', title='mr', first_name=f'first{i}',
+                     second_name=f'second{i}', date_of_birth=first_day + timedelta(days=i % 21900))
+                for i in range(start, min(start + 10000, count))
+            ])
+
+
+def main(count: int = 1000000, chunk_size: int = 1000):
+    start_mappers()
+    first, last = date(1900, 1, 1), date(2100, 1, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+        metadata.create_all(engine)
+        populate(engine, count)
+        Session = sessionmaker(bind=engine)
+
+        def read_list():
+            repo = SqlAlchemyRepository(Session())
+            return len(repo.filter_person_by_date_of_birth(first, last))
+
+        def read_stream(as_rows: bool):
+            repo = SqlAlchemyRepository(Session())
+            persons = repo.iter_person_by_date_of_birth(first, last, chunk_size, as_rows)
+            return sum(1 for _ in persons)
+
+        try:
+            measure('list', read_list, unit='rows', memory=True)
+            measure('stream models', lambda: read_stream(as_rows=False), unit='rows', memory=True)
+            measure('stream rows', lambda: read_stream(as_rows=True), unit='rows', memory=True)
+        finally:
+            clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
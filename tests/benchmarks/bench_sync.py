@@ -0,0 +1,59 @@
+""" Synchronizing re-imported users compared with a lookup per user
+
+Usage: python -m tests.benchmarks.bench_sync [count] [changed_percent]
+"""
+
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import LoginInfo
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests.benchmarks.datasets import make_users
+from tests.benchmarks.suite import measure
+
+
+def main(count: int = 100000, changed_percent: int = 1):
+    start_mappers()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'people.db')}")
+            metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            session = Session()
+            SqlAlchemyRepository(session).add_many(make_users(count))
+            session.commit()
+            session.close()
+
+            users = make_users(count)
+            for user in users[::100 // changed_percent if changed_percent else count + 1]:
+                user.person.second_name += '-changed'
+
+            def lookup_per_user():
+                # Former workaround: find every user by uuid before deciding
+                session = Session()
+                found = sum(session.query(LoginInfo.id).filter_by(
+                    uuid=user.login_info.uuid).first() is not None for user in users)
+                session.rollback()
+                return f'{found} found, nothing written'
+
+            def sync_users():
+                session = Session()
+                report = SqlAlchemyRepository(session).sync_users(users)
+                session.commit()
+                return report
+
+            measure('lookup per user', lookup_per_user, unit='')
+            measure(f'sync_users, {changed_percent}% changed', sync_users, unit='')
+            measure('sync_users again, unchanged', sync_users, unit='')
+    finally:
+        clear_mappers()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,106 @@
+""" Deterministic synthetic datasets for benchmarks """
+
+import random
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List
+
+from src.people.domain_models.models import User
+from tests import factories
+
+NATS = ('AU', 'BR', 'CA', 'CH', 'DE', 'DK', 'ES', 'FI', 'FR', 'GB', 'IE', 'IR', 'NO',
+        'NL', 'NZ', 'TR', 'US')
+TIMEZONES = (('-12:00', 'Eniwetok, Kwajalein'), ('-3:30', 'Newfoundland'),
+             ('0:00', 'Western Europe Time'), ('+1:00', 'Brussels, Copenhagen'),
+             ('+5:30', 'Bombay, Calcutta'), ('+9:00', 'Tokyo, Seoul'))
+PASSWORDS = ('supertajne', 'Ab1337', 'Ab133785', 'Ab133785%', 'password', 'qwerty',
+             'letmein', 'P@ssw0rd!', 'dragon', 'monkey123')
+
+
+DATASETS = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+
+def make_users(count: int, seed: int = 0) -> List[User]:
+    """
+    Build randomuser-like users with the test factories, same for every call with
+    the same arguments. Equal timezone, nat and coordinates are shared between
+    users, so the graphs can be added to a session one by one.
+    :param count: Number of users, e.g. one of DATASETS sizes
+    :param seed: Random seed
+    :return: List of users
+    """
+
+    rnd = random.Random(seed)
+    first_day = date(1940, 1, 1)
+
+    def draw(value) -> Callable[[int], Any]:
+        return [value() for _ in range(count)].__getitem__
+
+    timezones = draw(lambda: rnd.choice(TIMEZONES))
+
+    return factories.make_users(
+        count,
+        gender=draw(lambda: rnd.choice(('male', 'female'))),
+        title=draw(lambda: rnd.choice(('mr', 'ms'))),
+        first_name=lambda i: f'first{i}',
+        second_name=lambda i: f'second{i}',
+        date_of_birth=draw(lambda: first_day + timedelta(days=rnd.randrange(365 * 60))),
+        uuid=lambda i: f'uuid-{seed}-{i}',
+        username=lambda i: f'user-{seed}-{i}',
+        password=draw(lambda: rnd.choice(PASSWORDS)),
+        date_registered=draw(
+            lambda: date(2010, 1, 1) + timedelta(days=rnd.randrange(3650))),
+        phone=draw(lambda: f'{rnd.randrange(10 ** 9):09}'[:3] + '-000-000'),
+        cell=draw(lambda: f'{rnd.randrange(10 ** 9):09}'),
+        email=lambda i: f'user{i}@mail.com',
+        latitude=draw(lambda: round(rnd.uniform(-90, 90), 2)),
+        longitude=draw(lambda: round(rnd.uniform(-180, 180), 2)),
+        offset=lambda i: timezones(i)[0],
+        description=lambda i: timezones(i)[1],
+        nat=draw(lambda: rnd.choice(NATS)),
+        street=lambda i: f'street {i}',
+        city=draw(lambda: f'city{rnd.randrange(1000)}'),
+        state='state',
+        postcode=draw(lambda: f'{rnd.randrange(100000):05}'),
+        personal_id=lambda i: factories.make_personal_id('SSN', f'{i:09}'))
+
+
+def make_records(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """
+    Generate randomuser.me style records lazily
+    :param count: Number of records
+    :param seed: Random seed
+    :return: Generator of records
+    """
+
+    rnd = random.Random(seed)
+
+    for i in range(count):
+        offset, description = rnd.choice(TIMEZONES)
+        yield {
+            'gender': rnd.choice(('male', 'female')),
+            'name': {'title': rnd.choice(('Mr', 'Ms')), 'first': f'first{i}',
+                     'last': f'second{i}'},
+            'location': {
+                'street': {'number': rnd.randrange(10000), 'name': f'street {i}'},
+                'city': f'city{rnd.randrange(1000)}', 'state': 'state',
+                'postcode': rnd.randrange(100000),
+                'coordinates': {'latitude': f'{rnd.uniform(-90, 90):.4f}',
+                                'longitude': f'{rnd.uniform(-180, 180):.4f}'},
+                'timezone': {'offset': offset, 'description': description},
+            },
+            'email': f'user{i}@example.com',
+            'login': {'uuid': f'uuid-{seed}-{i}', 'username': f'user-{seed}-{i}',
+                      'password': rnd.choice(PASSWORDS), 'salt': 'salt', 'md5': 'md5',
+                      'sha1': 'sha1', 'sha256': 'sha256'},
+            'dob': {'date': f'{rnd.randrange(1940, 2000)}-0{rnd.randrange(1, 10)}-1'
+                            f'{rnd.randrange(10)}T00:00:00.000Z'},
+            'registered': {'date': '2015-05-05T10:00:00.000Z'},
+            'phone': f'0{rnd.randrange(10)}-{rnd.randrange(10 ** 6):06}',
+            'cell': f'0{rnd.randrange(10)}-{rnd.randrange(10 ** 6):06}',
+            'id': {'name': 'SSN', 'value': f'{i:09}'},
+            'nat': rnd.choice(NATS),
+        }
@@ -0,0 +1,314 @@
+""" Throughput of models, repository and import paths, comparable between runs
+
+Usage: python -m tests.benchmarks.suite [--size 10k] [--output results.json]
+                                        [--baseline old.json] [--threshold 0.1]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+
+from src.people.domain_models.models import ContactInfo, Nat, Person, ages, score_password
+from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.service_layer.importer import import_users
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from tests.benchmarks.datasets import DATASETS, make_records, make_users
+
+# Per-object add flushes every user, so it runs on at most that many
+MAX_SINGLE_ADDS = 10000
+
+
+class Context:
+    """ Dataset of the run, built on first use and shared by the cases """
+
+    def __init__(self, users: int, directory: str):
+        self.count = users
+        self.directory = directory
+        self._users = None
+        self._session_factory = None
+
+    @property
+    def users(self):
+        if self._users is None:
+            self._users = make_users(self.count)
+        return self._users
+
+    @property
+    def session_factory(self):
+        """ Sessions of database populated with the dataset """
+
+        if self._session_factory is None:
+            engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'people.db')}")
+            metadata.create_all(engine)
+            self._session_factory = sessionmaker(bind=engine)
+            session = self._session_factory()
+            SqlAlchemyRepository(session).add_many(make_users(self.count, seed=1))
+            session.commit()
+            session.close()
+        return self._session_factory
+
+    def repository(self) -> SqlAlchemyRepository:
+        return SqlAlchemyRepository(self.session_factory())
+
+
+class Benchmark(NamedTuple):
+    run: Callable[[Any], Any]
+    ops: int
+    # Builds argument of run, not measured
+    prepare: Callable[[], Any] = lambda: None
+
+
+def measure(name: str, run: Callable[[], Any], repeat: int = 1, unit: Optional[str] = None,
+            prepare: Optional[Callable[[], Any]] = None, memory: bool = False,
+            items: Optional[int] = None) -> Any:
+    """
+    Print average time of runs of a benchmark script step on one line
+    :param name: Label of the step
+    :param run: Step, called without arguments
+    :param repeat: Number of runs
+    :param unit: Print result of the last run followed by unit, e.g. 'rows'
+    :param prepare: Called before every run, not measured
+    :param memory: Trace allocations, print their peak and size held by the result
+    :param items: Number of items the result holds, prints held bytes per item
+    :return: Result of the last run
+    """
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+    seconds = 0.0
+    result = None
+    for _ in range(repeat):
+        if prepare is not None:
+            prepare()
+        result = None
+        start = time.perf_counter()
+        result = run()
+        seconds += time.perf_counter() - start
+
+    line = f'{name:40} {seconds / repeat * 1000:10.3f}ms'
+    if unit is not None:
+        line += f' {result!s:>8} {unit}'.rstrip()
+    if memory:
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f' peak {peak / 2 ** 20:8.1f} MiB held {held / 2 ** 20:8.1f} MiB'
+        if items:
+            line += f' {held / items:8.0f} bytes per item'
+    print(line)
+
+    return result
+
+
+def _empty_session():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add(context: Context):
+    count = min(context.count, MAX_SINGLE_ADDS)
+
+    def run(prepared):
+        session, users = prepared
+        repo = SqlAlchemyRepository(session)
+        for user in users:
+            repo.add(user)
+            session.flush()
+        session.commit()
+
+    return Benchmark(run, count, lambda: (_empty_session(), make_users(count, seed=2)))
+
+
+def _add_many(context: Context):
+    users = make_users(context.count, seed=2)
+
+    def run(session):
+        SqlAlchemyRepository(session).add_many(users)
+        session.commit()
+
+    return Benchmark(run, context.count, _empty_session)
+
+
+def _import_users(context: Context):
+    records = list(make_records(context.count))
+
+    def prepare():
+        engine = create_engine('sqlite://')
+        metadata.create_all(engine)
+        return SqlAlchemyDbConnection(sessionmaker(bind=engine))
+
+    return Benchmark(lambda connection: import_users(records, connection), context.count,
+                     prepare)
+
+
+def _password_strength(context: Context):
+    logins = [user.login_info for user in context.users]
+    return Benchmark(lambda _: [login.password_strength for login in logins], len(logins))
+
+
+def _score_password_uncached(context: Context):
+    passwords = [user.login_info.password for user in context.users]
+    return Benchmark(lambda _: [score_password(password) for password in passwords],
+                     len(passwords))
+
+
+def _age(context: Context):
+    persons = [user.person for user in context.users]
+    return Benchmark(lambda _: [person.age for person in persons], len(persons))
+
+
+def _days_to_birthday(context: Context):
+    persons = [user.person for user in context.users]
+    return Benchmark(lambda _: [person.days_to_birthday for person in persons], len(persons))
+
+
+def _cohort_ages(context: Context):
+    dates = [user.person.date_of_birth for user in context.users]
+    return Benchmark(lambda _: ages(dates), len(dates))
+
+
+def _contact_info(context: Context):
+    numbers = [(user.contact_info.phone, user.contact_info.cell, user.contact_info.email)
+               for user in context.users]
+    return Benchmark(lambda _: [ContactInfo(*contact) for contact in numbers], len(numbers))
+
+
+def _rows_of(query: Callable[[SqlAlchemyRepository], list]):
+    """ Case running repository query in new session, counting returned rows """
+
+    def case(context: Context):
+        rows = len(query(context.repository()))
+
+        return Benchmark(query, rows, context.repository)
+
+    return case
+
+
+CASES = {
+    'password_strength': _password_strength,
+    'score_password_uncached': _score_password_uncached,
+    'age': _age,
+    'days_to_birthday': _days_to_birthday,
+    'cohort_ages': _cohort_ages,
+    'contact_info': _contact_info,
+    'add': _add,
+    'add_many': _add_many,
+    'import_users': _import_users,
+    'filter_model_by': _rows_of(
+        lambda repo: repo.filter_model_by(Person, gender='male')),
+    'filter_person_by_date_of_birth': _rows_of(
+        lambda repo: repo.filter_person_by_date_of_birth(date(1970, 1, 1),
+                                                         date(1979, 12, 31))),
+    'group_by_and_count': _rows_of(
+        lambda repo: repo.group_by_and_count(Nat, Nat.name)),
+    'group_by_and_count_person': _rows_of(
+        lambda repo: repo.group_by_and_count(Person, Person.gender)),
+}
+
+
+def run_suite(users: int, repeat: int = 3, cases: List[str] = None) -> Dict:
+    """
+    Run cases, each repeated and measured by its fastest run
+    :param users: Number of users of the dataset
+    :param repeat: Number of runs of every case
+    :param cases: Names from CASES, all by default
+    :return: Results, serializable as JSON
+    """
+
+    results = {}
+    start_mappers()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            context = Context(users, directory)
+            for name in cases or CASES:
+                benchmark = CASES[name](context)
+                seconds = []
+                for _ in range(repeat):
+                    prepared = benchmark.prepare()
+                    start = time.perf_counter()
+                    benchmark.run(prepared)
+                    seconds.append(time.perf_counter() - start)
+                best = min(seconds)
+                results[name] = dict(ops=benchmark.ops, seconds=best,
+                                     ops_per_second=benchmark.ops / best if best else 0.0)
+    finally:
+        clear_mappers()
+
+    return dict(users=users, repeat=repeat, python=platform.python_version(),
+                sqlalchemy=sqlalchemy.__version__, results=results)
+
+
+def compare(baseline: Dict, current: Dict,
+            threshold: float = 0.1) -> List[Tuple[str, float, float, float]]:
+    """
+    Find cases slower than in baseline by more than threshold
+    :param baseline: Results of earlier run
+    :param current: Results of this run
+    :param threshold: Allowed relative drop of throughput, e.g. 0.1 for 10%
+    :return: List of (case, baseline ops/s, current ops/s, relative change)
+    """
+
+    regressions = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous or not previous['ops_per_second']:
+            continue
+        change = result['ops_per_second'] / previous['ops_per_second'] - 1
+        if change < -threshold:
+            regressions.append((name, previous['ops_per_second'], result['ops_per_second'],
+                                change))
+
+    return regressions
+
+
+def _dataset_size(value: str) -> int:
+    return DATASETS[value] if value in DATASETS else int(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=_dataset_size, default='10k',
+                        help=f"number of users or one of {', '.join(DATASETS)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--case', action='append', choices=list(CASES), dest='cases')
+    parser.add_argument('--output', help='file to store results in as JSON')
+    parser.add_argument('--baseline', help='results of earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative drop of throughput')
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.size, args.repeat, args.cases)
+    for name, result in current['results'].items():
+        print(f"{name:32} {result['ops_per_second']:14.0f} ops/s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(current, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(json.load(file), current, args.threshold)
+        for name, previous, now, change in regressions:
+            print(f'REGRESSION {name}: {previous:.0f} -> {now:.0f} ops/s ({change:+.0%})')
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
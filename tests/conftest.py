@@ -1,12 +1,12 @@
-from datetime import date
+from contextlib import contextmanager
 
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, clear_mappers
 
-from src.people.domain_models.models import Person, ContactInfo, Timezone, Coordinates, \
-    Nat, Location, PersonalId, LoginInfo, User
 from src.people.repository.orm import metadata, start_mappers
+from src.people.repository.repository import SqlAlchemyRepository
+from tests import factories
 
 
 @pytest.fixture
@@ -23,85 +23,88 @@ def session(in_memory_db):
     clear_mappers()
 
 
+@pytest.fixture
+def add_users(session):
+    """ Add and commit users of factories.make_users """
+
+    def _add_users(count: int, **overrides):
+        users = factories.make_users(count, **overrides)
+        SqlAlchemyRepository(session).add_many(users)
+        session.commit()
+        return users
+
+    return _add_users
+
+
+@pytest.fixture
+def assert_max_queries(in_memory_db):
+    @contextmanager
+    def _assert_max_queries(expected: int):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(in_memory_db, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(in_memory_db, 'before_cursor_execute', count)
+
+        assert len(statements) <= expected, '\n'.join(statements)
+
+    return _assert_max_queries
+
+
 @pytest.fixture(scope='function')
 def person_factory_fixture():
-    def _make_person(gender='male', title='mr', first_name='john', second_name='doe',
-                     date_of_birth=date.fromisoformat('1997-01-01')):
-        person = Person(gender, title, first_name, second_name, date_of_birth)
-        return person
-
-    return _make_person
+    return factories.make_person
 
 
 @pytest.fixture(scope='function')
 def contact_info_factory_fixture():
-    def _make_contact(phone='000-000-000', cell='000-000-000', email='mail@mail.com'):
-        contact = ContactInfo(phone, cell, email)
-        return contact
-
-    return _make_contact
+    return factories.make_contact_info
 
 
 @pytest.fixture(scope='function')
 def login_info_factory_fixture():
-    def _make_login_info(uuid='uuid', username='user', password='password',
-                         salt='salt', md5='md5', sha1='sha1', sha256='sha256',
-                         date_registered=date.fromisoformat('1997-01-01')):
-        login_info = LoginInfo(uuid, username, password, salt, md5, sha1,
-                               sha256, date_registered)
-        return login_info
-
-    return _make_login_info
+    return factories.make_login_info
 
 
 @pytest.fixture(scope='function')
 def personal_id_factory_fixture():
-    def _make_id(name='name', value='value'):
-        personal_id = PersonalId(name, value)
-
-        return personal_id
-
-    return _make_id
+    return factories.make_personal_id
 
 
 @pytest.fixture(scope='function')
 def nat_factory_fixture():
-    def _make_nat(name="CH"):
-        nat = Nat(name)
-        return nat
-
-    return _make_nat
+    return factories.make_nat
 
 
 @pytest.fixture(scope='function')
 def timezone_factory_fixture(offset='-3:30', description='Newfoundland'):
     def _make_timezone():
-        timezone = Timezone(offset, description)
-        return timezone
+        return factories.make_timezone(offset, description)
 
     return _make_timezone
 
 
 @pytest.fixture(scope='function')
 def coordinates_factory_fixture():
-    def _make_coordinates(latitude=25.4, longitude=25.4):
-        coordinates = Coordinates(latitude, longitude)
-        return coordinates
-
-    return _make_coordinates
+    return factories.make_coordinates
 
 
 @pytest.fixture(scope='function')
 def location_factory_fixture(nat_factory_fixture, timezone_factory_fixture,
                              coordinates_factory_fixture):
+    # Default dimensions are shared by locations of single test
     def _make_location(street='street', city='city', state='state',
                        postcode='postcode',
                        coordinates=coordinates_factory_fixture(),
                        timezone=timezone_factory_fixture(),
                        nat=nat_factory_fixture()):
-        location = Location(street, city, state, postcode, coordinates,
-                            timezone, nat)
-        return location
+        return factories.make_location(street, city, state, postcode, coordinates,
+                                       timezone, nat)
 
     return _make_location
 
@@ -110,19 +113,12 @@ def location_factory_fixture(nat_factory_fixture, timezone_factory_fixture,
 def user_factory_fixture(person_factory_fixture, contact_info_factory_fixture,
                          login_info_factory_fixture, personal_id_factory_fixture,
                          location_factory_fixture):
+    # Default parts are shared by users of single test
     def _make_user(person=person_factory_fixture(),
                    contact_info=contact_info_factory_fixture(),
                    login_info=login_info_factory_fixture(),
                    personal_id=personal_id_factory_fixture(),
                    location=location_factory_fixture()):
-        person = person
-        contact_info = contact_info
-        login_info = login_info
-        personal_id = personal_id
-        location = location
-        user = User(person=person, contact_info=contact_info, location=location,
-                    personal_id=personal_id, login_info=login_info)
-
-        return user
+        return factories.make_user(person, contact_info, login_info, personal_id, location)
 
     yield _make_user
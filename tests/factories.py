@@ -0,0 +1,134 @@
+""" Builders of domain models with test defaults, shared by fixtures and benchmarks """
+
+from datetime import date
+from inspect import signature
+from typing import List
+
+from src.people.domain_models.models import Person, ContactInfo, Timezone, Coordinates, \
+    Nat, Location, PersonalId, LoginInfo, User
+
+
+def make_person(gender='male', title='mr', first_name='john', second_name='doe',
+                date_of_birth=date(1997, 1, 1)) -> Person:
+    return Person(gender, title, first_name, second_name, date_of_birth)
+
+
+def make_contact_info(phone='000-000-000', cell='000-000-000',
+                      email='mail@mail.com') -> ContactInfo:
+    return ContactInfo(phone, cell, email)
+
+
+def make_login_info(uuid='uuid', username='user', password='password', salt='salt',
+                    md5='md5', sha1='sha1', sha256='sha256',
+                    date_registered=date(1997, 1, 1)) -> LoginInfo:
+    return LoginInfo(uuid, username, password, salt, md5, sha1, sha256, date_registered)
+
+
+def make_personal_id(name='name', value='value') -> PersonalId:
+    return PersonalId(name, value)
+
+
+def make_nat(name='CH') -> Nat:
+    return Nat(name)
+
+
+def make_timezone(offset='-3:30', description='Newfoundland') -> Timezone:
+    return Timezone(offset, description)
+
+
+def make_coordinates(latitude=25.4, longitude=25.4) -> Coordinates:
+    return Coordinates(latitude, longitude)
+
+
+def make_location(street='street', city='city', state='state', postcode='postcode',
+                  coordinates: Coordinates = None, timezone: Timezone = None,
+                  nat: Nat = None) -> Location:
+    """ Missing coordinates, timezone and nat are built with defaults """
+
+    return Location(street, city, state, postcode,
+                    coordinates if coordinates is not None else make_coordinates(),
+                    timezone if timezone is not None else make_timezone(),
+                    nat if nat is not None else make_nat())
+
+
+def make_user(person: Person = None, contact_info: ContactInfo = None,
+              login_info: LoginInfo = None, personal_id: PersonalId = None,
+              location: Location = None) -> User:
+    """ Missing parts of the user are built with defaults """
+
+    return User(person=person if person is not None else make_person(),
+                contact_info=contact_info if contact_info is not None
+                else make_contact_info(),
+                location=location if location is not None else make_location(),
+                personal_id=personal_id if personal_id is not None else make_personal_id(),
+                login_info=login_info if login_info is not None else make_login_info())
+
+
+
+_PARTS = ('person', 'contact_info', 'login_info', 'personal_id', 'location')
+# Override names of fields, by factory, and names of their factory parameters
+_FIELDS = {
+    make_person: {name: name for name in signature(make_person).parameters},
+    make_contact_info: {name: name for name in signature(make_contact_info).parameters},
+    make_login_info: {name: name for name in signature(make_login_info).parameters},
+    make_location: {name: name for name in ('street', 'city', 'state', 'postcode')},
+    make_coordinates: {'latitude': 'latitude', 'longitude': 'longitude'},
+    make_timezone: {'offset': 'offset', 'description': 'description'},
+    make_nat: {'nat': 'name'},
+}
+
+
+def make_users(count: int, start: int = 0, **overrides) -> List[User]:
+    """
+    Build users with distinct uuid and username, 'uuid<i>' and 'user<i>' where i
+    counts from start. Overrides are values of fields of the factories above,
+    'nat' for the name of the nat, or whole parts of the user by their make_user
+    name. Callable overrides are called with i. Equal coordinates, timezones
+    and nats are shared between the users, so the graphs can be added to a
+    session one by one.
+    :param count: Number of users
+    :param start: Index of the first user
+    :param overrides: Values replacing defaults, e.g. city='basel' or
+    first_name=lambda i: f'john{i}'
+    :return: List of users
+    """
+
+    unknown = set(overrides).difference(_PARTS, *_FIELDS.values())
+    if unknown:
+        raise TypeError(f'Unknown fields of users: {", ".join(sorted(unknown))}')
+
+    fields = [(factory, [(name, parameter) for name, parameter in names.items()
+                         if name in overrides])
+              for factory, names in _FIELDS.items()]
+    constant = {name: value for name, value in overrides.items() if not callable(value)}
+    varying = [(name, value) for name, value in overrides.items() if callable(value)]
+    dimensions = {}
+    users = []
+
+    for i in range(start, start + count):
+        values = dict(constant)
+        for name, value in varying:
+            values[name] = value(i)
+        arguments = {factory: {parameter: values[name] for name, parameter in names}
+                     for factory, names in fields}
+        for factory in (make_coordinates, make_timezone, make_nat):
+            key = (factory, *arguments[factory].values())
+            if key not in dimensions:
+                dimensions[key] = factory(**arguments[factory])
+            arguments[factory] = dimensions[key]
+
+        parts = {part: values[part] for part in _PARTS if part in values}
+        if 'person' not in parts:
+            parts['person'] = make_person(**arguments[make_person])
+        if 'contact_info' not in parts:
+            parts['contact_info'] = make_contact_info(**arguments[make_contact_info])
+        if 'login_info' not in parts:
+            parts['login_info'] = make_login_info(**{
+                'uuid': f'uuid{i}', 'username': f'user{i}', **arguments[make_login_info]})
+        if 'location' not in parts:
+            parts['location'] = make_location(
+                coordinates=arguments[make_coordinates], timezone=arguments[make_timezone],
+                nat=arguments[make_nat], **arguments[make_location])
+        users.append(make_user(**parts))
+
+    return users
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.domain_models.models import Person, Nat, User
+from src.people.repository.orm import metadata
+from src.people.service_layer.async_db_connection import AsyncSqlAlchemyDbConnection
+from src.people.service_layer.exceptions import ImportException
+from src.people.service_layer.importer import import_pages_async
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'randomuser.json')
+
+
+@pytest.fixture
+def file_db(session, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'people.db'}")
+    metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def connection(file_db):
+    connection = AsyncSqlAlchemyDbConnection(sessionmaker(bind=file_db))
+    yield connection
+    connection.close()
+
+
+def test_async_db_connection_commits(connection, file_db, user_factory_fixture):
+    async def add_and_read():
+        async with connection as conn:
+            await conn.database.add(user_factory_fixture())
+
+        async with connection as conn:
+            return [(person.gender, count) for person, count in
+                    await conn.database.group_by_and_count(Person, 'gender')]
+
+    assert asyncio.run(add_and_read()) == [('male', 1)]
+    assert list(file_db.execute('SELECT COUNT(*) FROM user')) == [(1,)]
+
+
+def test_async_db_connection_rollback_on_error(connection, file_db, user_factory_fixture):
+    class MyException(Exception):
+        pass
+
+    async def add_and_fail():
+        async with connection as conn:
+            await conn.database.add(user_factory_fixture())
+            raise MyException()
+
+    with pytest.raises(MyException):
+        asyncio.run(add_and_fail())
+
+    assert list(file_db.execute('SELECT COUNT(*) FROM user')) == [(0,)]
+
+
+def test_async_db_connection_returns_detached_graphs(connection, user_factory_fixture):
+    async def add_and_get():
+        async with connection as conn:
+            await conn.database.add(user_factory_fixture())
+
+        async with connection as conn:
+            user = await conn.database.get(User, 1)
+            # Read on the event loop, inside and after the unit of work
+            first_name = user.person.first_name
+            [(person, count)] = await conn.database.group_by_and_count(Person, 'gender')
+
+        return first_name, user.location.nat.name, person.user is not None, count
+
+    assert asyncio.run(add_and_get()) == ('john', 'CH', True, 1)
+
+
+def test_async_db_connection_stops_worker_thread(connection):
+    async def unit_of_work():
+        async with connection as conn:
+            return threading.active_count(), await conn.database.filter_model_by(Nat)
+
+    before = threading.active_count()
+    during, nats = asyncio.run(unit_of_work())
+
+    assert (during, nats) == (before + 1, [])
+    assert threading.active_count() == before
+
+
+def test_import_pages_async_without_pages(connection):
+    fetched = []
+
+    async def fetch_page(page):
+        fetched.append(page)
+        return []
+
+    report = asyncio.run(import_pages_async(0, connection, fetch_page))
+
+    assert (report.records, fetched) == (0, [])
+
+
+def test_import_pages_async_overlaps_fetching_and_storing(connection, file_db):
+    with open(FIXTURE, encoding='utf-8') as file:
+        records = json.load(file)['results']
+    events = []
+
+    async def fetch_page(page):
+        events.append(f'fetch {page}')
+        await asyncio.sleep(0)
+        return records[page - 1:page]
+
+    report = asyncio.run(import_pages_async(3, connection, fetch_page))
+
+    async def nats():
+        async with connection as conn:
+            return [nat.name for nat in await conn.database.filter_model_by(Nat)]
+
+    assert report.records == 3
+    assert events == ['fetch 1', 'fetch 2', 'fetch 3']
+    assert asyncio.run(nats()) == ['FR', 'IE']
+
+
+def test_import_pages_async_cancels_next_page_on_error(connection, file_db):
+    events = []
+
+    async def fetch_page(page):
+        if page == 1:
+            return [{'invalid': 'record'}]
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            events.append(f'cancelled {page}')
+            raise
+
+    async def import_pages():
+        with pytest.raises(ImportException):
+            await import_pages_async(2, connection, fetch_page)
+        # Cancelled and awaited before the error is raised, not at loop shutdown
+        return list(events)
+
+    assert asyncio.run(import_pages()) == ['cancelled 2']
+    assert list(file_db.execute('SELECT COUNT(*) FROM user')) == [(0,)]
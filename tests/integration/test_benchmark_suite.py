@@ -0,0 +1,38 @@
+import pytest
+
+from tests.benchmarks.suite import CASES, compare, main, run_suite
+
+
+def result(ops_per_second):
+    return dict(ops=1, seconds=1 / ops_per_second, ops_per_second=ops_per_second)
+
+
+def test_compare_finds_regressions_above_threshold():
+    baseline = dict(results=dict(age=result(100), add=result(100), gone=result(100)))
+    current = dict(results=dict(age=result(95), add=result(80), new=result(1)))
+
+    [(name, previous, now, change)] = compare(baseline, current, threshold=0.1)
+
+    assert (name, previous, now) == ('add', 100, 80)
+    assert change == pytest.approx(-0.2)
+
+
+def test_suite_runs_every_case():
+    results = run_suite(20, repeat=1)
+
+    assert list(results['results']) == list(CASES)
+    assert results['users'] == 20
+    assert results['results']['add_many']['ops'] == 20
+    assert all(case['ops_per_second'] > 0 for case in results['results'].values())
+
+
+def test_suite_fails_on_regression(tmp_path):
+    output = str(tmp_path / 'results.json')
+    assert main(['--size', '20', '--repeat', '1', '--case', 'age', '--output', output]) == 0
+
+    baseline = str(tmp_path / 'baseline.json')
+    with open(baseline, 'w') as file:
+        file.write('{"results": {"age": {"ops_per_second": 1e12}}}')
+
+    assert main(['--size', '20', '--repeat', '1', '--case', 'age',
+                 '--baseline', baseline]) == 1
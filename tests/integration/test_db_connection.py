@@ -1,6 +1,13 @@
+from dataclasses import replace
+
 import pytest
+from sqlalchemy.orm import sessionmaker
 
-from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.domain_models.models import Person
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.service_layer.instrumentation import HistogramCollector
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection, EngineProfile, \
+    session_factory_for, default_profile, configure, FAST_SQLITE_PROFILE
 
 
 def try_to_add_user(session, user_factory_fixture):
@@ -29,3 +36,110 @@ def test_db_connection_rollback_on_error(session, user_factory_fixture):
 
     users = session.execute('SELECT * FROM "user"')
     assert users.fetchall() == []
+
+
+def test_db_connection_creates_engine_lazily(tmp_path):
+    profile = EngineProfile(url=f"sqlite:///{tmp_path / 'people.db'}")
+    connection = SqlAlchemyDbConnection(profile=profile)
+
+    assert connection.session_factory is None
+    assert not (tmp_path / 'people.db').exists()
+
+    with connection as conn:
+        conn.session.execute('SELECT 1')
+
+    assert connection.session_factory is session_factory_for(profile)
+    assert SqlAlchemyDbConnection(profile=profile).session_factory is None
+
+
+def test_db_connection_applies_sqlite_pragmas(tmp_path):
+    profile = EngineProfile(url=f"sqlite:///{tmp_path / 'people.db'}", journal_mode='WAL',
+                            synchronous='NORMAL', cache_size=-2000, mmap_size=2 ** 20)
+
+    with SqlAlchemyDbConnection(profile=profile) as conn:
+        pragmas = [conn.session.execute(f'PRAGMA {name}').scalar()
+                   for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size')]
+
+    assert pragmas == ['wal', 1, -2000, 2 ** 20]
+
+
+def test_engine_profile_rejects_invalid_pragma():
+    with pytest.raises(ValueError):
+        EngineProfile(journal_mode='WAL; DROP TABLE user')
+
+
+def test_default_profile_from_environment(monkeypatch, tmp_path):
+    url = f"sqlite:///{tmp_path / 'people.db'}"
+    monkeypatch.setenv('PEOPLE_DATABASE_URL', url)
+    monkeypatch.setenv('PEOPLE_DB_PROFILE', 'fast')
+
+    assert default_profile() == replace(FAST_SQLITE_PROFILE, url=url)
+
+
+def test_configured_default_profile(monkeypatch, tmp_path):
+    profile = EngineProfile(url=f"sqlite:///{tmp_path / 'people.db'}")
+    monkeypatch.setenv('PEOPLE_DB_PROFILE', 'idontexist')
+
+    configure(profile)
+    try:
+        with SqlAlchemyDbConnection() as conn:
+            conn.session.execute('SELECT 1')
+    finally:
+        configure(None)
+
+    assert (tmp_path / 'people.db').exists()
+    with pytest.raises(ValueError):
+        default_profile()
+
+
+def test_default_session_factory(tmp_path):
+    from src.people.service_layer import db_connection
+
+    profile = EngineProfile(url=f"sqlite:///{tmp_path / 'people.db'}")
+    configure(profile)
+    try:
+        assert db_connection.DEFAULT_SESSION_FACTORY is session_factory_for(profile)
+    finally:
+        configure(None)
+
+    with pytest.raises(AttributeError):
+        db_connection.DEFAULT_SESSION_FACTORI
+
+
+def test_db_connection_instrumentation(session, in_memory_db, user_factory_fixture):
+    collector = HistogramCollector()
+    connection = SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db),
+                                        instrumentation=collector)
+
+    with connection as conn:
+        conn.database.add(user_factory_fixture())
+    with connection as conn:
+        conn.database.filter_model_by(Person, gender='male')
+        list(conn.database.iter_model_by(Person))
+
+    report = collector.report()
+    assert report['unit_of_work.seconds']['count'] == 2
+    assert report['unit_of_work.commit_seconds']['count'] == 2
+    # One insert per table in the first unit of work, one query per call in the second
+    assert report['unit_of_work.statements']['max'] == 9
+    assert report['unit_of_work.statements']['min'] == 2
+    assert report['repository.filter_model_by.rows']['sum'] == 1
+    assert report['repository.iter_model_by.rows']['sum'] == 1
+    assert report['repository.add.seconds']['count'] == 1
+
+
+def test_db_connection_rollback_instrumentation(session, in_memory_db):
+    collector = HistogramCollector()
+    connection = SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db),
+                                        instrumentation=collector)
+
+    with pytest.raises(ValueError):
+        with connection as conn:
+            raise ValueError()
+
+    assert collector.report()['unit_of_work.rollback_seconds']['count'] == 1
+
+
+def test_db_connection_not_instrumented_by_default(session, in_memory_db):
+    with SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db)) as conn:
+        assert isinstance(conn.database, SqlAlchemyRepository)
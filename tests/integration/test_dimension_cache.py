@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.dimension_cache import DimensionCache, LruDict
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from tests import factories
+
+
+def make_user(i, **overrides):
+    """ User of its own dimension objects, not shared with other users """
+
+    [user] = factories.make_users(1, i, **overrides)
+    return user
+
+
+@pytest.fixture
+def connection(session, in_memory_db):
+    return SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db), DimensionCache())
+
+
+def count(session, table):
+    [[rows]] = session.execute(f'SELECT COUNT(*) FROM {table}')
+    return rows
+
+
+def test_add_reuses_dimensions_within_unit_of_work(session, connection):
+    with connection as conn:
+        conn.database.add(make_user(1))
+        conn.database.add(make_user(2))
+
+    assert count(session, 'user') == 2
+    assert count(session, 'timezone') == 1
+    assert count(session, 'nat') == 1
+    assert count(session, 'coordinates') == 1
+    assert connection.dimensions.hits == 3
+
+
+def test_add_reuses_dimensions_across_units_of_work(session, connection):
+    with connection as conn:
+        conn.database.add(make_user(1))
+    with connection as conn:
+        conn.database.add(make_user(2))
+        conn.database.add_many([make_user(3)])
+
+    assert count(session, 'user') == 3
+    assert count(session, 'timezone') == 1
+    assert count(session, 'coordinates') == 1
+    assert list(session.execute('SELECT DISTINCT nat_id FROM location')) == [(1,)]
+
+
+def test_rollback_invalidates_cache(session, connection):
+    with pytest.raises(ValueError):
+        with connection as conn:
+            conn.database.add(make_user(1))
+            raise ValueError()
+
+    assert connection.dimensions.stats()['nat'] == 0
+
+    with connection as conn:
+        conn.database.add(make_user(2))
+
+    assert count(session, 'user') == 1
+    assert count(session, 'nat') == 1
+
+
+def test_coordinates_are_evicted(session, in_memory_db):
+    connection = SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db),
+                                        DimensionCache(max_coordinates=1))
+
+    with connection as conn:
+        conn.database.add(make_user(1, latitude=1.0))
+        conn.database.add(make_user(2, latitude=2.0))
+        conn.database.add(make_user(3, latitude=1.0))
+
+    assert connection.dimensions.stats()['coordinates'] == 1
+    assert count(session, 'coordinates') == 2
+
+
+def test_lru_dict_drops_least_recently_used():
+    lru = LruDict(maxsize=2)
+    lru['a'] = 1
+    lru['b'] = 2
+    lru.get('a')
+    lru['c'] = 3
+
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
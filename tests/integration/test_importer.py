@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.exceptions import ImportException
+from src.people.service_layer.importer import iter_json_records, iter_file_records, \
+    iter_api_records, user_from_record, import_users
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'randomuser.json')
+
+
+def fixture_records():
+    with open(FIXTURE, encoding='utf-8') as file:
+        return json.load(file)['results']
+
+
+@pytest.fixture
+def stub_api():
+    records = fixture_records()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = parse_qs(urlparse(self.path).query)
+            page, results = int(params['page'][0]), int(params['results'][0])
+            body = json.dumps({'results': records[(page - 1) * results:page * results]})
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/api/'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1 << 16])
+def test_iter_json_records_streams_results_array(chunk_size):
+    records = list(iter_json_records(FIXTURE, chunk_size=chunk_size))
+
+    assert records == fixture_records()
+
+
+def test_iter_json_records_top_level_array(tmp_path):
+    path = tmp_path / 'users.json'
+    path.write_text(json.dumps(fixture_records()))
+
+    assert list(iter_json_records(str(path), chunk_size=11)) == fixture_records()
+
+
+def test_iter_json_records_truncated_file(tmp_path):
+    path = tmp_path / 'users.json'
+    path.write_text(json.dumps({'results': fixture_records()})[:-200])
+
+    with pytest.raises(ImportException):
+        list(iter_json_records(str(path)))
+
+
+def test_iter_file_records_ndjson(tmp_path):
+    path = tmp_path / 'users.ndjson'
+    path.write_text('\n'.join(json.dumps(record) for record in fixture_records()))
+
+    assert list(iter_file_records(str(path))) == fixture_records()
+
+
+def test_iter_api_records_pages(stub_api):
+    records = list(iter_api_records(pages=2, results=2, url=stub_api))
+
+    assert records == fixture_records()
+
+
+def test_user_from_record():
+    first, second, _ = fixture_records()
+
+    user = user_from_record(first)
+    assert user.person.first_name == 'Louane'
+    assert user.person.date_of_birth == date(1966, 6, 26)
+    assert user.location.street == '2479 Place du 8 Février 1962'
+    assert user.location.postcode == '78276'
+    assert user.location.coordinates.latitude == 2.0565
+    assert user.location.nat.name == 'FR'
+    assert user.login_info.date_registered == date(2016, 8, 11)
+
+    assert user_from_record(second).location.street == '9278 new road'
+
+
+def test_user_from_invalid_record():
+    with pytest.raises(ImportException):
+        user_from_record({'gender': 'male'})
+
+
+def test_import_users(session, in_memory_db):
+    connection = SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db))
+
+    report = import_users(iter_file_records(FIXTURE), connection, chunk_size=2)
+
+    assert report.records == 3
+    assert report.peak_rss_kib > 0
+    assert list(session.execute('SELECT COUNT(*) FROM user')) == [(3,)]
+    assert list(session.execute('SELECT name FROM nat ORDER BY id')) == [('FR',), ('IE',)]
+    assert list(session.execute('SELECT description FROM timezone ORDER BY id')) == [
+        ('Brussels, Copenhagen, Madrid, Paris',), ('Newfoundland',)
+    ]
+
+
+def test_import_users_sync(session, in_memory_db):
+    connection = SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db))
+    import_users(iter_file_records(FIXTURE), connection, chunk_size=2)
+    records = fixture_records()
+    records[1]['email'] = 'changed@example.com'
+
+    report = import_users(records, connection, chunk_size=2, sync=True)
+
+    assert report.records == 3
+    assert (report.changes.inserted, report.changes.updated,
+            report.changes.unchanged) == (0, 1, 2)
+    assert str(report).endswith('0 inserted, 1 updated, 2 unchanged')
+    assert list(session.execute('SELECT COUNT(*) FROM user')) == [(3,)]
+    assert list(session.execute('SELECT email FROM contact_info ORDER BY id'))[1] == (
+        'changed@example.com',)
@@ -0,0 +1,184 @@
+import json
+import os
+import stat
+import threading
+
+import pytest
+from sqlalchemy.orm import clear_mappers
+
+from src.people.main import Application, forward, main, make_server, run
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'randomuser.json')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Application(f"sqlite:///{tmp_path / 'people.db'}", cache=True)
+    status, _ = run(['import', FIXTURE], app)
+    assert status == 0
+
+    yield app
+
+    clear_mappers()
+
+
+@pytest.fixture
+def server(app, tmp_path):
+    path = str(tmp_path / 'people.sock')
+    server = make_server(path, app)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield path
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_stats(app):
+    status, output = run(['stats'], app)
+
+    assert status == 0
+    assert 'users                      3' in output
+    assert 'top nats                   IE (2), FR (1)' in output
+    assert 'result cache:' in output
+
+
+def test_query_count_by(app):
+    status, output = run(['query', 'count-by', 'nat'], app)
+
+    assert (status, output.splitlines()) == (0, ['nat  count', 'IE   2', 'FR   1'])
+
+
+def test_query_search(app):
+    status, output = run(['query', 'search', 'lou'], app)
+
+    assert status == 0
+    assert [line.split()[:3] for line in output.splitlines()] == [
+        ['id', 'first_name', 'second_name'], ['1', 'Louane', 'Vidal']]
+
+
+def test_query_phone(app):
+    status, output = run(['query', 'phone', '(081) 454 0666'], app)
+
+    assert status == 0
+    assert [line.split()[:3] for line in output.splitlines()] == [
+        ['id', 'first_name', 'second_name'], ['2', 'Brad', 'Gibson']]
+
+
+@pytest.mark.parametrize('argv, cities', [
+    (['2', '95', '--count', '2'], ['Avignon', 'Tuam']),
+    (['2', '95', '--km', '100'], ['Avignon']),
+    (['-41', '174'], ['Tuam', 'Avignon', 'Kilcoole']),
+])
+def test_query_near(app, argv, cities):
+    status, output = run(['query', 'near'] + argv, app)
+
+    assert status == 0
+    assert [line.split()[3] for line in output.splitlines()[1:]] == cities
+
+
+def test_query_birthdays(app):
+    status, output = run(['query', 'birthdays', '--days', '366'], app)
+
+    assert status == 0
+    assert len(output.splitlines()) == 4
+
+
+def test_import_sync(app):
+    status, output = run(['import', FIXTURE, '--sync'], app)
+
+    assert status == 0
+    assert output.rstrip().endswith('0 inserted, 0 updated, 3 unchanged')
+
+
+def test_import_stored_users_without_sync(app):
+    status, output = run(['import', FIXTURE], app)
+
+    assert (status, output) == (1, 'error: UNIQUE constraint failed: login_info.username; '
+                                   'to update stored users, import with --sync\n')
+    assert run(['import', FIXTURE, '--sync'], app)[0] == 0
+
+
+@pytest.mark.parametrize('name, first_line', [
+    ('users.ndjson', '{"id": 1, "person": {"gender": "female"'),
+    ('users.csv', 'id,person.gender,person.title,person.first_name'),
+])
+def test_export(app, tmp_path, name, first_line):
+    path = str(tmp_path / name)
+
+    status, output = run(['export', path], app)
+
+    assert (status, output) == (0, f'3 users exported to {path}\n')
+    with open(path, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert lines[0].startswith(first_line)
+    assert len(lines) == (3 if name.endswith('.ndjson') else 4)
+
+
+@pytest.mark.parametrize('argv, status, message', [
+    (['query', 'count-by', 'bogus'], 1, 'error: Invalid group key: bogus'),
+    (['query', 'bogus'], 2, "invalid choice: 'bogus'"),
+    (['stats', '--instrumentation'], 1, 'error: Instrumentation is disabled'),
+    (['import', '/does/not/exist.json'], 1, 'error:'),
+    (['serve'], 1, 'error: serve can not be run from serve'),
+])
+def test_invalid_commands(app, argv, status, message):
+    result, output = run(argv, app)
+
+    assert result == status
+    assert message in output
+
+
+def test_forward_to_warm_process(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assert forward(server, ['query', 'count-by', 'nat']) == (0, 'nat  count\nIE   2\nFR   1\n')
+    status, output = forward(server, ['export', 'relative.ndjson'])
+    assert (status, output) == (0, '3 users exported to relative.ndjson\n')
+    assert os.path.exists(tmp_path / 'relative.ndjson')
+
+
+def test_main_forwards_to_warm_process(server, monkeypatch, capsys):
+    monkeypatch.setenv('PEOPLE_SOCKET', server)
+
+    assert main(['query', 'count-by', 'gender']) == 0
+    assert capsys.readouterr().out.splitlines()[0] == 'gender  count'
+
+
+def test_warm_process_survives_invalid_requests(server):
+    import socket
+
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(server)
+        client.sendall(b'not json\n')
+        assert json.loads(client.makefile().readline()) == dict(
+            status=2, output='error: invalid request\n')
+
+    assert forward(server, ['stats'])[0] == 0
+
+
+def test_no_warm_process(tmp_path):
+    assert forward(str(tmp_path / 'missing.sock'), ['stats']) is None
+
+
+def test_make_server_socket_is_private(app, tmp_path):
+    path = str(tmp_path / 'people.sock')
+    umask = os.umask(0o022)
+    try:
+        server = make_server(path, app)
+        restored = os.umask(0o022)
+    finally:
+        os.umask(umask)
+    server.server_close()
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert restored == 0o022
+
+
+def test_make_server_refuses_second_process(server, app):
+    from src.people.main import CommandError
+
+    with pytest.raises(CommandError):
+        make_server(server, app)
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from src.people.repository import migrations
+from src.people.repository.migrations import upgrade_schema
+from src.people.repository.orm import metadata
+from src.people.repository.search import SEARCH_TABLES
+from src.people.repository.spatial import SPATIAL_TABLES
+
+
+def test_upgrade_schema_creates_missing_indexes():
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    engine.execute('DROP INDEX ix_person_date_of_birth')
+    engine.execute('DROP INDEX ix_location_nat_id_city')
+
+    created = upgrade_schema(engine)
+
+    assert sorted(created) == ['ix_location_nat_id_city', 'ix_person_date_of_birth']
+    assert 'ix_person_date_of_birth' in {
+        index['name'] for index in inspect(engine).get_indexes('person')}
+    assert upgrade_schema(engine) == []
+
+
+def test_upgrade_schema_creates_missing_tables():
+    engine = create_engine('sqlite:///:memory:')
+
+    created = upgrade_schema(engine)
+
+    assert set(created) == set(metadata.tables) | set(SEARCH_TABLES) | set(SPATIAL_TABLES)
+
+
+def test_upgrade_schema_adds_missing_columns():
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    engine.execute('ALTER TABLE user DROP COLUMN content_hash')
+
+    created = upgrade_schema(engine)
+
+    assert created == ['user.content_hash']
+    assert 'content_hash' in {column['name'] for column in inspect(engine).get_columns('user')}
+    assert upgrade_schema(engine) == []
+
+
+@pytest.mark.parametrize('batch_size', [1, 10000])
+def test_upgrade_schema_fills_added_phone_digits(monkeypatch, batch_size):
+    monkeypatch.setattr(migrations, 'FILL_BATCH_SIZE', batch_size)
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    engine.execute('DROP INDEX ix_contact_info_phone_digits')
+    engine.execute('DROP INDEX ix_contact_info_cell_digits')
+    engine.execute('ALTER TABLE contact_info DROP COLUMN phone_digits')
+    engine.execute('ALTER TABLE contact_info DROP COLUMN cell_digits')
+    engine.execute("INSERT INTO contact_info (phone, cell, email) VALUES "
+                   "('+41 (0)44 123', '079-55', 'a@a.com'), ('', NULL, 'b@b.com')")
+
+    created = upgrade_schema(engine)
+
+    assert sorted(created) == ['contact_info.cell_digits', 'contact_info.phone_digits',
+                               'ix_contact_info_cell_digits', 'ix_contact_info_phone_digits']
+    assert engine.execute('SELECT phone_digits, cell_digits FROM contact_info '
+                          'ORDER BY id').fetchall() == [('4144123', '07955'), ('', None)]
@@ -1,7 +1,13 @@
+import threading
+from datetime import date
+
 import pytest
 import sqlalchemy
+from sqlalchemy.orm import clear_mappers
 
-from src.people.domain_models.models import Timezone, Coordinates, Location, Nat, User
+from src.people.domain_models.models import Timezone, Coordinates, Location, Nat, User, \
+    Person, ContactInfo
+from src.people.repository.orm import start_mappers
 
 
 def test_user_mapper(session, user_factory_fixture):
@@ -13,6 +19,44 @@ def test_user_mapper(session, user_factory_fixture):
     assert user == db_user
 
 
+def test_start_mappers_is_idempotent(session):
+    user_mapper = sqlalchemy.inspect(User)
+
+    start_mappers()
+
+    assert sqlalchemy.inspect(User) is user_mapper
+
+
+def test_start_mappers_configures_relationships_eagerly(session):
+    clear_mappers()
+    start_mappers()
+
+    assert User.person.property.mapper.class_ is Person
+    assert Location.nat.property.mapper.class_ is Nat
+
+
+def test_start_mappers_from_concurrent_threads(session):
+    clear_mappers()
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def start():
+        barrier.wait()
+        try:
+            start_mappers()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert User.person.property.mapper.class_ is Person
+
+
 def test_login_info_unique_constraint(session, login_info_factory_fixture):
     login_info_1 = login_info_factory_fixture()
     login_info_2 = login_info_factory_fixture()
@@ -31,3 +75,80 @@ def test_coordinates_unique_constraint(session, coordinates_factory_fixture):
         session.add(coordinates_1)
         session.add(coordinates_2)
         session.commit()
+
+
+def query_plan(session, query):
+    statement = query.statement.compile(session.bind,
+                                        compile_kwargs={'literal_binds': True})
+    plan = session.execute(f'EXPLAIN QUERY PLAN {statement}')
+
+    return ' '.join(row[-1] for row in plan)
+
+
+def test_filter_person_by_date_of_birth_uses_index(session):
+    query = session.query(Person).filter(Person.date_of_birth.between(
+        date(1998, 1, 1), date(1999, 1, 1)))
+
+    assert 'USING INDEX ix_person_date_of_birth' in query_plan(session, query)
+
+
+def test_group_by_gender_uses_index(session):
+    query = session.query(Person.gender, sqlalchemy.func.count(Person.gender)).group_by(
+        Person.gender)
+
+    assert 'USING COVERING INDEX ix_person_gender_date_of_birth' in query_plan(session,
+                                                                               query)
+
+
+def test_filter_person_by_gender_and_date_of_birth_uses_index(session):
+    query = session.query(Person).filter(Person.gender == 'male',
+                                         Person.date_of_birth > date(1998, 1, 1))
+
+    assert 'USING INDEX ix_person_gender_date_of_birth' in query_plan(session, query)
+
+
+def test_filter_location_by_nat_and_city_uses_index(session):
+    query = session.query(Location).filter_by(nat_id=1, city='city')
+
+    assert 'USING INDEX ix_location_nat_id_city' in query_plan(session, query)
+
+
+def test_group_by_nat_uses_index(session):
+    query = session.query(Location.nat_id, sqlalchemy.func.count(Location.nat_id)).group_by(
+        Location.nat_id)
+
+    assert 'USING COVERING INDEX ix_location_nat_id_city' in query_plan(session, query)
+
+
+def test_keyset_page_of_persons_by_date_of_birth_seeks_index(session):
+    query = session.query(Person).filter(
+        sqlalchemy.tuple_(Person.date_of_birth, Person.id) >
+        sqlalchemy.tuple_(sqlalchemy.literal(date(1998, 1, 1), sqlalchemy.Date), 10)
+    ).order_by(Person.date_of_birth, Person.id).limit(50)
+    plan = query_plan(session, query)
+
+    assert 'USING INDEX ix_person_date_of_birth (date_of_birth>?)' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_user_mapper_stores_phone_digits(session, user_factory_fixture):
+    user = user_factory_fixture(
+        contact_info=ContactInfo('+41 (0)44 123-45-67', '(079) 555', 'mail@mail.com'))
+    session.add(user)
+    session.flush()
+
+    user.contact_info.cell = '079 556'
+    session.commit()
+
+    assert session.execute('SELECT phone, phone_digits, cell, cell_digits '
+                           'FROM contact_info').fetchall() == [
+        ('+41 (0)44 1234567', '41441234567', '079 556', '079556')]
+
+
+def test_find_user_by_phone_uses_indexes(session):
+    query = session.query(User).join(User.contact_info).filter(sqlalchemy.or_(
+        ContactInfo.phone_digits == '1', ContactInfo.cell_digits == '1'))
+    plan = query_plan(session, query)
+
+    assert 'USING INDEX ix_contact_info_phone_digits (phone_digits=?)' in plan
+    assert 'USING INDEX ix_contact_info_cell_digits (cell_digits=?)' in plan
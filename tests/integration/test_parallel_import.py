@@ -0,0 +1,62 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.people.repository.orm import metadata
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+from src.people.service_layer.exceptions import ImportException
+from src.people.service_layer.importer import import_users, iter_ndjson_lines
+from src.people.service_layer.parallel_import import parallel_import
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'randomuser.json')
+
+TABLES = ('user', 'person', 'login_info', 'contact_info', 'personal_id', 'location',
+          'timezone', 'coordinates', 'nat')
+
+
+@pytest.fixture
+def ndjson_file(tmp_path):
+    with open(FIXTURE, encoding='utf-8') as file:
+        records = json.load(file)['results']
+
+    path = tmp_path / 'users.ndjson'
+    path.write_text('\n'.join(json.dumps(record) for record in records))
+    return str(path)
+
+
+def make_connection():
+    engine = create_engine('sqlite:///:memory:')
+    metadata.create_all(engine)
+    return SqlAlchemyDbConnection(sessionmaker(bind=engine)), engine
+
+
+def dump(engine):
+    return {table: engine.execute(f'SELECT * FROM "{table}" ORDER BY id').fetchall()
+            for table in TABLES}
+
+
+@pytest.mark.parametrize('executor_type', [ProcessPoolExecutor, ThreadPoolExecutor])
+def test_parallel_import_matches_sequential_import(session, ndjson_file, executor_type):
+    sequential, sequential_engine = make_connection()
+    parallel, parallel_engine = make_connection()
+
+    import_users(map(json.loads, iter_ndjson_lines(ndjson_file)), sequential,
+                 chunk_size=1)
+    with executor_type(max_workers=2) as executor:
+        report = parallel_import(iter_ndjson_lines(ndjson_file), parallel, workers=2,
+                                 chunk_size=1, max_pending=1, executor=executor)
+
+    assert report.records == 3
+    assert dump(parallel_engine) == dump(sequential_engine)
+
+
+def test_parallel_import_propagates_invalid_records(session):
+    connection, engine = make_connection()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ImportException):
+            parallel_import(['{"gender": "male"}'], connection, executor=executor)
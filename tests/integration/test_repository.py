@@ -1,10 +1,17 @@
 from datetime import date
 
 import pytest
-
-from src.people.domain_models.models import Person
+from sqlalchemy.dialects import postgresql
+
+from src.people.domain_models.models import Person, LoginInfo, User, calculate_age, \
+    days_to_birthday
+from src.people.domain_models.projections import PersonView, project
+from src.people.repository.dimension_cache import DimensionCache
+from src.people.repository import bulk
+from src.people.repository.aggregation import aggregate_query
 from src.people.repository.exceptions import RepositoryException
 from src.people.repository.repository import SqlAlchemyRepository
+from tests import factories
 
 
 def insert_person(session, gender, title, first_name, second_name, date_of_birth):
@@ -40,7 +47,8 @@ def test_repository_can_save_user(session, user_factory_fixture):
     session.commit()
 
     rows = list(session.execute(
-        'SELECT * FROM user'
+        'SELECT id, person_id, login_info_id, contact_info_id, location_info_id, '
+        'personal_id_id FROM user'
     ))
     assert rows == [(1, 1, 1, 1, 1, 1)]
 
@@ -110,3 +118,494 @@ def test_filter_by_not_existing_columns(session):
 
     with pytest.raises(RepositoryException):
         retrieved = repo.filter_model_by(Person, **filters)
+
+
+def test_repository_add_many(session):
+    users = factories.make_users(5, latitude=lambda i: float(i % 2))
+
+    repo = SqlAlchemyRepository(session)
+    added = repo.add_many(users, batch_size=2)
+    session.commit()
+
+    assert added == 5
+    assert list(session.execute('SELECT id, person_id, login_info_id, contact_info_id, '
+                                'location_info_id, personal_id_id FROM user ORDER BY id')) == [
+        (i, i, i, i, i, i) for i in range(1, 6)
+    ]
+    assert list(session.execute('SELECT username FROM login_info ORDER BY id')) == [
+        (f'user{i}',) for i in range(5)
+    ]
+    assert list(session.execute('SELECT timezone_id, coordinates_id, nat_id '
+                                'FROM location ORDER BY id')) == [
+        (1, 1, 1), (1, 2, 1), (1, 1, 1), (1, 2, 1), (1, 1, 1)
+    ]
+
+
+def test_repository_add_many_with_generated_keys(session, monkeypatch):
+    monkeypatch.setattr(bulk, 'EXPLICIT_ID_DIALECTS', ())
+    session.execute("INSERT INTO nat (name) VALUES ('CH')")
+    session.execute("INSERT INTO person (id, gender) VALUES (10, 'female')")
+
+    SqlAlchemyRepository(session).add_many([
+        factories.make_user(login_info=factories.make_login_info(uuid=nat, username=nat),
+                            location=factories.make_location(nat=factories.make_nat(nat)))
+        for nat in ('FR', 'CH')
+    ])
+    session.commit()
+
+    assert list(session.execute('SELECT u.id, p.id, n.name FROM user AS u '
+                                'JOIN person AS p ON p.id = u.person_id '
+                                'JOIN location AS l ON l.id = u.location_info_id '
+                                'JOIN nat AS n ON n.id = l.nat_id ORDER BY u.id')) == [
+        (1, 11, 'FR'), (2, 12, 'CH')
+    ]
+
+
+def test_repository_add_many_reuses_dimensions_with_null_keys(session):
+    nats, descriptions = [None, 'CH', None, 'CH'], [None, 'Newfoundland', 'Newfoundland', None]
+
+    repo = SqlAlchemyRepository(session)
+    for start in (0, 2):
+        repo.add_many(factories.make_users(2, start, nat=nats.__getitem__,
+                                           description=descriptions.__getitem__,
+                                           latitude=None, longitude=1.0))
+    session.commit()
+
+    assert list(session.execute('SELECT name FROM nat ORDER BY id')) == [(None,), ('CH',)]
+    assert list(session.execute('SELECT description FROM timezone ORDER BY id')) == [
+        (None,), ('Newfoundland',)]
+    assert list(session.execute('SELECT COUNT(*) FROM coordinates')) == [(1,)]
+    assert list(session.execute('SELECT nat_id, timezone_id FROM location ORDER BY id')) == [
+        (1, 1), (2, 2), (1, 2), (2, 1)]
+
+
+def test_repository_add_many_reuses_existing_dimensions(session):
+    session.execute('INSERT INTO timezone ("offset", description) '
+                    'VALUES (\'-3:30\', \'Newfoundland\')')
+    session.execute('INSERT INTO nat (name) VALUES (\'CH\')')
+    session.execute('INSERT INTO coordinates (latitude, longitude) VALUES (1.0, 25.4)')
+
+    users = factories.make_users(3, latitude=lambda i: float(i % 2))
+    repo = SqlAlchemyRepository(session)
+    repo.add_many(users)
+    session.commit()
+
+    assert list(session.execute('SELECT COUNT(*) FROM timezone')) == [(1,)]
+    assert list(session.execute('SELECT COUNT(*) FROM nat')) == [(1,)]
+    assert list(session.execute('SELECT latitude FROM coordinates ORDER BY id')) == [
+        (1.0,), (0.0,)
+    ]
+    assert list(session.execute('SELECT coordinates_id FROM location ORDER BY id')) == [
+        (2,), (1,), (2,)
+    ]
+
+
+@pytest.mark.parametrize('password', [
+    'supertajne', 'Ab1337', 'Ab133785', 'Ab133785%', '', 'ZZZZ', '^', '[]]]]]]]]',
+    'ąęśćżźół1', 'a"b:c{d}e|f<g>h'
+])
+def test_repository_password_strengths_match_model(session, password):
+    session.execute('INSERT INTO login_info (password) VALUES (:password)',
+                    dict(password=password))
+
+    repo = SqlAlchemyRepository(session)
+    [(_, strength)] = repo.password_strengths()
+
+    assert strength == LoginInfo('uuid', 'user', password, 'salt', 'md5', 'sha1',
+                                 'sha256', None).password_strength
+
+
+def test_repository_password_strengths_on_other_dialects(session, monkeypatch):
+    for password in ('supertajne', 'Ab133785%', None):
+        session.execute('INSERT INTO login_info (password) VALUES (:password)',
+                        dict(password=password))
+    repo = SqlAlchemyRepository(session)
+    expected = repo.password_strengths()
+
+    monkeypatch.setattr(repo, '_dialect', lambda: 'postgresql')
+
+    assert repo.password_strengths() == expected
+
+
+@pytest.mark.parametrize('today', [
+    date(2021, 2, 28), date(2021, 3, 1), date(2024, 2, 28), date(2024, 2, 29),
+    date(2020, 12, 31), date(2021, 1, 1)
+])
+@pytest.mark.parametrize('dialect', ['sqlite', 'postgresql'])
+def test_repository_ages_and_days_to_birthday_match_model(session, monkeypatch, today,
+                                                          dialect):
+    dates = ['2000-02-29', '1997-01-01', '1998-12-31', '1999-03-01', '2000-02-28']
+    for number, date_of_birth in enumerate(dates):
+        insert_person(session, 'male', 'mr', f'john{number}', 'doe', date_of_birth)
+
+    repo = SqlAlchemyRepository(session)
+    monkeypatch.setattr(repo, '_dialect', lambda: dialect)
+    retrieved = repo.ages_and_days_to_birthday(today)
+
+    expected = sorted(
+        (days_to_birthday(date.fromisoformat(d), today), person_id,
+         calculate_age(date.fromisoformat(d), today))
+        for person_id, d in enumerate(dates, start=1)
+    )
+    assert retrieved == [(person_id, age, days) for days, person_id, age in expected]
+
+
+@pytest.mark.parametrize('dialect', ['sqlite', 'postgresql'])
+def test_repository_birthdays_within_days(session, monkeypatch, dialect):
+    populated_db_fixture(session)
+
+    repo = SqlAlchemyRepository(session)
+    monkeypatch.setattr(repo, '_dialect', lambda: dialect)
+    retrieved = repo.ages_and_days_to_birthday(date(2020, 12, 30), within_days=5)
+
+    assert retrieved == [(1, 23, 2), (2, 22, 2), (3, 21, 2)]
+
+
+@pytest.mark.parametrize('as_rows', [False, True])
+def test_repository_iter_person_by_date_of_birth(session, as_rows):
+    populated_db_fixture(session)
+
+    repo = SqlAlchemyRepository(session)
+    retrieved = repo.iter_person_by_date_of_birth(date.fromisoformat('1998-01-01'),
+                                                  date.fromisoformat('1999-01-01'),
+                                                  chunk_size=1, as_rows=as_rows)
+
+    assert [person.first_name for person in retrieved] == ['mike', 'jane']
+
+
+def test_repository_iter_model_by_rows(session):
+    populated_db_fixture(session)
+
+    repo = SqlAlchemyRepository(session)
+    retrieved = list(repo.iter_model_by(Person, chunk_size=2, as_rows=True, gender='male'))
+
+    assert retrieved == [
+        (1, 'male', 'mr', 'john', 'doe', date.fromisoformat('1997-01-01')),
+        (2, 'male', 'mr', 'mike', 'doe', date.fromisoformat('1998-01-01')),
+    ]
+
+
+def test_repository_iter_model_by_not_existing_columns(session):
+    repo = SqlAlchemyRepository(session)
+
+    with pytest.raises(RepositoryException):
+        repo.iter_model_by(Person, idontexist='male')
+
+
+def test_repository_iter_group_by_and_count(session):
+    populated_db_fixture(session)
+
+    repo = SqlAlchemyRepository(session)
+    [(person, count), _] = repo.iter_group_by_and_count(Person, 'gender')
+
+    assert person.gender == 'male'
+    assert count == 2
+
+
+def test_repository_iter_group_by_and_count_rows(session):
+    populated_db_fixture(session)
+
+    repo = SqlAlchemyRepository(session)
+    [row, _] = repo.iter_group_by_and_count(Person, 'gender', as_rows=True)
+
+    assert row.gender == 'male'
+    assert row[-1] == 2
+
+
+def test_repository_iter_group_by_not_existing_column(session):
+    repo = SqlAlchemyRepository(session)
+
+    with pytest.raises(RepositoryException):
+        repo.iter_group_by_and_count(Person, 'idontexist')
+
+
+def touch_summary(user):
+    return user.person.first_name, user.login_info.username
+
+
+def touch_full(user):
+    location = user.location
+    return (touch_summary(user), user.contact_info.email, user.personal_id.value,
+            location.timezone.description, location.coordinates.latitude, location.nat.name)
+
+
+@pytest.fixture
+def twenty_users(session):
+    users = factories.make_users(20, latitude=lambda i: float(i % 2))
+    SqlAlchemyRepository(session).add_many(users)
+    session.commit()
+
+
+@pytest.mark.parametrize('profile, touch, queries', [
+    ('summary', touch_summary, 1),
+    ('full', touch_full, 4),
+])
+def test_repository_list_users_loading_profiles(session, twenty_users, assert_max_queries,
+                                                profile, touch, queries):
+    repo = SqlAlchemyRepository(session)
+
+    with assert_max_queries(queries):
+        users = repo.list_users(profile)
+        touched = [touch(user) for user in users]
+
+    assert len(touched) == 20
+    assert touch_summary(users[3]) == ('john', 'user3')
+
+
+def test_repository_lazy_loading_issues_query_per_user(session, twenty_users,
+                                                       assert_max_queries):
+    with assert_max_queries(200) as statements:
+        [touch_full(user) for user in session.query(User)]
+
+    assert len(statements) > 20
+
+
+def test_repository_get_user_full_profile(session, twenty_users, assert_max_queries):
+    repo = SqlAlchemyRepository(session)
+
+    with assert_max_queries(4):
+        user = repo.get_user(5)
+        touch_full(user)
+
+    assert user.login_info.username == 'user4'
+
+
+def test_repository_invalid_loading_profile(session):
+    repo = SqlAlchemyRepository(session)
+
+    with pytest.raises(RepositoryException):
+        repo.list_users('idontexist')
+
+
+def test_repository_iter_user_views(session, twenty_users, assert_max_queries):
+    repo = SqlAlchemyRepository(session)
+
+    with assert_max_queries(1):
+        views = list(repo.iter_user_views(chunk_size=7))
+
+    assert len(session.identity_map) == 0
+    assert [view.id for view in views] == list(range(1, 21))
+    assert views[3].login_info.username == 'user3'
+    assert views[3].person == project(PersonView, session.query(Person).get(4))
+    assert views[0].location.nat is views[1].location.nat
+    assert views[0].person.gender is views[1].person.gender
+    assert views[0].location.state is views[1].location.state
+    assert views[0].location.coordinates.latitude == 0.0
+    assert views[1].location.coordinates.latitude == 1.0
+
+
+@pytest.fixture
+def cohort(session):
+    people = [
+        ('male', date(1990, 5, 1), 'password', 'CH'),
+        ('male', date(1985, 5, 1), 'Ab133785%', 'CH'),
+        ('female', date(1992, 5, 1), 'Ab1337', 'CH'),
+        ('female', date(1970, 5, 1), 'password', 'DE'),
+        ('male', date(1975, 5, 1), 'Ab1337', 'DE'),
+    ]
+    genders, dates_of_birth, passwords, nats = zip(*people)
+    users = factories.make_users(len(people), gender=genders.__getitem__,
+                                 date_of_birth=dates_of_birth.__getitem__,
+                                 password=passwords.__getitem__, nat=nats.__getitem__)
+    SqlAlchemyRepository(session).add_many(users)
+    session.commit()
+
+
+def test_repository_aggregate(session, cohort, assert_max_queries):
+    repo = SqlAlchemyRepository(session)
+
+    with assert_max_queries(1):
+        rows = repo.aggregate(['nat', 'gender', 'age_bucket'],
+                              ['count', 'min_date_of_birth', 'max_date_of_birth',
+                               'avg_password_strength'],
+                              today=date(2020, 6, 1))
+
+    assert [tuple(row) for row in rows] == [
+        ('CH', 'female', 20, 1, date(1992, 5, 1), date(1992, 5, 1), 4.0),
+        ('CH', 'male', 30, 2, date(1985, 5, 1), date(1990, 5, 1), 9.0),
+        ('DE', 'female', 50, 1, date(1970, 5, 1), date(1970, 5, 1), 6.0),
+        ('DE', 'male', 40, 1, date(1975, 5, 1), date(1975, 5, 1), 4.0),
+    ]
+    assert rows[1].avg_password_strength == 9.0
+
+
+def test_repository_aggregate_filters_and_order(session, cohort):
+    repo = SqlAlchemyRepository(session)
+
+    rows = repo.aggregate(['gender'], ['count', 'avg_age'], filters={'nat': 'CH'},
+                          order_by=['-count'], today=date(2020, 6, 1))
+
+    assert [tuple(row) for row in rows] == [('male', 2, 32.5), ('female', 1, 28.0)]
+
+
+def test_repository_aggregate_matches_group_by_and_count(session, cohort):
+    repo = SqlAlchemyRepository(session)
+
+    rows = repo.aggregate(['gender'], order_by=['-count'])
+
+    assert [(row.gender, row.count) for row in rows] == [
+        (person.gender, count) for person, count in repo.group_by_and_count(Person,
+                                                                            Person.gender)
+    ]
+
+
+@pytest.mark.parametrize('arguments', [
+    dict(group_by=['idontexist']),
+    dict(group_by=['gender'], aggregates=['idontexist']),
+    dict(group_by=['gender'], filters={'idontexist': 1}),
+    dict(group_by=['gender'], order_by=['nat']),
+])
+def test_repository_aggregate_invalid_names(session, arguments):
+    repo = SqlAlchemyRepository(session)
+
+    with pytest.raises(RepositoryException):
+        repo.aggregate(**arguments)
+
+
+@pytest.mark.parametrize('arguments', [
+    dict(group_by=['password_strength']),
+    dict(group_by=['gender'], aggregates=['avg_password_strength']),
+    dict(group_by=['gender'], filters={'password_strength': 4}),
+])
+def test_aggregate_query_sqlite_functions_on_other_dialects(arguments):
+    with pytest.raises(RepositoryException, match='not supported on postgresql'):
+        aggregate_query(dialect='postgresql', **arguments)
+
+
+def test_repository_aggregate_on_other_dialects(session, cohort, monkeypatch):
+    repo = SqlAlchemyRepository(session)
+    monkeypatch.setattr(repo, '_dialect', lambda: 'postgresql')
+
+    assert [tuple(row) for row in repo.aggregate(['nat'])] == [('CH', 3), ('DE', 2)]
+    assert [tuple(row) for row in repo.aggregate(
+        ['age_bucket'], ['avg_age'], filters={'nat': 'CH'}, today=date(2020, 6, 1))] == [
+        (20, 28.0), (30, 32.5)]
+    with pytest.raises(RepositoryException):
+        repo.aggregate(['nat'], ['avg_password_strength'])
+
+
+def test_aggregate_query_on_other_dialects():
+    query = aggregate_query(['nat', 'year_of_birth', 'age_bucket'],
+                            ['count', 'min_date_of_birth', 'avg_age'],
+                            filters={'gender': 'female'}, dialect='postgresql')
+
+    assert 'EXTRACT(year FROM person.date_of_birth)' in str(
+        query.compile(dialect=postgresql.dialect()))
+
+
+def test_repository_aggregate_year_of_birth(session, cohort):
+    rows = SqlAlchemyRepository(session).aggregate(['year_of_birth'], filters={'nat': 'DE'})
+
+    assert [tuple(row) for row in rows] == [(1970, 1), (1975, 1)]
+
+
+def all_pages(fetch, **kwargs):
+    pages = [fetch(**kwargs)]
+    while pages[-1].has_more:
+        pages.append(fetch(cursor=pages[-1].next_cursor, **kwargs))
+
+    return pages
+
+
+def test_repository_page_users(session, twenty_users, assert_max_queries):
+    repo = SqlAlchemyRepository(session)
+
+    with assert_max_queries(3):
+        pages = all_pages(repo.page_users, limit=7)
+
+    assert [len(page.items) for page in pages] == [7, 7, 6]
+    assert [user.id for page in pages for user in page.items] == list(range(1, 21))
+    assert pages[-1].next_cursor is None
+
+
+def test_repository_page_users_stable_under_inserts(session, twenty_users):
+    repo = SqlAlchemyRepository(session)
+    first = repo.page_users(limit=10)
+    repo.add_many([factories.make_user(
+        login_info=factories.make_login_info(uuid='late', username='late'))])
+
+    second = repo.page_users(limit=10, cursor=first.next_cursor)
+    third = repo.page_users(limit=10, cursor=second.next_cursor)
+
+    assert [user.id for user in second.items] == list(range(11, 21))
+    assert [user.id for user in third.items] == [21]
+
+
+def test_repository_page_persons_by_date_of_birth(session):
+    dates = ['1990-01-01', '1980-01-01', '1990-01-01', '1985-06-01', '1990-01-01',
+             '1970-01-01']
+    for number, date_of_birth in enumerate(dates):
+        insert_person(session, 'male', 'mr', f'john{number}', 'doe', date_of_birth)
+    session.execute('INSERT INTO person (gender) VALUES (\'male\')')
+    repo = SqlAlchemyRepository(session)
+
+    pages = all_pages(repo.page_persons_by_date_of_birth, limit=2)
+
+    assert [(str(person.date_of_birth), person.id) for page in pages
+            for person in page.items] == [
+        ('1970-01-01', 6), ('1980-01-01', 2), ('1985-06-01', 4), ('1990-01-01', 1),
+        ('1990-01-01', 3), ('1990-01-01', 5)
+    ]
+    assert [person.id for person in repo.page_persons_by_date_of_birth(
+        date_1=date(1980, 1, 1), date_2=date(1989, 1, 1)).items] == [2, 4]
+
+
+def test_repository_page_model(session):
+    for name in ('john', 'mike', 'jane', 'adam'):
+        insert_person(session, 'male', 'mr', name, 'doe', '1990-01-01')
+    insert_person(session, 'female', 'ms', 'anna', 'doe', '1990-01-01')
+    repo = SqlAlchemyRepository(session)
+
+    pages = all_pages(repo.page_model, model=Person, limit=3, gender='male')
+
+    assert [[person.first_name for person in page.items] for page in pages] == [
+        ['john', 'mike', 'jane'], ['adam']
+    ]
+
+
+@pytest.mark.parametrize('cursor', ['', 'notbase64!', 'bm90IGpzb24', 'WzFd'])
+def test_repository_page_invalid_cursor(session, cursor):
+    repo = SqlAlchemyRepository(session)
+
+    with pytest.raises(RepositoryException):
+        repo.page_users(cursor=cursor)
+
+
+def test_repository_page_cursor_of_other_ordering(session):
+    insert_person(session, 'male', 'mr', 'john', 'doe', '1990-01-01')
+    insert_person(session, 'male', 'mr', 'mike', 'doe', '1990-01-01')
+    repo = SqlAlchemyRepository(session)
+    cursor = repo.page_model(Person, limit=1).next_cursor
+
+    with pytest.raises(RepositoryException):
+        repo.page_persons_by_date_of_birth(cursor=cursor)
+    with pytest.raises(RepositoryException):
+        repo.page_users(cursor=cursor)
+
+
+@pytest.mark.parametrize('limit', [0, 1001])
+def test_repository_page_size_out_of_range(session, limit):
+    with pytest.raises(RepositoryException):
+        SqlAlchemyRepository(session).page_users(limit=limit)
+
+
+def test_repository_find_users_by_phone(session):
+    numbers = [('+41 (0)44 123 45 67', '079 111 22 33'), ('044-123-45-67', '(0)79 999')]
+    phones, cells = zip(*numbers)
+    first, second = (factories.make_users(1, i, phone=phones.__getitem__,
+                                          cell=cells.__getitem__)[0] for i in range(2))
+    # Dimension cache lets the second user reuse location dimensions of the first
+    repo = SqlAlchemyRepository(session, dimensions=DimensionCache())
+    repo.add_many([first])
+    repo.add(second)
+    session.commit()
+
+    def usernames(number):
+        return [user.login_info.username for user in repo.find_users_by_phone(number)]
+
+    assert usernames('41 44 1234567') == ['user0']
+    assert usernames('0791112233') == ['user0']
+    assert usernames('079-999') == ['user1']
+    assert usernames('0441234567') == ['user1']
+    assert usernames('123') == []
+    assert usernames('--') == []
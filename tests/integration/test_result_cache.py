@@ -0,0 +1,161 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from src.people.domain_models.models import Nat, Person
+from src.people.repository.result_cache import ResultCache, MISSING
+from src.people.service_layer.db_connection import SqlAlchemyDbConnection
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(maxsize=2)
+    cache.put('a', ['nat'], [1])
+    cache.put('b', ['nat'], [2])
+    cache.get('a')
+    cache.put('c', ['nat'], [3])
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == [1]
+    assert len(cache) == 2
+
+
+def test_result_cache_expires_entries():
+    clock = FakeClock()
+    cache = ResultCache(ttl=10, clock=clock)
+    cache.put('a', ['nat'], [1])
+
+    clock.now = 9.9
+    assert cache.get('a') == [1]
+    clock.now = 10
+    assert cache.get('a') is MISSING
+    assert cache.stats() == dict(hits=1, misses=1, hit_rate=0.5, invalidations=0,
+                                 entries=0)
+
+
+def test_result_cache_invalidates_by_table():
+    cache = ResultCache()
+    cache.put('nat', ['nat'], [1])
+    cache.put('person', ['person'], [2])
+    cache.put('both', ['nat', 'person'], [3])
+
+    cache.invalidate(['nat'])
+
+    assert cache.get('nat') is MISSING
+    assert cache.get('both') is MISSING
+    assert cache.get('person') == [2]
+    assert cache.invalidations == 2
+
+
+@pytest.fixture
+def connection(session, in_memory_db):
+    return SqlAlchemyDbConnection(sessionmaker(bind=in_memory_db),
+                                  result_cache=ResultCache())
+
+
+def nat_counts(conn):
+    return [(nat.name, count) for nat, count in conn.database.group_by_and_count(Nat, Nat.name)]
+
+
+def test_cached_models_are_attached_to_later_units_of_work(session, connection,
+                                                           assert_max_queries):
+    session.execute("INSERT INTO nat (name) VALUES ('CH'), ('DE')")
+    session.commit()
+
+    with connection as conn:
+        assert nat_counts(conn) == [('CH', 1), ('DE', 1)]
+
+    with connection as conn:
+        with assert_max_queries(0):
+            [(nat, _), _] = conn.database.group_by_and_count(Nat, Nat.name)
+            assert nat.name == 'CH'
+        assert nat in conn.session
+
+    assert connection.result_cache.stats()['hit_rate'] == 0.5
+
+
+def test_cached_models_are_clean_and_can_be_changed(session, connection):
+    session.execute("INSERT INTO nat (name) VALUES ('CH')")
+    session.commit()
+
+    with connection as conn:
+        nat_counts(conn)
+
+    with connection as conn:
+        [(nat, _)] = conn.database.group_by_and_count(Nat, Nat.name)
+        assert not conn.session.dirty
+        nat.name = 'DE'
+
+    with connection as conn:
+        assert nat_counts(conn) == [('DE', 1)]
+
+
+def test_commit_invalidates_written_tables(session, connection, user_factory_fixture,
+                                           person_factory_fixture):
+    session.execute("INSERT INTO nat (name) VALUES ('DE')")
+    session.commit()
+    first, last = date(1900, 1, 1), date(2100, 1, 1)
+
+    with connection as conn:
+        nat_counts(conn)
+        assert conn.database.filter_person_by_date_of_birth(first, last) == []
+
+    with connection as conn:
+        conn.database.add(user_factory_fixture(person=person_factory_fixture()))
+
+    with connection as conn:
+        assert nat_counts(conn) == [('CH', 1), ('DE', 1)]
+        assert len(conn.database.filter_person_by_date_of_birth(first, last)) == 1
+
+    assert connection.result_cache.hits == 0
+    assert connection.result_cache.invalidations == 2
+
+
+def test_raw_writes_invalidate_on_commit(session, connection):
+    with connection as conn:
+        assert nat_counts(conn) == []
+
+    with connection as conn:
+        conn.session.execute("INSERT INTO nat (name) VALUES ('CH')")
+
+    with connection as conn:
+        assert nat_counts(conn) == [('CH', 1)]
+
+
+def test_unit_of_work_reads_its_own_writes(session, connection):
+    with connection as conn:
+        assert conn.database.aggregate([], ['count'])[0].count == 0
+
+    with pytest.raises(ValueError):
+        with connection as conn:
+            conn.session.execute('INSERT INTO person (gender) VALUES (\'male\')')
+            conn.session.execute('INSERT INTO login_info (username) VALUES (\'user\')')
+            conn.session.execute('INSERT INTO contact_info (email) VALUES (\'mail\')')
+            conn.session.execute('INSERT INTO user (person_id, login_info_id, '
+                                 'contact_info_id) VALUES (1, 1, 1)')
+            assert conn.database.aggregate([], ['count'])[0].count == 1
+            raise ValueError()
+
+    with connection as conn:
+        assert conn.database.aggregate([], ['count'])[0].count == 0
+
+    assert connection.result_cache.hits == 1
+
+
+def test_pending_models_bypass_cache(session, connection, person_factory_fixture):
+    with connection as conn:
+        assert conn.database.filter_model_by(Person, gender='male') == []
+
+    with connection as conn:
+        conn.session.add(person_factory_fixture())
+        assert len(conn.database.filter_model_by(Person, gender='male')) == 1
+        conn.rollback()
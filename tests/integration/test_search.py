@@ -0,0 +1,192 @@
+import pytest
+from sqlalchemy import create_engine
+
+from src.people.domain_models.models import Person, LoginInfo
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.migrations import upgrade_schema
+from src.people.repository.orm import metadata
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository import search
+from src.people.repository.search import SEARCH_TABLE, SEARCH_TABLES, \
+    create_search_index, drop_search_index, existing_search_tables, prefix_query, \
+    rebuild_search_index, supported_search_tables
+
+PEOPLE = [
+    ('john', 'smith', 'jsmith', 'john.smith@example.com', 'Zürich'),
+    ('johanna', 'schmidt', 'hanna', 'johanna@example.org', 'Basel'),
+    ('mike', 'johnson', 'mikej', 'mike@example.com', 'Bern'),
+    ('anna', 'müller', 'anna_m', 'anna.mueller@example.ch', 'Genève'),
+]
+
+
+def add_people(add_users):
+    first_names, second_names, names, emails, cities = zip(*PEOPLE)
+    add_users(len(PEOPLE), first_name=first_names.__getitem__,
+              second_name=second_names.__getitem__, username=names.__getitem__,
+              uuid=names.__getitem__, email=emails.__getitem__, city=cities.__getitem__)
+
+
+@pytest.fixture(params=['fts5', 'scan'])
+def search_tables(request, session, monkeypatch):
+    """ Search table, or scans of SQLite builds without FTS5 """
+
+    if request.param == 'scan':
+        drop_search_index(session.connection())
+        monkeypatch.setattr(search, 'supported_search_tables', lambda connection: [])
+        create_search_index(session.connection())
+
+    return request.param
+
+
+@pytest.fixture
+def people(add_users):
+    add_people(add_users)
+
+
+def usernames(users):
+    return [user.login_info.username for user in users]
+
+
+@pytest.mark.parametrize('text, fields, expected', [
+    ('john', None, ['jsmith', 'mikej']),
+    ('jo', None, ['jsmith', 'hanna', 'mikej']),
+    ('jo sm', None, ['jsmith']),
+    ('JOHN', ['first_name'], ['jsmith']),
+    ('zurich', None, ['jsmith']),
+    ('muller', None, ['anna_m']),
+    ('example.ch', ['email'], ['anna_m']),
+    ('hanna', ['username', 'city'], ['hanna']),
+    ('nobody', None, []),
+    ('mith', None, []),
+    ('ample', ['email'], []),
+    ('  ,  ', None, []),
+])
+def test_search_users(session, search_tables, people, text, fields, expected):
+    users = SqlAlchemyRepository(session).search_users(text, fields)
+
+    assert sorted(usernames(users)) == sorted(expected)
+
+
+def test_search_users_limit(session, search_tables, people):
+    users = SqlAlchemyRepository(session).search_users('jo', limit=2)
+
+    assert usernames(users) == ['jsmith', 'hanna']
+
+
+def test_search_looks_search_tables_up_once(session, people, assert_max_queries):
+    search.prefix_search(session, 'jo')
+
+    with assert_max_queries(2) as statements:
+        search.prefix_search(session, 'jo')
+        search.fuzzy_search(session, 'jhon')
+
+    assert not [statement for statement in statements if 'sqlite_master' in statement]
+
+
+def test_search_users_invalid_fields(session, people):
+    with pytest.raises(RepositoryException):
+        SqlAlchemyRepository(session).search_users('john', ['password'])
+
+
+def test_prefix_query_quotes_words():
+    assert prefix_query('o"neil AND') == '"o"* "neil"* "AND"*'
+    assert prefix_query('jo', ['first_name', 'city']) == '{first_name city} : ("jo"*)'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('jhon smtih', ['jsmith']),
+    ('shmidt', ['hanna']),
+    ('mueler', ['anna_m']),
+    ('xyzzy', []),
+    ('jo', []),
+])
+def test_fuzzy_search_users(session, people, text, expected):
+    users = SqlAlchemyRepository(session).fuzzy_search_users(text)
+
+    assert usernames(users)[:len(expected) or None] == expected
+
+
+def test_search_follows_updates_and_deletes(session, people):
+    repo = SqlAlchemyRepository(session)
+    [user] = repo.search_users('mike')
+
+    user.person.first_name = 'michael'
+    session.query(LoginInfo).filter_by(username='hanna').update({'username': 'jo_hanna'})
+    session.commit()
+
+    assert usernames(repo.search_users('michael')) == ['mikej']
+    assert repo.search_users('mike', ['first_name']) == []
+    assert usernames(repo.search_users('jo_hanna', ['username'])) == ['jo_hanna']
+
+    session.delete(user)
+    session.commit()
+
+    assert repo.search_users('michael') == []
+
+
+def test_search_follows_user_moving_to_other_person(session, people):
+    repo = SqlAlchemyRepository(session)
+    [user] = repo.search_users('anna', ['first_name'])
+    person = session.query(Person).filter_by(first_name='mike').one()
+
+    session.execute('UPDATE "user" SET person_id = :person_id WHERE id = :id',
+                    dict(person_id=person.id, id=user.id))
+    session.commit()
+
+    assert sorted(usernames(repo.search_users('mike', ['first_name']))) == ['anna_m',
+                                                                           'mikej']
+
+
+def test_upgrade_schema_fills_search_index(session, people):
+    connection = session.connection()
+    drop_search_index(connection)
+    session.commit()
+
+    created = upgrade_schema(session.get_bind())
+
+    assert sorted(created) == sorted(SEARCH_TABLES)
+    assert usernames(SqlAlchemyRepository(session).search_users('zur')) == ['jsmith']
+
+
+def test_rebuild_search_index(session, people):
+    session.execute('DELETE FROM user_search')
+    repo = SqlAlchemyRepository(session)
+    assert repo.search_users('john') == []
+
+    rebuild_search_index(session.connection())
+
+    assert sorted(usernames(repo.search_users('john'))) == ['jsmith', 'mikej']
+
+
+def test_drop_all_drops_search_index():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    metadata.drop_all(engine)
+
+    assert engine.execute("SELECT name FROM sqlite_master").fetchall() == []
+
+
+def test_supported_search_tables(in_memory_db):
+    with in_memory_db.connect() as connection:
+        assert supported_search_tables(connection) == list(SEARCH_TABLES)
+        assert 'search_probe' not in {name for name, in connection.execute(
+            "SELECT name FROM sqlite_temp_master")}
+
+
+@pytest.mark.parametrize('supported', [[], [SEARCH_TABLE]])
+def test_search_without_supported_search_tables(session, add_users, monkeypatch, supported):
+    """ SQLite without FTS5, or older than 3.34 without the trigram tokenizer """
+
+    connection = session.connection()
+    drop_search_index(connection)
+    monkeypatch.setattr(search, 'supported_search_tables', lambda connection: supported)
+    assert create_search_index(connection) == supported
+    add_people(add_users)
+    repo = SqlAlchemyRepository(session)
+
+    assert existing_search_tables(session) == supported
+    assert sorted(usernames(repo.search_users('jo'))) == ['hanna', 'jsmith', 'mikej']
+    assert usernames(repo.search_users('jo sm')) == ['jsmith']
+    assert usernames(repo.search_users('example.ch', ['email'])) == ['anna_m']
+    assert usernames(repo.search_users('100%')) == []
+    assert usernames(repo.fuzzy_search_users('shmidt'))[:1] == ['hanna']
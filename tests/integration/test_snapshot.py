@@ -0,0 +1,124 @@
+import os
+from datetime import date
+
+import pytest
+
+from src.people.domain_models.models import Person
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository.snapshot import Snapshot, refresh_snapshot
+from tests import factories
+
+
+@pytest.fixture
+def add_users(session):
+    added = []
+
+    def _add_users(count: int):
+        users = factories.make_users(
+            count, len(added), gender=lambda i: 'male' if i % 3 else 'female',
+            first_name=lambda i: f'john{i}', date_of_birth=lambda i: date(1990 + i, 1, 1),
+            username=lambda i: f'usér{i}', latitude=float,
+            nat=lambda i: 'CH' if i % 2 else 'DE')
+        SqlAlchemyRepository(session).add_many(users)
+        session.commit()
+        added.extend(users)
+
+    return _add_users
+
+
+def test_snapshot_columns(session, add_users, tmp_path):
+    add_users(5)
+
+    assert refresh_snapshot(session, str(tmp_path), chunk_size=2) == 5
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert len(snapshot) == 5
+        assert snapshot.last_user_id == 5
+        assert list(snapshot.column('user_id')) == [1, 2, 3, 4, 5]
+        assert list(snapshot.values('first_name')) == [f'john{i}' for i in range(5)]
+        assert list(snapshot.values('username')) == [f'usér{i}' for i in range(5)]
+        assert list(snapshot.values('date_of_birth')) == [date(1990 + i, 1, 1)
+                                                          for i in range(5)]
+        assert list(snapshot.values('latitude')) == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert list(snapshot.values('nat')) == ['DE', 'CH', 'DE', 'CH', 'DE']
+        assert set(snapshot.values('password_strength')) == {6}
+
+
+def test_snapshot_matches_repository_aggregations(session, add_users, tmp_path):
+    add_users(7)
+    refresh_snapshot(session, str(tmp_path))
+    repo = SqlAlchemyRepository(session)
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert snapshot.count_by('gender') == [
+            (person.gender, count)
+            for person, count in repo.group_by_and_count(Person, Person.gender)
+        ]
+        assert snapshot.count_by('nat', limit=1) == [('DE', 4)]
+        assert snapshot.filter_by_date('date_of_birth', date(1991, 1, 1),
+                                       date(1993, 6, 1)) == [2, 3, 4]
+
+
+def test_snapshot_count_by_decodes_values(session, add_users, tmp_path):
+    add_users(4)
+    refresh_snapshot(session, str(tmp_path))
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert snapshot.count_by('date_of_birth', descending=False) == [
+            (date(1990 + i, 1, 1), 1) for i in range(4)]
+        assert snapshot.count_by('password_strength') == [(6, 4)]
+        assert snapshot.count_by('first_name', limit=2) == [('john0', 1), ('john1', 1)]
+        assert snapshot.filter_by_date('date_of_birth', date(2000, 1, 1),
+                                       date(2001, 1, 1)) == []
+
+
+def test_snapshot_incremental_refresh(session, add_users, tmp_path):
+    add_users(3)
+    refresh_snapshot(session, str(tmp_path))
+    add_users(2)
+
+    assert refresh_snapshot(session, str(tmp_path)) == 2
+    assert refresh_snapshot(session, str(tmp_path)) == 0
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert list(snapshot.column('user_id')) == [1, 2, 3, 4, 5]
+        assert list(snapshot.values('first_name')) == [f'john{i}' for i in range(5)]
+        assert snapshot.count_by('nat') == [('DE', 3), ('CH', 2)]
+
+
+def test_snapshot_refresh_drops_data_of_interrupted_refresh(session, add_users, tmp_path):
+    add_users(2)
+    refresh_snapshot(session, str(tmp_path))
+    with open(os.path.join(str(tmp_path), 'user_id.col'), 'ab') as file:
+        file.write(b'garbage!')
+    add_users(1)
+
+    refresh_snapshot(session, str(tmp_path))
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert list(snapshot.column('user_id')) == [1, 2, 3]
+
+
+def test_snapshot_of_empty_database(session, tmp_path):
+    refresh_snapshot(session, str(tmp_path))
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        assert len(snapshot) == 0
+        assert snapshot.count_by('gender') == []
+        assert list(snapshot.values('email')) == []
+
+
+def test_snapshot_invalid_column(session, tmp_path):
+    refresh_snapshot(session, str(tmp_path))
+
+    with Snapshot(str(tmp_path)) as snapshot:
+        with pytest.raises(RepositoryException):
+            snapshot.count_by('idontexist')
+        with pytest.raises(RepositoryException):
+            snapshot.filter_by_date('gender', date(1990, 1, 1), date(2000, 1, 1))
+
+
+def test_snapshot_missing(tmp_path):
+    with pytest.raises(RepositoryException):
+        Snapshot(str(tmp_path))
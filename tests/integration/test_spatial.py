@@ -0,0 +1,203 @@
+import random
+
+import pytest
+
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.migrations import upgrade_schema
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository import spatial
+from src.people.repository.spatial import SPATIAL_TABLES, create_spatial_index, \
+    drop_spatial_index, haversine, rebuild_spatial_index, spatial_index_exists, \
+    spatial_index_supported, within_radius
+
+PLACES = [
+    ('zurich', 47.3769, 8.5417),
+    ('basel', 47.5596, 7.5886),
+    ('bern', 46.9480, 7.4474),
+    ('geneva', 46.2044, 6.1432),
+    ('fiji_west', -16.5, 179.9),
+    ('fiji_east', -16.5, -179.9),
+    ('pole', 89.9, 0.0),
+    ('pole_opposite', 89.9, 180.0),
+]
+
+
+def add_places(add_users, places):
+    """ User of every place, living in a city of the place name """
+
+    names, latitudes, longitudes = zip(*places)
+    add_users(len(places), username=names.__getitem__, uuid=names.__getitem__,
+              city=names.__getitem__, latitude=latitudes.__getitem__,
+              longitude=longitudes.__getitem__)
+
+
+@pytest.fixture
+def places(add_users):
+    add_places(add_users, PLACES)
+
+
+def usernames(users):
+    return [user.login_info.username for user in users]
+
+
+@pytest.mark.parametrize('latitude, longitude, radius_km, expected', [
+    (47.3769, 8.5417, 80, ['zurich', 'basel']),
+    (47.3769, 8.5417, 100, ['zurich', 'basel', 'bern']),
+    (47.3769, 8.5417, 0, ['zurich']),
+    (-16.5, 179.95, 30, ['fiji_west', 'fiji_east']),
+    (90, 0, 50, ['pole', 'pole_opposite']),
+    (0, 0, 100, []),
+])
+def test_users_within_radius(session, places, latitude, longitude, radius_km, expected):
+    found = SqlAlchemyRepository(session).users_within_radius(latitude, longitude, radius_km)
+
+    assert usernames(user for user, _ in found) == expected
+    distances = [distance for _, distance in found]
+    assert distances == sorted(distances)
+    assert all(distance <= radius_km for distance in distances)
+
+
+def test_users_within_radius_distances(session, places):
+    [(user, distance)] = SqlAlchemyRepository(session).users_within_radius(
+        47.5596, 7.5886, 1)
+
+    assert (user.location.city, distance) == ('basel', 0)
+
+
+@pytest.mark.parametrize('box, expected', [
+    ((45.8, 5.9, 47.8, 10.5), ['zurich', 'basel', 'bern', 'geneva']),
+    ((47, 7, 48, 8), ['basel']),
+    ((-17, 179, -16, -179), ['fiji_west', 'fiji_east']),
+    ((-17, 179.95, -16, 180), []),
+])
+def test_users_within_box(session, places, box, expected):
+    users = SqlAlchemyRepository(session).users_within_box(*box)
+
+    assert usernames(users) == expected
+
+
+@pytest.mark.parametrize('count, expected', [
+    (1, ['zurich']),
+    (3, ['zurich', 'basel', 'bern']),
+    (100, ['zurich', 'basel', 'bern', 'geneva', 'pole', 'pole_opposite', 'fiji_west',
+           'fiji_east']),
+])
+def test_nearest_users(session, places, count, expected):
+    found = SqlAlchemyRepository(session).nearest_users(47.3769, 8.5417, count)
+
+    assert usernames(user for user, _ in found) == expected
+
+
+def test_within_radius_matches_haversine_scan(session, add_users):
+    rnd = random.Random(0)
+    points = [(f'user{i}', round(rnd.uniform(-90, 90), 4), round(rnd.uniform(-180, 180), 4))
+              for i in range(300)]
+    add_places(add_users, points)
+    ids = {username: user_id for user_id, username in session.execute(
+        'SELECT u.id, l.username FROM user AS u JOIN login_info AS l '
+        'ON l.id = u.login_info_id')}
+
+    for _ in range(50):
+        latitude, longitude = rnd.uniform(-90, 90), rnd.uniform(-180, 180)
+        radius_km = rnd.choice([100, 1000, 5000])
+        expected = sorted(
+            (haversine(latitude, longitude, point_latitude, point_longitude), ids[username])
+            for username, point_latitude, point_longitude in points
+            if haversine(latitude, longitude, point_latitude, point_longitude) <= radius_km)
+
+        assert within_radius(session, latitude, longitude, radius_km) == [
+            (user_id, distance) for distance, user_id in expected]
+
+
+@pytest.mark.parametrize('call', [
+    lambda repo: repo.users_within_radius(91, 0, 10),
+    lambda repo: repo.users_within_radius(0, 181, 10),
+    lambda repo: repo.users_within_radius(0, 0, -1),
+    lambda repo: repo.users_within_box(10, 0, 0, 10),
+    lambda repo: repo.nearest_users(0, 0, 0),
+])
+def test_spatial_queries_invalid_arguments(session, call):
+    with pytest.raises(RepositoryException):
+        call(SqlAlchemyRepository(session))
+
+
+def test_spatial_queries_look_spatial_table_up_once(session, places, assert_max_queries):
+    repo = SqlAlchemyRepository(session)
+    repo.users_within_box(47, 7, 48, 8)
+
+    with assert_max_queries(10) as statements:
+        repo.users_within_box(47, 7, 48, 8)
+        repo.nearest_users(47.3769, 8.5417, 3)
+
+    assert not [statement for statement in statements if 'sqlite_master' in statement]
+
+
+def test_spatial_index_follows_updates_and_deletes(session, places):
+    repo = SqlAlchemyRepository(session)
+    session.execute("UPDATE coordinates SET latitude = 0, longitude = 0 WHERE id = "
+                    "(SELECT coordinates_id FROM location WHERE city = 'geneva')")
+
+    assert usernames(user for user, _ in repo.users_within_radius(0, 0, 1)) == ['geneva']
+    assert usernames(user for user, _ in repo.users_within_radius(46.2044, 6.1432, 1)) == []
+
+    session.execute('DELETE FROM coordinates WHERE latitude = 0')
+
+    assert repo.users_within_radius(0, 0, 1) == []
+
+
+def test_radius_query_walks_spatial_index(session):
+    plan = ' '.join(row[-1] for row in session.execute(
+        'EXPLAIN QUERY PLAN SELECT u.id FROM coordinates_rtree AS r '
+        'JOIN coordinates AS c ON c.id = r.id '
+        'JOIN location AS loc ON loc.coordinates_id = c.id '
+        'JOIN "user" AS u ON u.location_info_id = loc.id '
+        'WHERE r.min_lat <= 1 AND r.max_lat >= 0 AND r.min_lon <= 1 AND r.max_lon >= 0'))
+
+    assert plan.startswith('SCAN r VIRTUAL TABLE INDEX')
+    assert 'USING COVERING INDEX ix_location_coordinates_id' in plan
+    assert 'USING COVERING INDEX ix_user_location_info_id' in plan
+
+
+def test_upgrade_schema_fills_spatial_index(session, places):
+    drop_spatial_index(session.connection())
+    session.commit()
+
+    created = upgrade_schema(session.get_bind())
+
+    assert created == list(SPATIAL_TABLES)
+    assert usernames(user for user, _ in SqlAlchemyRepository(session).nearest_users(
+        46.2, 6.1, 1)) == ['geneva']
+
+
+def test_rebuild_spatial_index(session, places):
+    session.execute('DELETE FROM coordinates_rtree')
+    repo = SqlAlchemyRepository(session)
+    assert repo.users_within_box(-90, -180, 90, 180) == []
+
+    rebuild_spatial_index(session.connection())
+
+    assert len(repo.users_within_box(-90, -180, 90, 180)) == len(PLACES)
+
+
+def test_spatial_index_supported(in_memory_db):
+    with in_memory_db.connect() as connection:
+        assert spatial_index_supported(connection)
+
+
+def test_spatial_queries_without_supported_spatial_index(session, add_users, monkeypatch):
+    monkeypatch.setattr(spatial, 'spatial_index_supported', lambda connection: False)
+    drop_spatial_index(session.connection())
+    assert create_spatial_index(session.connection()) == []
+    assert not spatial_index_exists(session)
+    add_places(add_users, PLACES)
+    repo = SqlAlchemyRepository(session)
+
+    assert usernames(user for user, _ in repo.users_within_radius(47.3769, 8.5417, 80)) == [
+        'zurich', 'basel']
+    assert usernames(user for user, _ in repo.users_within_radius(-16.5, 179.95, 30)) == [
+        'fiji_west', 'fiji_east']
+    assert usernames(repo.users_within_box(45.8, 5.9, 47.8, 10.5)) == [
+        'zurich', 'basel', 'bern', 'geneva']
+    assert usernames(user for user, _ in repo.nearest_users(46.2, 6.1, 1)) == ['geneva']
+    rebuild_spatial_index(session.connection())
+    assert not spatial_index_exists(session)
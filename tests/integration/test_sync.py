@@ -0,0 +1,157 @@
+import pytest
+from sqlalchemy import event
+
+from src.people.domain_models.models import User
+from src.people.repository.bulk import content_hash, user_to_rows
+from src.people.repository.exceptions import RepositoryException
+from src.people.repository.repository import SqlAlchemyRepository
+from src.people.repository.sync import SyncReport
+from tests import factories
+
+
+def make_user(i: int, **overrides) -> User:
+    [user] = factories.make_users(1, i, **{'first_name': f'john{i}', 'latitude': float(i),
+                                           **overrides})
+    return user
+
+
+@pytest.fixture
+def statements(in_memory_db):
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement.split()[0].upper())
+
+    event.listen(in_memory_db, 'before_cursor_execute', record)
+    yield executed
+    event.remove(in_memory_db, 'before_cursor_execute', record)
+
+
+def rows_of(session, query):
+    return list(session.execute(query))
+
+
+def test_sync_users_inserts_new_users(session):
+    report = SqlAlchemyRepository(session).sync_users([make_user(i) for i in range(3)])
+    session.commit()
+
+    assert report == SyncReport(inserted=3)
+    assert rows_of(session, 'SELECT uuid FROM login_info ORDER BY id') == [
+        ('uuid0',), ('uuid1',), ('uuid2',)]
+
+
+def test_add_many_stores_content_hash(session):
+    user = make_user(0)
+    SqlAlchemyRepository(session).add_many([user])
+
+    assert rows_of(session, 'SELECT content_hash FROM user') == [
+        (content_hash(user_to_rows(user)),)]
+
+
+def test_sync_users_skips_unchanged_users_without_writes(session, statements):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(i) for i in range(3)])
+    session.commit()
+    statements.clear()
+
+    report = repo.sync_users([make_user(i) for i in range(3)])
+
+    assert report == SyncReport(unchanged=3)
+    assert set(statements) == {'SELECT'}
+
+
+def test_sync_users_writes_only_changed_rows(session, statements):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(i) for i in range(3)])
+    session.commit()
+    statements.clear()
+
+    report = repo.sync_users([make_user(0), make_user(1, second_name='smith'),
+                              make_user(3)])
+    session.commit()
+
+    assert report == SyncReport(inserted=1, updated=1, unchanged=1)
+    assert rows_of(session, 'SELECT second_name FROM person ORDER BY id') == [
+        ('doe',), ('smith',), ('doe',), ('doe',)]
+    updates = [statement for statement in statements if statement == 'UPDATE']
+    # Person row and hash of its user
+    assert len(updates) == 2
+    assert rows_of(session, 'SELECT COUNT(*) FROM user') == [(4,)]
+
+
+def test_sync_users_updates_location_and_dimensions(session):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(0)])
+    user = make_user(0, city='basel')
+    user.location.nat = factories.make_nat('DE')
+
+    report = repo.sync_users([user])
+
+    assert report == SyncReport(updated=1)
+    assert rows_of(session, 'SELECT city, nat.name FROM location JOIN nat '
+                            'ON nat.id = location.nat_id') == [('basel', 'DE')]
+    assert rows_of(session, 'SELECT COUNT(*) FROM location') == [(1,)]
+
+
+def test_sync_users_updates_phone_digits(session):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(0)])
+    user = make_user(0, phone='+41 (0)79 555')
+
+    assert repo.sync_users([user]) == SyncReport(updated=1)
+    assert repo.sync_users([user]) == SyncReport(unchanged=1)
+    assert rows_of(session, 'SELECT phone_digits, cell_digits FROM contact_info') == [
+        ('4179555', '000000000')]
+
+
+def test_sync_users_adds_and_removes_optional_rows(session):
+    repo = SqlAlchemyRepository(session)
+    user = make_user(0)
+    user.personal_id = None
+    repo.add_many([user])
+
+    assert repo.sync_users([make_user(0)]) == SyncReport(updated=1)
+    assert rows_of(session, 'SELECT personal_id_id FROM user') == [(1,)]
+
+    user = make_user(0)
+    user.personal_id = None
+    assert repo.sync_users([user]) == SyncReport(updated=1)
+    assert rows_of(session, 'SELECT personal_id_id FROM user') == [(None,)]
+    assert rows_of(session, 'SELECT COUNT(*) FROM personal_id') == [(0,)]
+
+
+def test_sync_users_counts_rehashed_users_as_unchanged(session):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(0)])
+    # Users stored before the hash column was added
+    session.execute('UPDATE user SET content_hash = NULL')
+
+    assert repo.sync_users([make_user(0)]) == SyncReport(unchanged=1)
+    assert repo.sync_users([make_user(0)]) == SyncReport(unchanged=1)
+    assert rows_of(session, 'SELECT content_hash FROM user') != [(None,)]
+
+
+def test_sync_users_keeps_last_of_duplicates(session):
+    report = SqlAlchemyRepository(session).sync_users(
+        [make_user(0), make_user(0, first_name='jack')])
+
+    assert report == SyncReport(inserted=1)
+    assert rows_of(session, 'SELECT first_name FROM person') == [('jack',)]
+
+
+def test_sync_users_keeps_search_index(session):
+    repo = SqlAlchemyRepository(session)
+    repo.add_many([make_user(0)])
+
+    repo.sync_users([make_user(0, first_name='jack')])
+
+    assert [user.person.first_name for user in repo.search_users('jack')] == ['jack']
+    assert repo.search_users('john0') == []
+
+
+def test_sync_users_requires_uuid(session):
+    user = make_user(0)
+    user.login_info.uuid = None
+
+    with pytest.raises(RepositoryException):
+        SqlAlchemyRepository(session).sync_users([user])
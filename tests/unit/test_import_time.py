@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def import_times(module: str):
+    """
+    Import module in fresh interpreter with -X importtime
+    :param module: Module to be imported
+    :return: Imported module name -> cumulative import time in microseconds
+    """
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True,
+                             check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+@pytest.fixture(scope='module')
+def db_connection_import_times():
+    return import_times('src.people.service_layer.db_connection')
+
+
+def test_db_connection_import_does_not_load_sqlalchemy(db_connection_import_times):
+    assert not [name for name in db_connection_import_times
+                if name.startswith('sqlalchemy')]
+
+
+def test_main_import_does_not_load_sqlalchemy():
+    """ Commands forwarded to a warm process should not pay for loading sqlalchemy """
+
+    assert not [name for name in import_times('src.people.main')
+                if name.startswith('sqlalchemy')]
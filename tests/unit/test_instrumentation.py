@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from src.people.service_layer.instrumentation import Histogram, HistogramCollector, \
+    InstrumentedRepository, format_report, main
+
+
+def test_histogram_summary():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.add(value / 1000)
+
+    summary = histogram.summary()
+
+    assert summary['count'] == 100
+    assert summary['mean'] == pytest.approx(0.0505)
+    assert summary['min'] == 0.001
+    assert summary['max'] == 0.1
+    assert 0.05 <= summary['p50'] <= 0.05 * Histogram.BASE
+    assert 0.095 <= summary['p95'] <= 0.1
+
+
+def test_histogram_zero_values():
+    histogram = Histogram()
+    histogram.add(0)
+    histogram.add(0)
+    histogram.add(8)
+
+    assert histogram.percentile(50) == 0
+    assert histogram.percentile(100) == 8
+
+
+class FakeRepository:
+
+    def __init__(self):
+        self.session = 'session'
+
+    def filter_model_by(self, model, **filters):
+        return [1, 2, 3]
+
+    def iter_model_by(self, model, **filters):
+        return iter([1, 2])
+
+
+def test_instrumented_repository_records_calls():
+    collector = HistogramCollector()
+    repository = InstrumentedRepository(FakeRepository(), collector)
+
+    assert repository.filter_model_by('model', gender='male') == [1, 2, 3]
+    assert list(repository.iter_model_by('model')) == [1, 2]
+    assert repository.session == 'session'
+
+    report = collector.report()
+    assert report['repository.filter_model_by.rows']['sum'] == 3
+    assert report['repository.iter_model_by.rows']['sum'] == 2
+    assert report['repository.iter_model_by.seconds']['count'] == 1
+
+
+def test_dumped_report_can_be_printed(tmp_path, capsys):
+    collector = HistogramCollector()
+    collector.record('unit_of_work.seconds', 0.25)
+    path = str(tmp_path / 'metrics.json')
+
+    collector.dump(path)
+    assert main([path]) == 0
+
+    with open(path) as file:
+        assert capsys.readouterr().out.strip() == format_report(json.load(file))
+    assert 'unit_of_work.seconds' in format_report(collector.report())
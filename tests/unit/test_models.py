@@ -1,9 +1,10 @@
-from datetime import date
+from datetime import date, timedelta
 from unittest import mock
 
 import pytest
 
-from src.people.domain_models.models import Person, ContactInfo, LoginInfo
+from src.people.domain_models.models import Person, ContactInfo, LoginInfo, \
+    score_passwords, ages, days_to_birthdays, normalize_phone, normalize_phones
 
 
 class FakeDate(date):
@@ -53,6 +54,34 @@ def test_person_days_to_birthday(date_1, expected_days_to_birthday):
     assert person.days_to_birthday == expected_days_to_birthday
 
 
+@mock.patch('src.people.domain_models.models.datetime.date', FakeDate)
+@pytest.mark.parametrize('today, expected_age, expected_days_to_birthday', [
+    (date(2021, 2, 28), 20, 1),
+    (date(2021, 3, 1), 21, 0),
+    (date(2024, 2, 28), 23, 1),
+    (date(2024, 2, 29), 24, 0),
+    (date(2024, 3, 1), 24, 365),
+])
+def test_person_leap_day_birthday(today, expected_age, expected_days_to_birthday):
+    FakeDate.today = classmethod(lambda cls: today)
+    person = FakePerson(date_of_birth=date(2000, 2, 29))
+
+    assert person.age == expected_age
+    assert person.days_to_birthday == expected_days_to_birthday
+
+
+@mock.patch('src.people.domain_models.models.datetime.date', FakeDate)
+def test_cohort_ages_and_days_to_birthdays_match_person():
+    today = date(2021, 7, 31)
+    FakeDate.today = classmethod(lambda cls: today)
+    dates = [date(1996, 1, 1) + timedelta(days=i) for i in range(0, 2000, 3)]
+    persons = [FakePerson(date_of_birth=date_1) for date_1 in dates]
+
+    assert list(ages(dates, today)) == [person.age for person in persons]
+    assert list(days_to_birthdays([date_1.toordinal() for date_1 in dates], today)) == [
+        person.days_to_birthday for person in persons]
+
+
 @pytest.mark.parametrize('password, points', [
     ('supertajne', 6),  # Lower-case and 8+ chars
     ('Ab1337', 4),  # Upper-case, lower-case and number
@@ -66,7 +95,36 @@ def test_login_info_password_strength(password, points):
     assert user.password_strength == points
 
 
+def test_score_passwords():
+    passwords = ['supertajne', 'Ab1337', 'Ab133785', 'Ab133785%', '', 'Ab1337']
+
+    scores = score_passwords(passwords)
+
+    assert list(scores) == [6, 4, 9, 12, 0, 4]
+
+
 def test_contact_info_remove_dashes_from_phone_number():
     contact_info = FakeContactInfo('012-324-548')
 
     assert contact_info.phone == '012324548'
+
+
+@pytest.mark.parametrize('number, digits', [
+    ('012-324-548', '012324548'),
+    ('(0)123 456', '0123456'),
+    ('+41 (0)44 123 45 67', '41441234567'),
+    ('+1 (555) 010-9999', '15550109999'),
+    ('02.62.35.18.98', '0262351898'),
+    ('', ''),
+    (None, None),
+])
+def test_normalize_phone(number, digits):
+    assert normalize_phone(number) == digits
+
+
+def test_normalize_phones():
+    numbers = ['012-324-548', '+41 (0)44 123 45 67', '', '(0)1 2']
+
+    assert normalize_phones(numbers) == [normalize_phone(number) for number in numbers]
+    assert normalize_phones(['0 1', None, '1\n2']) == ['01', None, '12']
+    assert normalize_phones([]) == []
@@ -0,0 +1,47 @@
+import dataclasses
+
+import pytest
+
+from src.people.domain_models.projections import UserView, NatView
+from tests import factories
+
+
+def test_user_view_from_user():
+    [user] = factories.make_users(1)
+
+    view = UserView.from_user(user)
+
+    assert view.id is None
+    assert view.person.first_name == 'john'
+    assert view.person.age == user.person.age
+    assert view.login_info.password_strength == user.login_info.password_strength
+    assert view.contact_info.cell == user.contact_info.cell
+    assert view.location.timezone.description == 'Newfoundland'
+    assert view.location.nat == NatView('CH')
+
+
+def test_user_view_is_slotted_and_read_only():
+    view = UserView.from_user(factories.make_users(1)[0])
+
+    assert not hasattr(view, '__dict__')
+    assert not hasattr(view.location, '__dict__')
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        view.person.first_name = 'jane'
+
+
+def test_user_views_share_equal_dimensions():
+    shared = {}
+
+    # Built apart, so equal dimensions are distinct objects
+    first, second = (UserView.from_user(factories.make_users(1, i)[0], shared) for i in range(2))
+
+    assert first.location.nat is second.location.nat
+    assert first.location.coordinates is second.location.coordinates
+    assert first.person is not second.person
+
+
+def test_user_view_without_location():
+    [user] = factories.make_users(1)
+    user.location = None
+
+    assert UserView.from_user(user).location is None